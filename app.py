@@ -1,23 +1,66 @@
 import os
-import math
+import bisect
+import codecs
+import csv
+import gzip
+import hashlib
+import heapq
+import io
+import ipaddress
+import json
+import logging
+import mimetypes
+import re
+import shutil
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, deque
 from datetime import date, datetime
-import random
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from urllib.parse import urlencode, urljoin, urlsplit
 from flask import (
     Flask,
     flash,
+    g,
+    has_request_context,
+    jsonify,
+    make_response,
     render_template,
     redirect,
     request,
+    send_file,
+    send_from_directory,
     session,
+    stream_with_context,
     url_for
 )
 from flask_pymongo import PyMongo
+import click
+from pymongo import (
+    ASCENDING, DESCENDING, TEXT, InsertOne, UpdateOne, monitoring)
+from pymongo.errors import (
+    BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError)
 from functools import wraps
+from bson import json_util
+from bson.errors import BSONError, InvalidId
 from bson.objectid import ObjectId
+from itsdangerous import BadSignature, URLSafeSerializer
 from werkzeug.security import (
     generate_password_hash,
     check_password_hash
 )
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
 if os.path.exists("env.py"):
     import env
 
@@ -28,129 +71,2310 @@ app.config["MONGO_DBNAME"] = os.environ.get("MONGO_DBNAME")
 app.config["MONGO_URI"] = os.environ.get("MONGO_URI")
 app.secret_key = os.environ.get("SECRET_KEY")
 
-mongo = PyMongo(app)
+# Every MongoDB command is timed and counted against the request that
+# ran it (see CommandTimer). The totals are sent in a Server-Timing
+# header when SERVER_TIMING is 'true' (off by default, as it tells
+# anyone how many queries each page runs and how long MongoDB takes) and
+# logged as a JSON line per request. Requests running more than
+# DB_QUERY_BUDGET commands or spending more than DB_TIME_BUDGET_MS in
+# MongoDB are logged as warnings.
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "false").lower() == "true"
+DB_QUERY_BUDGET = int(os.environ.get("DB_QUERY_BUDGET", 10))
+DB_TIME_BUDGET_MS = float(os.environ.get("DB_TIME_BUDGET_MS", 100))
+request_log = app.logger.getChild("requests")
+request_log.setLevel(logging.INFO)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Records each MongoDB command run whilst handling a request on
+    'flask.g', with its collection, duration and documents returned.
+    Commands run outside a request, such as by the flask CLI, are not
+    recorded."""
+
+    def started(self, event):
+        if has_request_context() and "db_commands" in g:
+            collection = event.command.get(event.command_name)
+            if not isinstance(collection, str):
+                collection = event.command.get("collection", "")
+            g.db_pending[event.request_id] = collection
+
+    def succeeded(self, event):
+        reply = event.reply
+        if "cursor" in reply:
+            cursor = reply["cursor"]
+            documents = len(
+                cursor.get("firstBatch", cursor.get("nextBatch", ())))
+        else:
+            documents = reply.get("n", 0)
+        self.record(event, documents)
+
+    def failed(self, event):
+        self.record(event, 0, failed=True)
+
+    def record(self, event, documents, failed=False):
+        if has_request_context() and "db_commands" in g:
+            g.db_commands.append({
+                "command": event.command_name,
+                "collection": g.db_pending.pop(event.request_id, ""),
+                "ms": event.duration_micros / 1000.0,
+                "documents": documents,
+                "failed": failed
+            })
+
+
+# Connection pool settings, each left to the MongoDB driver's default
+# (or the MONGO_URI options) unless set: MONGO_MAX_POOL_SIZE and
+# MONGO_MIN_POOL_SIZE connections per server, MONGO_WAIT_QUEUE_TIMEOUT_MS
+# to wait for a free connection, MONGO_SERVER_SELECTION_TIMEOUT_MS to
+# wait for a server and MONGO_COMPRESSORS, e.g. 'zstd,zlib'. The pool is
+# watched by PoolMonitor, keeping the last POOL_LATENCY_SAMPLES checkout
+# times, and reported on the admin metrics page.
+MONGO_POOL_SETTINGS = (
+    ("MONGO_MAX_POOL_SIZE", "maxPoolSize", int),
+    ("MONGO_MIN_POOL_SIZE", "minPoolSize", int),
+    ("MONGO_WAIT_QUEUE_TIMEOUT_MS", "waitQueueTimeoutMS", int),
+    ("MONGO_SERVER_SELECTION_TIMEOUT_MS", "serverSelectionTimeoutMS", int),
+    ("MONGO_COMPRESSORS", "compressors", str),
+)
+POOL_LATENCY_SAMPLES = int(os.environ.get("POOL_LATENCY_SAMPLES", 1000))
+pool_stats = {
+    "checkouts": 0, "checkout_failures": Counter(), "in_use": 0,
+    "max_in_use": 0, "connections": 0, "created": 0,
+    "closed": Counter(), "pools_cleared": 0,
+    "latencies": deque(maxlen=POOL_LATENCY_SAMPLES)}
+pool_stats_lock = threading.Lock()
+pool_checkouts = threading.local()
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connection checkouts and their wait, connections in use,
+    and connections opened and closed, into pool_stats. Each checkout
+    is timed in the thread asking for the connection."""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with pool_stats_lock:
+            pool_stats["pools_cleared"] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with pool_stats_lock:
+            pool_stats["created"] += 1
+            pool_stats["connections"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with pool_stats_lock:
+            pool_stats["connections"] -= 1
+            pool_stats["closed"][event.reason] += 1
+
+    def connection_check_out_started(self, event):
+        pool_checkouts.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with pool_stats_lock:
+            pool_stats["checkout_failures"][event.reason] += 1
+
+    def connection_checked_out(self, event):
+        started = getattr(pool_checkouts, "started", None)
+        with pool_stats_lock:
+            pool_stats["checkouts"] += 1
+            pool_stats["in_use"] += 1
+            pool_stats["max_in_use"] = max(
+                pool_stats["max_in_use"], pool_stats["in_use"])
+            if started is not None:
+                pool_stats["latencies"].append(
+                    (time.perf_counter() - started) * 1000)
+
+    def connection_checked_in(self, event):
+        with pool_stats_lock:
+            pool_stats["in_use"] -= 1
+
+
+def get_pool_settings():
+    """get_pool_settings: \n
+    * This function reads the connection pool settings set in the
+        environment (see MONGO_POOL_SETTINGS). \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the MongoClient options set. \n
+    """
+    settings = {}
+    for variable, option, convert in MONGO_POOL_SETTINGS:
+        value = os.environ.get(variable)
+        if value:
+            settings[option] = convert(value)
+    return settings
+
+
+mongo = PyMongo(
+    app, event_listeners=[CommandTimer(), PoolMonitor()],
+    **get_pool_settings())
+
+# Number of recipes and products shown in the home page carousels
+INDEX_SAMPLE_SIZE = 6
+
+# Fields read by each view, so MongoDB only sends the fields a page
+# renders. Home page quote and cards.
+INDEX_QUOTE_FIELDS = {"quote": 1, "author": 1}
+INDEX_RECIPE_FIELDS = {"name": 1, "image_url": 1}
+INDEX_PRODUCT_FIELDS = {
+    "name": 1, "category": 1, "image_url": 1, "purchase": 1}
+
+# Recipe cards on the recipes page and the recipe table on the profile
+RECIPE_LIST_FIELDS = {"name": 1, "category": 1, "image_url": 1}
+
+# The recipe page and the edit recipe form
+RECIPE_DETAIL_FIELDS = {
+    "name": 1, "category": 1, "image_url": 1, "prep_time": 1,
+    "cook_time": 1, "created_by": 1, "formatted_ingridients": 1,
+    "formatted_steps": 1, "version": 1}
+RECIPE_FORM_FIELDS = {
+    "name": 1, "category": 1, "description": 1, "image_url": 1,
+    "prep_time": 1, "cook_time": 1, "ingridients": 1, "steps": 1}
+
+# Product cards, the edit product form and the admin product table
+PRODUCT_FIELDS = {
+    "name": 1, "category": 1, "description": 1, "image_url": 1,
+    "purchase": 1}
+ADMIN_PRODUCT_FIELDS = {"name": 1, "category": 1}
+
+# Users for the auth decorators, login and the profile page. The
+# password hash is only read by login.
+USER_LOGIN_FIELDS = {"username": 1, "admin": 1, "password": 1}
+USER_PROFILE_FIELDS = {
+    "username": 1, "first_name": 1, "last_name": 1, "email": 1,
+    "admin": 1}
+
+# Recipes used to store ingridients and steps as one string joined by
+# LEGACY_SEPARATOR. They are now stored as lists, with each ingridient
+# split into a name and quantity on INGREDIENT_SEPARATOR
+# (e.g. "Beef - 500g"), alongside the display ready lists shown on the
+# recipe page. 'flask migrate-recipes' converts and backfills old
+# recipes.
+LEGACY_SEPARATOR = " ~ "
+INGREDIENT_SEPARATOR = " - "
+LEGACY_RECIPE_QUERY = {"$or": [
+    {"ingridients": {"$not": {"$type": "array"}}},
+    {"steps": {"$not": {"$type": "array"}}},
+    {"formatted_steps": {"$exists": False}}
+]}
+
+# Collections that can be exported and imported as NDJSON or CSV by
+# 'flask export-data', 'flask import-data' and the admin endpoints.
+# Each has the fields written (the CSV columns, in order), those an
+# imported row must have, those lower cased as the forms do and the
+# collection its categories must be in. CSV has no lists, so recipe
+# ingridients and steps are written to it joined by LEGACY_SEPARATOR.
+BULK_COLLECTIONS = {
+    "recipes": {
+        "fields": (
+            "_id", "name", "category", "description", "cook_time",
+            "prep_time", "image_url", "ingridients", "steps", "created",
+            "created_by"),
+        "required": ("name", "category", "ingridients", "steps"),
+        "lower": ("name", "category", "description", "image_url"),
+        "categories": "categories"
+    },
+    "products": {
+        "fields": (
+            "_id", "name", "category", "description", "image_url",
+            "purchase"),
+        "required": ("name", "category"),
+        "lower": ("name", "category", "description"),
+        "categories": "product_categories"
+    },
+    "categories": {
+        "fields": ("_id", "category"),
+        "required": ("category",),
+        "lower": ("category",),
+        "categories": None
+    },
+    "product_categories": {
+        "fields": ("_id", "category"),
+        "required": ("category",),
+        "lower": ("category",),
+        "categories": None
+    }
+}
+BULK_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 1000))
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+IMPORT_MAX_ERRORS = 100
+
+# Indexes the views rely on, created by 'flask ensure-indexes'.
+# Each is (collection name, keys, options).
+INDEXES = [
+    ("recipes", [("name", TEXT)], {}),
+    ("recipes", [("category", ASCENDING), ("_id", DESCENDING)], {}),
+    ("recipes", [("created_by", ASCENDING), ("_id", DESCENDING)], {}),
+    ("products", [("category", ASCENDING), ("_id", DESCENDING)], {}),
+    ("users", [("username", ASCENDING)], {"unique": True}),
+    ("users", [("email", ASCENDING)], {"unique": True}),
+    ("categories", [("category", ASCENDING)], {}),
+    ("product_categories", [("category", ASCENDING)], {}),
+]
+
+# The hot queries made by the views, checked with 'explain' when
+# CHECK_QUERY_PLANS is "true". Each is (label, collection name,
+# filter, sort).
+HOT_QUERIES = [
+    ("recipes by category", "recipes",
+        {"category": "beef"}, [("_id", DESCENDING)]),
+    ("recipes by user", "recipes",
+        {"created_by": "username"}, [("_id", DESCENDING)]),
+    ("recipes search", "recipes",
+        {"$text": {"$search": "brisket"}}, None),
+    ("products by category", "products",
+        {"category": "rubs"}, [("_id", DESCENDING)]),
+    ("user by username", "users", {"username": "username"}, None),
+    ("user by email", "users", {"email": "email"}, None),
+]
+
+# Cached document counts keyed by collection name, holding the total
+# and the count of each category. They are counted in a background
+# thread when the app starts and again after COUNT_CACHE_TTL, as
+# counting every category reads the whole category index; meanwhile
+# the views that add, edit and delete recipes and products keep them
+# up to date, and the TTL corrects any drift from other app processes.
+COUNT_CACHE_TTL = int(os.environ.get("COUNT_CACHE_TTL", 300))
+count_cache = {}
+count_cache_threads = {}
+count_cache_lock = threading.Lock()
+
+# Cached recipe and product category lists keyed by collection name.
+# Each list is stored with the version it was read at; the admin
+# category views bump the version so the next read comes from MongoDB.
+CATEGORY_CACHE_TTL = int(os.environ.get("CATEGORY_CACHE_TTL", 600))
+category_cache = {}
+category_versions = {"categories": 0, "product_categories": 0}
+category_cache_lock = threading.Lock()
+
+# In process inverted indexes of recipes, built in a background thread
+# when the app starts, kept up to date by the views that add, edit and
+# delete recipes, and rebuilt in the background after RECIPE_INDEX_TTL
+# seconds to pick up recipes changed by other app processes. Requests
+# keep using the current indexes until the new ones are swapped in.
+# 'ingridients' maps ingridient words to recipes for the "cook with
+# these ingridients" search and 'names' maps three letter sequences
+# (trigrams) of recipe names to recipes for the fuzzy search used when a
+# search has no exact match. 'suggestions' is a sorted list of (text,
+# type, suggestion) tuples, one for each word a recipe name or
+# ingridient starts with, so the search box can be given suggestions for
+# the letters typed with a binary search.
+RECIPE_INDEX_TTL = int(os.environ.get("RECIPE_INDEX_TTL", 900))
+INGREDIENT_STOP_WORDS = {
+    "and", "or", "of", "the", "for", "with", "to", "taste", "fresh"}
+FUZZY_MIN_SIMILARITY = float(os.environ.get("FUZZY_MIN_SIMILARITY", 0.3))
+SUGGEST_LIMIT = int(os.environ.get("SUGGEST_LIMIT", 10))
+recipe_index = {
+    "ingridients": {}, "names": {}, "positions": {}, "ids": [],
+    "recipes": {}, "suggestions": [], "suggestion_counts": {},
+    "expires": 0}
+recipe_index_lock = threading.Lock()
+recipe_index_build = {
+    "thread": None, "changes": None, "done": threading.Event(),
+    "ready": False}
+
+# Cached search results keyed by the normalized search, holding the
+# ordered ids of up to SEARCH_RESULTS_LIMIT matching recipes and the
+# total; pages past those ids run the search for that page alone. At
+# most SEARCH_CACHE_SIZE searches are kept for
+# SEARCH_CACHE_TTL seconds; the cache is cleared whenever a recipe is
+# added, edited or deleted.
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 300))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 256))
+SEARCH_RESULTS_LIMIT = int(os.environ.get("SEARCH_RESULTS_LIMIT", 900))
+search_cache = OrderedDict()
+search_cache_version = {"version": 0}
+search_cache_lock = threading.Lock()
+
+# Cached logged in users keyed by username, holding at most
+# USER_CACHE_SIZE users for USER_CACHE_TTL seconds. The profile update
+# drops the user so their changes show straight away.
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", 30))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 1000))
+user_cache = OrderedDict()
+user_cache_lock = threading.Lock()
+
+# The pages given ETags are built from the change counters of the
+# collections they show, kept in the 'change_counters' collection so
+# every app process sees the same values, and from a hash of the
+# templates so a deploy does not leave browsers with old pages.
+TEMPLATE_VERSION = hashlib.sha1("".join(
+    app.jinja_loader.get_source(app.jinja_env, name)[0]
+    for name in sorted(app.jinja_loader.list_templates())
+).encode()).hexdigest()
+
+# Cached pages for visitors who are not logged in, keyed by path and
+# query string. PAGE_CACHE_BACKEND is 'memory', 'disk' (pages are kept
+# as files in a directory per process in PAGE_CACHE_DIR) or 'off'. The
+# least recently used pages are dropped once the cache holds
+# PAGE_CACHE_MAX_BYTES. Each page is tagged with what it shows and
+# dropped when that changes (see record_change), or after PAGE_CACHE_TTL
+# seconds to pick up changes made by other app processes.
+PAGE_CACHE_BACKEND = os.environ.get("PAGE_CACHE_BACKEND", "memory")
+PAGE_CACHE_DIR = os.environ.get(
+    "PAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "page-cache"))
+PAGE_CACHE_MAX_BYTES = int(
+    os.environ.get("PAGE_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+PAGE_CACHE_TTL = int(os.environ.get("PAGE_CACHE_TTL", 60))
+PAGE_CACHE_HEADERS = ("Content-Type", "ETag", "Cache-Control", "Vary")
+page_cache = OrderedDict()
+page_cache_tags = {}
+page_cache_stats = {"hits": 0, "misses": 0, "bypasses": 0, "bytes": 0}
+page_cache_dir = {"pid": None, "path": None}
+page_cache_lock = threading.Lock()
+
+# 'flask build-static' writes copies of the stylesheets and scripts to
+# STATIC_BUILD_DIR (inside the static folder) named with a hash of their
+# contents, along with gzip and brotli compressed versions, and a
+# manifest of the original names. The manifest and a hash of it (part
+# of every ETag) are read when the app starts, and url_for('static', ...)
+# then links to the hashed copies, which browsers may cache for
+# STATIC_MAX_AGE seconds without checking.
+STATIC_BUILD_DIR = "dist"
+STATIC_BUILD_EXTENSIONS = (".css", ".js")
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+STATIC_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+static_build = {"manifest": {}, "version": "", "files": set()}
+
+# 'flask build-images' writes smaller copies of the JPEG images in
+# IMAGE_FOLDER to IMAGE_BUILD_DIR (both inside the static folder), each
+# of IMAGE_WIDTHS pixels wide that is narrower than the original, as
+# JPEG and WebP. The widths written for each image are kept in a
+# manifest read when the app starts (a hash of it is part of every
+# ETag), which the templates use to let browsers pick the smallest copy
+# that fills the space (see image_srcset).
+IMAGE_FOLDER = "media/images"
+IMAGE_BUILD_DIR = "media/images/sized"
+IMAGE_WIDTHS = (480, 960, 1440, 1920)
+IMAGE_FORMATS = (("jpg", "JPEG"), ("webp", "WEBP"))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", 80))
+image_build = {"manifest": {}, "version": ""}
+
+# Recipe and product images are remote urls given by users, so the
+# cards show them through the /img/<id>/<width> thumbnail view. Each
+# image is fetched once in the background, at most
+# THUMBNAIL_FETCH_CONCURRENCY at a time, and resized to all of
+# THUMBNAIL_WIDTHS. A request waits up to THUMBNAIL_WAIT seconds for
+# the fetch, and is sent the default image when it takes longer or
+# every fetch is busy. The thumbnails are kept in
+# THUMBNAIL_CACHE_DIR, dropping the least recently used once it holds
+# THUMBNAIL_CACHE_MAX_BYTES. An image that could not be fetched is not
+# tried again for THUMBNAIL_FAILURE_TTL seconds. Images on private
+# networks are refused unless THUMBNAIL_ALLOW_PRIVATE is 'true', such as
+# when testing against a local server.
+THUMBNAIL_WIDTHS = (480, 960)
+THUMBNAIL_CACHE_DIR = os.environ.get(
+    "THUMBNAIL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "thumbnails"))
+THUMBNAIL_CACHE_MAX_BYTES = int(
+    os.environ.get("THUMBNAIL_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+THUMBNAIL_FETCH_CONCURRENCY = int(
+    os.environ.get("THUMBNAIL_FETCH_CONCURRENCY", 4))
+THUMBNAIL_FETCH_TIMEOUT = int(os.environ.get("THUMBNAIL_FETCH_TIMEOUT", 5))
+THUMBNAIL_WAIT = float(os.environ.get("THUMBNAIL_WAIT", 2))
+THUMBNAIL_MAX_SOURCE_BYTES = int(
+    os.environ.get("THUMBNAIL_MAX_SOURCE_BYTES", 10 * 1024 * 1024))
+THUMBNAIL_MAX_REDIRECTS = 3
+THUMBNAIL_FAILURE_TTL = int(os.environ.get("THUMBNAIL_FAILURE_TTL", 300))
+THUMBNAIL_ALLOW_PRIVATE = (
+    os.environ.get("THUMBNAIL_ALLOW_PRIVATE", "false").lower() == "true")
+thumbnail_cache = OrderedDict()
+thumbnail_cache_state = {"bytes": 0, "loaded": False}
+thumbnail_fetches = {}
+thumbnail_failures = {}
+thumbnail_lock = threading.Lock()
+thumbnail_fetch_slots = threading.BoundedSemaphore(
+    THUMBNAIL_FETCH_CONCURRENCY)
+
+# 'flask build-video' uses ffmpeg to write, for each video in
+# VIDEO_FOLDER, a poster of its first frame and copies at each of
+# VIDEO_VARIANTS (height, bitrate) no taller than the original, to
+# VIDEO_BUILD_DIR (inside the static folder). The files are named with a
+# hash of their contents and listed in a manifest read when the app
+# starts (a hash of it is part of every ETag). The home page shows the
+# poster first and loads the copy suited to the screen and connection
+# once the page has loaded (see hero_video).
+VIDEO_FOLDER = "media/video"
+VIDEO_BUILD_DIR = "media/video/built"
+VIDEO_VARIANTS = ((360, "500k"), (720, "1200k"), (1080, "2500k"))
+video_build = {"manifest": {}, "version": "", "files": set()}
+
+
+def login_required(f):
+    """login_required: \n
+    * This function creates a decorator to check if a user is logged in \n
+    * It performs 2 checks, if 'user' is in the session and secondly,
+        if the session user is registered in the database. \n
+    * It performs 2 checks to ensure the user is checked server side
+        and not simply rely on the session. \n
+    * The database user is loaded once per request (see
+        get_session_user) and reused by the view. \n
+    \n
+    \n Returns: \n
+    * If the user is logged in and recognised, it allows the user to
+        access the view \n
+    * If the user is not recognised or logged in, they are redirected
+        to the login page \n
+    \n
+    \n Reference: \n
+    * https://flask.palletsprojects.com/en/1.1.x/patterns/viewdecorators/
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user = get_session_user()
+        if not user:
+            flash("User not recognised!", "error")
+            return redirect(url_for('login'))
+        elif "user" not in session:
+            flash("You must be logged in for this view", "error")
+            return redirect(url_for('login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def is_admin(f):
+    """is_admin: \n
+    * This function creates a decorator to check if a user is logged in and
+        also if the user is a registered admin. \n
+    * It performs a number of checks, if 'user' is in the session,
+        if the session user is registered in the database. If these are true,
+        it moves on to check if the user is an admin and then if admin
+        is in the session variables. \n
+    * It checks server side by accessing the database instead of relying
+        solely on the session variables. The database user is loaded once
+        per request (see get_session_user) and reused by the view. \n
+    \n
+    \n Returns: \n
+    * If the user is logged in, recognised and an admin, it allows
+        the user to access the view they were trying to access. \n
+    * If the user is not recognised or logged in, they are redirected
+        to the home page with a toast appearing. \n
+    * If the user is recognised but they aren't a recognised admin it
+        also redirects them to the home page with a toast. \n
+    \n
+    \n Reference: \n
+    * https://flask.palletsprojects.com/en/1.1.x/patterns/viewdecorators/
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user = get_session_user()
+        if not user:
+            flash("User not recognised!", "error")
+            return redirect(url_for('index'))
+        elif user["admin"].lower() == "false":
+            flash("This page is for admin only!", "error")
+            return redirect(url_for('index'))
+        elif "admin" not in session:
+            flash("This page is for admin only!", "error")
+            return redirect(url_for('index'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def anonymous_required(f):
+    """is_admin: \n
+    * This function creates a decorator to check if the visitor is
+        not logged in. Such as accessing the login view once logged in. \n
+    * It performs the opposite of the logged in function, checking to
+        see if 'User' is in the session variables. \n
+    \n
+    \n Returns: \n
+    * If the user is not logged in it allows them access to the view
+        they were trying to access. \n
+    * If the user is in the session, they are redirected to the home
+        page with a toast appearing. \n
+    \n
+    \n Reference: \n
+    * https://flask.palletsprojects.com/en/1.1.x/patterns/viewdecorators/
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if "user" in session:
+            flash("That page is only for unauthenticated users."
+                  " Please logout if you wish to access this.", "error")
+            return redirect(url_for('index'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def cache_page(*tags):
+    """cache_page: \n
+    * This function creates a decorator to serve a view from the page
+        cache to visitors who are not logged in. \n
+    * Logged in users and pages with flashed messages waiting bypass
+        the cache, as do responses that are not a 200, that change the
+        session or that are not complete (see skip_page_caching). \n
+    * A cached page is answered with a 304 if the browser already has
+        it (see make_etag). \n
+    \n
+    \n Args: \n
+    * tags (str): What the page shows, used to drop it when that
+        changes. They are formatted with the view's arguments, e.g.
+        'recipes:{recipe_id}'. \n
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if (PAGE_CACHE_BACKEND == "off" or "user" in session
+                    or "_flashes" in session):
+                count_page_cache("bypasses")
+                return f(*args, **kwargs)
+
+            key = request.full_path
+            cached = get_cached_page(key)
+            if cached is not None:
+                count_page_cache("hits")
+                response = app.response_class(
+                    cached["body"], headers=cached["headers"])
+                return response.make_conditional(request)
+
+            count_page_cache("misses")
+            response = make_response(f(*args, **kwargs))
+            if (response.status_code == 200 and not session.modified
+                    and "Set-Cookie" not in response.headers
+                    and "skip_page_cache" not in g):
+                page_tags = [tag.format(**kwargs) for tag in tags]
+                set_cached_page(key, response, page_tags)
+            return response
+        return decorated_function
+    return decorator
+
+
+def load_user(username):
+    """load_user: \n
+    * This function returns a user's profile fields (never the password
+        hash) from the user cache, reading MongoDB on a miss or once the
+        cached user has expired. \n
+    * The cache keeps the most recently used users, dropping the least
+        recently used once it holds USER_CACHE_SIZE users. \n
+    \n
+    \n Args: \n
+    * username (str): The username to load. \n
+    \n
+    \n Returns: \n
+    * It returns the user dict or None if the user does not exist. \n
+    """
+    now = time.monotonic()
+
+    with user_cache_lock:
+        cached = user_cache.get(username)
+        if cached and cached["expires"] > now:
+            user_cache.move_to_end(username)
+            return dict(cached["user"])
+
+    user = mongo.db.users.find_one(
+        {"username": username}, USER_PROFILE_FIELDS)
+    if user is None:
+        return None
+
+    with user_cache_lock:
+        user_cache[username] = {
+            "user": user,
+            "expires": now + USER_CACHE_TTL
+        }
+        user_cache.move_to_end(username)
+        while len(user_cache) > USER_CACHE_SIZE:
+            user_cache.popitem(last=False)
+    return dict(user)
+
+
+def invalidate_user(username):
+    """invalidate_user: \n
+    * This function drops a user from the user cache after their
+        details have changed. \n
+    \n
+    \n Args: \n
+    * username (str): The username to drop. \n
+    """
+    with user_cache_lock:
+        user_cache.pop(username, None)
+
+
+def get_session_user():
+    """get_session_user: \n
+    * This function returns the user in the session 'user' variable,
+        loading them at most once per request and keeping them on
+        'flask.g' for the decorators and view to share. \n
+    \n
+    \n Returns: \n
+    * It returns the user dict or None if no user is logged in or
+        the user is not recognised. \n
+    """
+    if "session_user" not in g:
+        username = session.get("user")
+        if username is None:
+            g.session_user = None
+        else:
+            g.session_user = load_user(username.lower())
+    return g.session_user
+
+
+def record_change(collection_name, document_id=None):
+    """record_change: \n
+    * This function is called by the views that add, edit or delete
+        documents. It bumps the collection's change counter so the ETags
+        of the pages showing it change. \n
+    * It drops the cached pages showing the collection, and the page
+        of the document changed if given. \n
+    \n
+    \n Args: \n
+    * collection_name (str): The collection changed. \n
+    * document_id (obj): The id of the document changed. \n
+    """
+    mongo.db.change_counters.update_one(
+        {"_id": collection_name}, {"$inc": {"version": 1}}, upsert=True)
+
+    tags = [collection_name]
+    if document_id is not None:
+        tags.append("{}:{}".format(collection_name, document_id))
+    invalidate_pages(*tags)
+
+
+def make_etag(collection_names, *parts):
+    """make_etag: \n
+    * This function returns the ETag for a page, from the change
+        counters of the collections it shows, anything else it depends
+        on, the templates, the static, image and video builds linked to
+        and the logged in user, as the navigation and buttons differ for
+        each user. \n
+    * A page with flashed messages waiting is not given an ETag, as
+        it must be rendered to show them. \n
+    \n
+    \n Args: \n
+    * collection_names (tuple): The collections shown on the page. \n
+    * parts: Anything else the page depends on, such as the version
+        of the document shown. \n
+    \n
+    \n Returns: \n
+    * It returns the ETag as a string, or None. \n
+    """
+    if "_flashes" in session:
+        return None
+
+    versions = {}
+    if collection_names:
+        counters = mongo.db.change_counters.find(
+            {"_id": {"$in": list(collection_names)}})
+        versions = {
+            counter["_id"]: counter["version"] for counter in counters}
+
+    stamp = [TEMPLATE_VERSION, static_build["version"],
+             image_build["version"], video_build["version"],
+             get_current_year(), session.get("user"), "admin" in session]
+    stamp += [versions.get(name, 0) for name in collection_names]
+    stamp += [str(part) for part in parts]
+    return hashlib.sha1(repr(stamp).encode()).hexdigest()
+
+
+def skip_page_caching():
+    """skip_page_caching: \n
+    * This function is called by a view rendering a page that is not
+        complete, such as one shown before the category counts are
+        ready, so the page cache does not store it. \n
+    \n
+    \n Returns: \n
+    * It returns None, for the view to use as its ETag, so browsers
+        do not keep the page either. \n
+    """
+    g.skip_page_cache = True
+    return None
+
+
+def is_not_modified(etag):
+    """is_not_modified: \n
+    * This function checks if the browser already has the page with an
+        ETag, from the request's 'If-None-Match' header. \n
+    \n
+    \n Args: \n
+    * etag (str): The ETag of the page, or None. \n
+    \n
+    \n Returns: \n
+    * It returns True if the page can be answered with a 304. \n
+    """
+    return etag is not None and etag in request.if_none_match
+
+
+def etag_response(body, etag, status=200):
+    """etag_response: \n
+    * This function creates the response for a page with an ETag,
+        asking the browser to check the page is unchanged before reusing
+        it. As the page differs for each user, it is marked as varying
+        with the session cookie. \n
+    \n
+    \n Args: \n
+    * body (str): The rendered page, or '' for a 304. \n
+    * etag (str): The ETag of the page, or None. \n
+    * status (int): The response status. \n
+    \n
+    \n Returns: \n
+    * It returns the response. \n
+    """
+    response = make_response(body, status)
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Cookie")
+    return response
+
+
+def count_page_cache(outcome):
+    """count_page_cache: \n
+    * This function counts a request served by a cached view as a hit,
+        miss or bypass of the page cache. \n
+    \n
+    \n Args: \n
+    * outcome (str): Either 'hits', 'misses' or 'bypasses'. \n
+    """
+    with page_cache_lock:
+        page_cache_stats[outcome] += 1
+
+
+def get_cached_page(key):
+    """get_cached_page: \n
+    * This function returns a page from the page cache, reading its
+        body from disk if the disk backend is used. \n
+    \n
+    \n Args: \n
+    * key (str): The path and query string of the page. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the page 'body' and 'headers', or None if
+        the page is not cached or has expired. \n
+    """
+    with page_cache_lock:
+        cached = page_cache.get(key)
+        if cached is None:
+            return None
+        if cached["expires"] <= time.monotonic():
+            drop_cached_page(key)
+            return None
+        page_cache.move_to_end(key)
+
+    if "path" not in cached:
+        return cached
+
+    try:
+        with open(cached["path"], "rb") as page_file:
+            body = page_file.read()
+    except OSError:
+        with page_cache_lock:
+            if page_cache.get(key) is cached:
+                drop_cached_page(key)
+        return None
+    return {"body": body, "headers": cached["headers"]}
+
+
+def get_page_cache_dir():
+    """get_page_cache_dir: \n
+    * This function returns this process's directory in PAGE_CACHE_DIR
+        for the disk backend, named from its process id as each process
+        keeps its own index of the pages. Must be called whilst holding
+        page_cache_lock. \n
+    * The first time it is called the directory is emptied, as pages
+        may be left in it by an earlier process with the same id, and
+        the directories of other processes that have not been written
+        to for PAGE_CACHE_TTL are removed, as their pages have all
+        expired. These are left behind when the app restarts. \n
+    \n
+    \n Returns: \n
+    * It returns the directory's path. \n
+    """
+    pid = os.getpid()
+    if page_cache_dir["pid"] == pid:
+        return page_cache_dir["path"]
+
+    path = os.path.join(PAGE_CACHE_DIR, str(pid))
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+    expired = time.time() - PAGE_CACHE_TTL
+    for entry in os.scandir(PAGE_CACHE_DIR):
+        try:
+            if entry.path != path and entry.stat().st_mtime < expired:
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+        except OSError:
+            continue
+
+    page_cache_dir["pid"] = pid
+    page_cache_dir["path"] = path
+    return path
+
+
+def set_cached_page(key, response, tags):
+    """set_cached_page: \n
+    * This function adds a rendered page to the page cache, dropping
+        the least recently used pages until it fits in
+        PAGE_CACHE_MAX_BYTES. \n
+    * With the disk backend the body is written to a file named from a
+        hash of the key, in this process's directory (see
+        get_page_cache_dir), through a temporary file so a page is never
+        read half written. \n
+    \n
+    \n Args: \n
+    * key (str): The path and query string of the page. \n
+    * response (obj): The rendered response. \n
+    * tags (list): What the page shows (see cache_page). \n
+    """
+    body = response.get_data()
+    if len(body) > PAGE_CACHE_MAX_BYTES:
+        return
+
+    cached = {
+        "headers": [
+            (name, value) for name, value in response.headers
+            if name in PAGE_CACHE_HEADERS],
+        "tags": tags,
+        "size": len(body),
+        "expires": time.monotonic() + PAGE_CACHE_TTL
+    }
+
+    if PAGE_CACHE_BACKEND == "disk":
+        name = hashlib.sha1(key.encode()).hexdigest()
+        try:
+            with page_cache_lock:
+                directory = get_page_cache_dir()
+            cached["path"] = os.path.join(directory, name + ".html")
+            temp_path = "{}.{}.tmp".format(cached["path"], os.getpid())
+            with open(temp_path, "wb") as page_file:
+                page_file.write(body)
+            os.replace(temp_path, cached["path"])
+        except OSError as error:
+            app.logger.warning("Unable to cache page %s: %s", key, error)
+            return
+    else:
+        cached["body"] = body
+
+    with page_cache_lock:
+        if key in page_cache:
+            drop_cached_page(key, remove_file=False)
+        page_cache[key] = cached
+        page_cache_stats["bytes"] += cached["size"]
+        for tag in tags:
+            page_cache_tags.setdefault(tag, set()).add(key)
+
+        while page_cache_stats["bytes"] > PAGE_CACHE_MAX_BYTES:
+            drop_cached_page(next(iter(page_cache)))
+
+
+def drop_cached_page(key, remove_file=True):
+    """drop_cached_page: \n
+    * This function removes a page from the page cache, its tags and,
+        for the disk backend, its file. Must be called whilst holding
+        page_cache_lock. \n
+    \n
+    \n Args: \n
+    * key (str): The path and query string of the page. \n
+    * remove_file (bool): False if the file has just been replaced by
+        a newer copy of the page. \n
+    """
+    cached = page_cache.pop(key)
+    page_cache_stats["bytes"] -= cached["size"]
+    for tag in cached["tags"]:
+        keys = page_cache_tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del page_cache_tags[tag]
+
+    if remove_file and "path" in cached:
+        try:
+            os.remove(cached["path"])
+        except OSError:
+            pass
+
+
+def invalidate_pages(*tags):
+    """invalidate_pages: \n
+    * This function drops the cached pages tagged with any of the tags
+        given, after what they show has changed. \n
+    \n
+    \n Args: \n
+    * tags (str): The tags to drop, e.g. 'recipes' or
+        'recipes:<recipe_id>'. \n
+    """
+    with page_cache_lock:
+        for tag in tags:
+            for key in list(page_cache_tags.get(tag, ())):
+                drop_cached_page(key)
+
+
+def get_pool_metrics():
+    """get_pool_metrics: \n
+    * This function returns the connection pool's metrics: the pool
+        settings, checkouts and failed checkouts, the wait for a
+        connection (mean, percentiles and most over the recent
+        checkouts), the connections in use now and at most, how full
+        the pool is (saturation) and the connections opened and
+        closed. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the metrics. \n
+    """
+    with pool_stats_lock:
+        stats = dict(pool_stats)
+        latencies = sorted(stats.pop("latencies"))
+        stats["checkout_failures"] = dict(stats["checkout_failures"])
+        stats["closed"] = dict(stats["closed"])
+
+    # The settings in use, including any given in MONGO_URI
+    max_pool_size = mongo.cx.max_pool_size
+    stats["settings"] = dict(
+        get_pool_settings(), maxPoolSize=max_pool_size,
+        minPoolSize=mongo.cx.min_pool_size,
+        serverSelectionTimeoutMS=mongo.cx.server_selection_timeout * 1000)
+    stats["saturation"] = stats["in_use"] / max_pool_size
+    stats["max_saturation"] = stats["max_in_use"] / max_pool_size
+
+    if latencies:
+        stats["checkout_ms"] = {
+            "mean": sum(latencies) / len(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p95": latencies[int(len(latencies) * 0.95)],
+            "p99": latencies[int(len(latencies) * 0.99)],
+            "max": latencies[-1],
+            "samples": len(latencies)
+        }
+    return stats
+
+
+def get_page_cache_stats():
+    """get_page_cache_stats: \n
+    * This function returns the page cache's counts of hits, misses and
+        bypasses, the number of pages and bytes cached, and the hit
+        ratio of the requests that could be served from the cache. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the stats. \n
+    """
+    with page_cache_lock:
+        stats = dict(page_cache_stats, pages=len(page_cache))
+
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    stats["backend"] = PAGE_CACHE_BACKEND
+    return stats
+
+
+def make_category_counts(collection_name):
+    """make_category_counts: \n
+    * This function counts the documents in each category of a
+        collection with a single '$group' aggregation, sorted on
+        category first so MongoDB can read the category index rather
+        than the documents. \n
+    \n
+    \n Args: \n
+    * collection_name (str): Either 'recipes' or 'products'. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the count of each category. \n
+    """
+    pipeline = [
+        {"$sort": {"category": 1}},
+        {"$group": {"_id": "$category", "count": {"$sum": 1}}}
+    ]
+    return {
+        group["_id"]: group["count"]
+        for group in mongo.db[collection_name].aggregate(pipeline)}
+
+
+def refresh_category_counts(collection_name):
+    """refresh_category_counts: \n
+    * This function is run in a background thread by
+        start_category_count. It counts every category of a collection
+        (see make_category_counts), then caches the counts whilst
+        holding count_cache_lock. If counting fails the cached counts
+        are kept until the next count. \n
+    \n
+    \n Args: \n
+    * collection_name (str): Either 'recipes' or 'products'. \n
+    """
+    try:
+        categories = make_category_counts(collection_name)
+    except PyMongoError as error:
+        app.logger.warning(
+            "Unable to count the %s categories: %s", collection_name, error)
+        categories = None
+
+    with count_cache_lock:
+        if categories is not None:
+            count_cache[collection_name] = {
+                "total": sum(categories.values()),
+                "categories": categories,
+                "expires": time.monotonic() + COUNT_CACHE_TTL
+            }
+        count_cache_threads.pop(collection_name, None)
+
+
+def start_category_count(collection_name):
+    """start_category_count: \n
+    * This function starts counting every category of a collection in
+        a background thread (see refresh_category_counts), unless a
+        count is already running. Must be called whilst holding
+        count_cache_lock. \n
+    \n
+    \n Args: \n
+    * collection_name (str): Either 'recipes' or 'products'. \n
+    """
+    if collection_name not in count_cache_threads:
+        count_cache_threads[collection_name] = threading.Thread(
+            target=refresh_category_counts, args=(collection_name,),
+            name="{}-counts".format(collection_name), daemon=True)
+        count_cache_threads[collection_name].start()
+
+
+def get_category_counts(collection_name, category=None):
+    """get_category_counts: \n
+    * This function returns the total number of documents in a
+        collection and the number in each category, from the count
+        cache. If the counts have expired they are counted again in the
+        background and the cached counts are returned meanwhile. \n
+    * Until the first count has finished only the cheap counts are
+        returned: the estimated total and the count of the category
+        asked for, read with the category index. These are not cached
+        and are marked 'provisional', as the page showing them is
+        missing its other category filters (see skip_page_caching). \n
+    \n
+    \n Args: \n
+    * collection_name (str): Either 'recipes' or 'products'. \n
+    * category (str): The category being viewed, if any. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the 'total', the 'categories' counts and
+        'provisional'. \n
+    """
+    with count_cache_lock:
+        cached = count_cache.get(collection_name)
+        if cached is None or cached["expires"] <= time.monotonic():
+            start_category_count(collection_name)
+        if cached is not None:
+            return {
+                "total": cached["total"],
+                "categories": dict(cached["categories"]),
+                "provisional": False
+            }
+
+    collection = mongo.db[collection_name]
+    categories = {}
+    if category:
+        categories[category] = collection.count_documents(
+            {"category": category})
+    return {
+        "total": collection.estimated_document_count(),
+        "categories": categories,
+        "provisional": True
+    }
+
+
+def adjust_count(collection_name, category, change):
+    """adjust_count: \n
+    * This function updates the cached total and category counts of a
+        collection after a document is added, moved or deleted, so the
+        counts do not have to be read from MongoDB again. \n
+    * If the counts are not cached they are left to be counted on
+        their next use. \n
+    \n
+    \n Args: \n
+    * collection_name (str): Either 'recipes' or 'products'. \n
+    * category (str): The category of the document changed. \n
+    * change (int): 1 when a document is added, -1 when removed. \n
+    """
+    with count_cache_lock:
+        cached = count_cache.get(collection_name)
+        if cached is None:
+            return
+        cached["total"] = max(cached["total"] + change, 0)
+        count = cached["categories"].get(category, 0) + change
+        cached["categories"][category] = max(count, 0)
+
+
+def invalidate_counts(collection_name):
+    """invalidate_counts: \n
+    * This function counts a collection again in the background after
+        many documents are changed at once (see import_documents). The
+        cached counts are used until the new ones are ready. \n
+    \n
+    \n Args: \n
+    * collection_name (str): Either 'recipes' or 'products'. \n
+    """
+    with count_cache_lock:
+        cached = count_cache.get(collection_name)
+        if cached is not None:
+            cached["expires"] = 0
+        start_category_count(collection_name)
+
+
+def get_categories(collection_name):
+    """get_categories: \n
+    * This function returns the sorted list of recipe or product
+        categories from the category cache. \n
+    * If the list is not cached, has expired or was invalidated by an
+        admin view, it is read from MongoDB and cached again. A list
+        read whilst the categories were being changed is not cached. \n
+    \n
+    \n Args: \n
+    * collection_name (str): Either 'categories' or
+        'product_categories'. \n
+    \n
+    \n Returns: \n
+    * It returns a list of the categories sorted by name. \n
+    """
+    now = time.monotonic()
+
+    with category_cache_lock:
+        version = category_versions[collection_name]
+        cached = category_cache.get(collection_name)
+        if (cached and cached["version"] == version
+                and cached["expires"] > now):
+            return list(cached["categories"])
+
+    categories = list(
+        mongo.db[collection_name].find().sort("category", 1))
+
+    with category_cache_lock:
+        if category_versions[collection_name] == version:
+            category_cache[collection_name] = {
+                "categories": categories,
+                "version": version,
+                "expires": now + CATEGORY_CACHE_TTL
+            }
+    return list(categories)
+
+
+def invalidate_categories(collection_name):
+    """invalidate_categories: \n
+    * This function is called by the admin views after a category is
+        added, edited or deleted. It bumps the version of the category
+        list and drops the cached copy. \n
+    \n
+    \n Args: \n
+    * collection_name (str): Either 'categories' or
+        'product_categories'. \n
+    """
+    with category_cache_lock:
+        category_versions[collection_name] += 1
+        category_cache.pop(collection_name, None)
+
+
+def query_fingerprint(query):
+    """query_fingerprint: \n
+    * This function creates a short hash of a MongoDB filter so a
+        pagination cursor can only be used with the filter it was
+        created for. \n
+    \n
+    \n Args: \n
+    * query (dict): The MongoDB filter being paginated. \n
+    \n
+    \n Returns: \n
+    * It returns a string hash of the filter. \n
+    """
+    dumped = json_util.dumps(query, sort_keys=True)
+    return hashlib.sha1(dumped.encode("utf-8")).hexdigest()[:16]
+
+
+def get_cursor_serializer():
+    """get_cursor_serializer: \n
+    * This function returns the serializer used to sign and read the
+        opaque pagination cursors passed in the 'cursor' argument. \n
+    \n
+    \n Returns: \n
+    * It returns a URLSafeSerializer using the app secret key. \n
+    """
+    return URLSafeSerializer(app.secret_key, salt="pagination-cursor")
+
+
+def read_cursor(query):
+    """read_cursor: \n
+    * This function reads the 'cursor' request argument and checks it
+        was created for the filter currently being paginated. \n
+    * If the cursor has been tampered with, is for another filter or
+        is not valid, a toast is shown and the first page is used. \n
+    \n
+    \n Args: \n
+    * query (dict): The MongoDB filter being paginated. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the direction, boundary id and page number
+        or None for the first page. \n
+    """
+    token = request.args.get("cursor")
+    if not token:
+        return None
+
+    try:
+        cursor = get_cursor_serializer().loads(token)
+        if cursor["f"] != query_fingerprint(query):
+            raise BadSignature("Cursor does not match the filter")
+        return {
+            "direction": cursor["d"],
+            "id": ObjectId(cursor["id"]),
+            "page": int(cursor["p"])
+        }
+    except (BadSignature, InvalidId, KeyError, TypeError, ValueError):
+        flash("Page out of range", "error")
+        return None
+
+
+def make_cursor_url(query, direction, boundary_id, page, args):
+    """make_cursor_url: \n
+    * This function creates the query string for the next or previous
+        page, holding a signed cursor of the boundary id, the direction
+        to read in, the page number and a fingerprint of the filter. \n
+    \n
+    \n Args: \n
+    * query (dict): The MongoDB filter being paginated. \n
+    * direction (str): Either 'next' or 'prev'. \n
+    * boundary_id (obj): The id of the last or first item on the page. \n
+    * page (int): The page number the cursor leads to. \n
+    * args (dict): Any other request arguments to keep in the url. \n
+    \n
+    \n Returns: \n
+    * It returns a query string beginning with '?'. \n
+    """
+    token = get_cursor_serializer().dumps({
+        "d": direction,
+        "id": str(boundary_id),
+        "p": page,
+        "f": query_fingerprint(query)
+    })
+    params = {"cursor": token}
+    for key, value in args.items():
+        if value:
+            params[key] = value
+    return "?" + urlencode(params)
+
+
+def paginate(collection, query, limit, args=None, projection=None):
+    """paginate: \n
+    * This function paginates a MongoDB queryset ordered newest first
+        using keyset (cursor) pagination. \n
+    * The cursor holds the id of the last (or first) item of the page
+        it was created on, so each page is read with a single query
+        on '_id' instead of reading the whole queryset to find an
+        offset. \n
+    * It fetches one item more than the limit to know if there is
+        another page without counting the queryset. \n
+    * Previous pages are read in ascending order from the first item
+        of the current page and reversed before being returned. \n
+    \n
+    \n Args: \n
+    * collection (obj): The MongoDB collection to read from. \n
+    * query (dict): The MongoDB filter for the queryset. \n
+    * limit (int): The number of items per page. \n
+    * args (dict): Other request arguments to keep in the page urls,
+        such as 'q' or 'category'. \n
+    * projection (dict): Optional fields to return for each item. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the page 'items', the 'next' and 'prev'
+        query strings (or None) and the 'page' number. \n
+    \n
+    \n Reference: \n
+    * https://docs.mongodb.com/manual/reference/method/cursor.skip/
+    """
+    if args is None:
+        args = {}
+
+    cursor = read_cursor(query)
+
+    if cursor is None:
+        page_query = query
+        sort = -1
+    else:
+        if cursor["direction"] == "prev":
+            id_filter = {"_id": {"$gt": cursor["id"]}}
+            sort = 1
+        else:
+            id_filter = {"_id": {"$lt": cursor["id"]}}
+            sort = -1
+        if query:
+            page_query = {"$and": [query, id_filter]}
+        else:
+            page_query = id_filter
+
+    items = list(collection.find(page_query, projection).sort(
+        "_id", sort).limit(limit + 1))
+    has_more = len(items) > limit
+    items = items[:limit]
+
+    if cursor is None:
+        page = 1
+        has_next = has_more
+        has_prev = False
+    elif cursor["direction"] == "prev":
+        items.reverse()
+        has_next = True
+        has_prev = has_more
+        page = cursor["page"] if has_prev else 1
+    else:
+        has_next = has_more
+        has_prev = True
+        page = cursor["page"]
+
+    if has_next and items:
+        next_url = make_cursor_url(
+            query, "next", items[-1]["_id"], page + 1, args)
+    else:
+        next_url = None
+
+    if has_prev and items:
+        prev_url = make_cursor_url(
+            query, "prev", items[0]["_id"], page - 1, args)
+    else:
+        prev_url = None
+
+    return {
+        "items": items,
+        "next": next_url,
+        "prev": prev_url,
+        "page": page
+    }
+
+
+def ingredient_words(ingridients):
+    """ingredient_words: \n
+    * This function normalizes the names of a list of ingridients into
+        the set of words used by the ingridient index. \n
+    * Words are lower cased, stripped of anything but letters, and
+        plurals are made singular so 'Ribs' and 'rib' match. Short
+        words and INGREDIENT_STOP_WORDS are skipped. \n
+    \n
+    \n Args: \n
+    * ingridients (list): Ingridient dicts, or names as strings. \n
+    \n
+    \n Returns: \n
+    * It returns a set of the normalized words. \n
+    """
+    words = set()
+    for ingredient in ingridients:
+        if isinstance(ingredient, dict):
+            ingredient = ingredient.get("name", "")
+        for word in re.findall(r"[a-z]+", ingredient.lower()):
+            if word.endswith("ies"):
+                word = word[:-3] + "y"
+            elif word.endswith("oes"):
+                word = word[:-2]
+            elif word.endswith("s") and not word.endswith("ss"):
+                word = word[:-1]
+            if len(word) > 2 and word not in INGREDIENT_STOP_WORDS:
+                words.add(word)
+    return words
+
+
+def name_trigrams(name):
+    """name_trigrams: \n
+    * This function splits a recipe name, or a search, into the set of
+        three letter sequences (trigrams) used by the fuzzy name index.
+        Each word is padded with spaces so the start and end of words
+        count for more. \n
+    \n
+    \n Args: \n
+    * name (str): The recipe name or search. \n
+    \n
+    \n Returns: \n
+    * It returns a set of the trigrams. \n
+    """
+    trigrams = set()
+    for word in re.findall(r"[a-z0-9]+", name.lower()):
+        padded = "  " + word + " "
+        for start in range(len(padded) - 2):
+            trigrams.add(padded[start:start + 3])
+    return trigrams
+
+
+def suggestion_key(text):
+    """suggestion_key: \n
+    * This function normalizes a recipe name, ingridient or the letters
+        typed into the search box so they can be compared, lower casing
+        them and keeping only letters, numbers and single spaces. \n
+    \n
+    \n Args: \n
+    * text (str): The text to normalize. \n
+    \n
+    \n Returns: \n
+    * It returns the normalized text. \n
+    """
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def recipe_suggestions(name, ingridients):
+    """recipe_suggestions: \n
+    * This function returns the search box suggestions for a recipe.
+        The name and each ingridient are suggested for the letters
+        typed matching the start of any of their words, so 'bris' finds
+        'Smoked Beef Brisket'. \n
+    \n
+    \n Args: \n
+    * name (str): The recipe name. \n
+    * ingridients (list): The recipe's ingridient dicts. \n
+    \n
+    \n Returns: \n
+    * It returns a set of (text, type, suggestion) tuples, where text is
+        the normalized suggestion from one of its words onwards. \n
+    """
+    suggestions = set()
+    labels = [("recipe", name.strip())]
+    for ingredient in ingridients:
+        labels.append(("ingredient", suggestion_key(ingredient["name"])))
+
+    for kind, label in labels:
+        words = suggestion_key(label).split(" ")
+        for start in range(len(words)):
+            text = " ".join(words[start:])
+            if text:
+                suggestions.add((text, kind, label))
+    return suggestions
+
+
+def make_recipe_index():
+    """make_recipe_index: \n
+    * This function builds a new set of recipe indexes, without holding
+        recipe_index_lock, so searches carry on with the current indexes
+        whilst it runs. \n
+    * Building reads only the name and ingridients of every recipe,
+        oldest first. Each recipe is given an integer position in that
+        order, which the indexes use in place of its '_id' as integers
+        are much quicker to count and compare. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of 'ingridients' (word to a set of positions),
+        'names' (trigram to a set of positions), 'positions' (recipe id
+        to position), 'ids' (position to recipe id), 'recipes' (position
+        to its words, trigrams and suggestions), the sorted
+        'suggestions' and when it 'expires'. \n
+    """
+    index = {
+        "ingridients": {}, "names": {}, "positions": {}, "ids": [],
+        "recipes": {}, "suggestions": [], "suggestion_counts": {}}
+
+    recipes = mongo.db.recipes.find(
+        {}, {"name": 1, "ingridients": 1}).sort("_id", ASCENDING)
+    for recipe in recipes:
+        add_to_recipe_index(index, recipe["_id"], recipe, building=True)
+
+    # Sorting once is much quicker than inserting each suggestion
+    index["suggestions"] = sorted(index["suggestion_counts"])
+    index["expires"] = time.monotonic() + RECIPE_INDEX_TTL
+    return index
+
+
+def refresh_recipe_index():
+    """refresh_recipe_index: \n
+    * This function is run in a background thread by
+        start_recipe_index_build. It builds new recipe indexes (see
+        make_recipe_index), then swaps them in for the current ones
+        whilst holding recipe_index_lock. \n
+    * Recipes changed whilst the indexes were being built are changed
+        in the new indexes before the swap, so no change is lost. If
+        the build fails the current indexes are kept until the next
+        build. \n
+    """
+    try:
+        index = make_recipe_index()
+    except PyMongoError as error:
+        app.logger.warning("Unable to build the recipe index: %s", error)
+        index = None
+
+    with recipe_index_lock:
+        if index is not None:
+            for recipe_id, recipe in recipe_index_build["changes"]:
+                update_recipe_index(index, recipe_id, recipe)
+            recipe_index.update(index)
+            recipe_index_build["ready"] = True
+        recipe_index_build["changes"] = None
+        recipe_index_build["thread"] = None
+        recipe_index_build["done"].set()
+
+
+def start_recipe_index_build():
+    """start_recipe_index_build: \n
+    * This function starts building new recipe indexes in a background
+        thread (see refresh_recipe_index), unless a build is already
+        running. Must be called whilst holding recipe_index_lock. \n
+    \n
+    \n Returns: \n
+    * It returns the Event set once the build has finished. \n
+    """
+    if recipe_index_build["thread"] is None:
+        recipe_index_build["changes"] = []
+        recipe_index_build["done"] = threading.Event()
+        recipe_index_build["thread"] = threading.Thread(
+            target=refresh_recipe_index, name="recipe-index", daemon=True)
+        recipe_index_build["thread"].start()
+    return recipe_index_build["done"]
+
+
+def get_recipe_index():
+    """get_recipe_index: \n
+    * This function returns the recipe indexes. If they have expired a
+        rebuild is started in the background and the current indexes
+        are returned meanwhile, so no request waits for a rebuild.
+        Until the first build has finished they are empty (see
+        wait_for_recipe_index). Must be called whilst holding
+        recipe_index_lock. \n
+    \n
+    \n Returns: \n
+    * It returns the recipe_index dict (see make_recipe_index). \n
+    """
+    if recipe_index["expires"] <= time.monotonic():
+        start_recipe_index_build()
+    return recipe_index
+
+
+def wait_for_recipe_index():
+    """wait_for_recipe_index: \n
+    * This function waits for the first build of the recipe indexes,
+        for the searches that would otherwise find nothing whilst the
+        app starts. It does not hold recipe_index_lock whilst waiting,
+        and returns straight away once the indexes have been built. \n
+    """
+    with recipe_index_lock:
+        if recipe_index_build["ready"]:
+            return
+        done = start_recipe_index_build()
+    done.wait()
+
+
+def add_to_recipe_index(index, recipe_id, recipe, building=False):
+    """add_to_recipe_index: \n
+    * This function adds a recipe's ingridient words, name trigrams and
+        suggestions to a set of recipe indexes. A new recipe is given
+        the next position, so positions stay in '_id' (newest last)
+        order. Must be called whilst holding recipe_index_lock unless
+        the indexes are still being built. \n
+    * Whilst the indexes are being built the suggestions are only
+        counted, to be sorted once at the end. \n
+    \n
+    \n Args: \n
+    * index (dict): The recipe indexes. \n
+    * recipe_id (obj): The id of the recipe. \n
+    * recipe (dict): The recipe's 'name' and 'ingridients'. \n
+    * building (bool): Whether the indexes are being built. \n
+    """
+    position = index["positions"].get(recipe_id)
+    if position is None:
+        position = len(index["ids"])
+        index["ids"].append(recipe_id)
+        index["positions"][recipe_id] = position
+
+    ingridients = get_recipe_lists(recipe)["ingridients"]
+    words = ingredient_words(ingridients)
+    trigrams = name_trigrams(recipe.get("name", ""))
+    suggestions = recipe_suggestions(recipe.get("name", ""), ingridients)
+    index["recipes"][position] = {
+        "ingridients": words,
+        "names": trigrams,
+        "suggestions": suggestions
+    }
+    for word in words:
+        index["ingridients"].setdefault(word, set()).add(position)
+    for trigram in trigrams:
+        index["names"].setdefault(trigram, set()).add(position)
+
+    # Suggestions shared by several recipes are kept until the last goes
+    counts = index["suggestion_counts"]
+    for suggestion in suggestions:
+        counts[suggestion] = counts.get(suggestion, 0) + 1
+        if counts[suggestion] == 1 and not building:
+            bisect.insort(index["suggestions"], suggestion)
+
+
+def update_recipe_index(index, recipe_id, recipe):
+    """update_recipe_index: \n
+    * This function removes a recipe from a set of built recipe indexes
+        and, unless it was deleted, adds it again as it is now. Must be
+        called whilst holding recipe_index_lock. \n
+    \n
+    \n Args: \n
+    * index (dict): The recipe indexes. \n
+    * recipe_id (obj): The id of the recipe changed. \n
+    * recipe (dict): The recipe's 'name' and 'ingridients', or None if
+        the recipe was deleted. \n
+    """
+    position = index["positions"].get(recipe_id)
+    indexed = index["recipes"].pop(position, {})
+
+    counts = index["suggestion_counts"]
+    for suggestion in indexed.pop("suggestions", ()):
+        counts[suggestion] -= 1
+        if not counts[suggestion]:
+            del counts[suggestion]
+            suggestions = index["suggestions"]
+            del suggestions[bisect.bisect_left(suggestions, suggestion)]
+
+    for key, keys in indexed.items():
+        for word in keys:
+            index[key][word].discard(position)
+            if not index[key][word]:
+                del index[key][word]
+
+    if recipe is None:
+        if position is not None:
+            del index["positions"][recipe_id]
+            index["ids"][position] = None
+    else:
+        add_to_recipe_index(index, recipe_id, recipe)
+
+
+def index_recipe(recipe_id, recipe=None):
+    """index_recipe: \n
+    * This function updates the recipe indexes after a recipe is added,
+        edited or deleted. If the indexes have not been built yet they
+        are left to be built on first use. \n
+    * Whilst new indexes are being built the change is also kept, to
+        be made to them before they are swapped in. \n
+    \n
+    \n Args: \n
+    * recipe_id (obj): The id of the recipe changed. \n
+    * recipe (dict): The recipe's 'name' and 'ingridients', or None if
+        the recipe was deleted. \n
+    """
+    with recipe_index_lock:
+        if recipe_index_build["changes"] is not None:
+            recipe_index_build["changes"].append((recipe_id, recipe))
+        if recipe_index_build["ready"]:
+            update_recipe_index(recipe_index, recipe_id, recipe)
+
+
+def invalidate_recipe_index():
+    """invalidate_recipe_index: \n
+    * This function marks the recipe indexes as expired after many
+        recipes are changed at once (see import_documents), so they are
+        built again in the background on their next use rather than
+        updated one recipe at a time. \n
+    """
+    with recipe_index_lock:
+        recipe_index["expires"] = 0
+
+
+def fuzzy_search_names(search_key):
+    """fuzzy_search_names: \n
+    * This function finds recipes with names similar to a search, to
+        allow for typos when the search has no exact match. \n
+    * Names are compared by the trigrams they share with the search
+        (the Dice coefficient); names at least FUZZY_MIN_SIMILARITY
+        alike are ranked most similar first, then newest first. \n
+    \n
+    \n Args: \n
+    * search_key (str): The search from the 'q' request argument. \n
+    \n
+    \n Returns: \n
+    * It returns a list of up to SEARCH_RESULTS_LIMIT recipe ids. \n
+    """
+    trigrams = name_trigrams(search_key)
+    if not trigrams:
+        return []
+
+    wait_for_recipe_index()
+    with recipe_index_lock:
+        index = get_recipe_index()
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(index["names"].get(trigram, ()))
+
+        # A name has at least the trigrams it shares, so names sharing
+        # fewer than 'least' cannot be similar enough and are skipped
+        # without looking them up
+        least = FUZZY_MIN_SIMILARITY * len(trigrams) / (
+            2.0 - FUZZY_MIN_SIMILARITY)
+        similar = []
+        for position, count in shared.items():
+            if count < least:
+                continue
+            name_size = len(index["recipes"][position]["names"])
+            similarity = 2.0 * count / (len(trigrams) + name_size)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                similar.append((similarity, position))
+
+        ranked = heapq.nlargest(SEARCH_RESULTS_LIMIT, similar)
+        return [index["ids"][position] for similarity, position in ranked]
+
+
+def suggest(prefix, limit=SUGGEST_LIMIT):
+    """suggest: \n
+    * This function returns the suggestions for the letters typed into
+        the recipe search box, without querying MongoDB. \n
+    * Matching recipe categories come first, from the category cache,
+        followed by the recipe names and ingridients found by a binary
+        search of the sorted suggestions in the recipe index. The index
+        is never built or rebuilt here (see get_recipe_index), so until
+        it is first built only categories are suggested. \n
+    \n
+    \n Args: \n
+    * prefix (str): The letters typed. \n
+    * limit (int): The most suggestions to return. \n
+    \n
+    \n Returns: \n
+    * It returns a list of up to limit (type, suggestion) tuples. \n
+    """
+    prefix = suggestion_key(prefix)
+    if not prefix:
+        return []
+
+    found = []
+    for category in get_categories("categories"):
+        label = category["category"]
+        key = suggestion_key(label)
+        if ((key.startswith(prefix) or " " + prefix in key)
+                and ("category", label) not in found):
+            found.append(("category", label))
+
+    with recipe_index_lock:
+        suggestions = get_recipe_index()["suggestions"]
+        position = bisect.bisect_left(suggestions, (prefix,))
+        while len(found) < limit and position < len(suggestions):
+            text, kind, label = suggestions[position]
+            if not text.startswith(prefix):
+                break
+            if (kind, label) not in found:
+                found.append((kind, label))
+            position += 1
+    return found[:limit]
+
+
+def rank_ingredient_matches(text, limit):
+    """rank_ingredient_matches: \n
+    * This function ranks the recipes that use any of a comma separated
+        list of ingridients by how many of them each recipe uses and
+        then newest first, from the in process ingridient index (see
+        get_recipe_index), without reading any recipes from MongoDB. \n
+    * The page is read from the 'page' request argument. \n
+    \n
+    \n Args: \n
+    * text (str): The ingridients entered, e.g. 'brisket, paprika'. \n
+    * limit (int): The number of recipes per page. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the 'ranked' list of (recipe id, number of
+        matches) pairs on the page, the 'page' and 'last_page' numbers
+        and the 'total' number of recipes found. \n
+    """
+    words = ingredient_words(text.split(","))
+
+    wait_for_recipe_index()
+    with recipe_index_lock:
+        index = get_recipe_index()
+        matches = Counter()
+        for word in words:
+            matches.update(index["ingridients"].get(word, ()))
+
+        total = len(matches)
+        page, last_page = get_page_number(total, limit)
+
+        # Ranks by the number of matches, then by position (newest
+        # first) by combining both into one integer
+        scale = len(index["ids"])
+        ranked = heapq.nlargest(
+            page * limit,
+            (count * scale + position for position, count in matches.items()))
+        ranked = [
+            (index["ids"][score % scale], score // scale)
+            for score in ranked[(page - 1) * limit:]]
+
+    return {
+        "ranked": ranked,
+        "page": page,
+        "last_page": last_page,
+        "total": total
+    }
+
+
+def rank_recipes_by_ingredients(text, limit):
+    """rank_recipes_by_ingredients: \n
+    * This function finds the recipes that use any of a comma separated
+        list of ingridients, ranked by how many of them each recipe
+        uses and then newest first. \n
+    * Recipes are ranked from the in process ingridient index (see
+        rank_ingredient_matches), so MongoDB is only asked for the
+        recipes on the current page. \n
+    \n
+    \n Args: \n
+    * text (str): The ingridients entered, e.g. 'brisket, paprika'. \n
+    * limit (int): The number of recipes per page. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the page 'items' (each with 'matches', the
+        number of the ingridients it uses), the 'next' and 'prev' query
+        strings (or None), the 'page' number and the 'total' number of
+        recipes found. \n
+    """
+    ranking = rank_ingredient_matches(text, limit)
+
+    matched = dict(ranking["ranked"])
+    items = find_recipes_in_order(list(matched))
+    for recipe in items:
+        recipe["matches"] = matched[recipe["_id"]]
+
+    next_url, prev_url = make_page_urls(
+        ranking["page"], ranking["last_page"], {"ingredients": text})
+
+    return {
+        "items": items,
+        "next": next_url,
+        "prev": prev_url,
+        "page": ranking["page"],
+        "total": ranking["total"]
+    }
+
+
+def normalize_search(search_key):
+    """normalize_search: \n
+    * This function normalizes a search so that searches differing only
+        in case or spacing share a search cache entry. \n
+    \n
+    \n Args: \n
+    * search_key (str): The search from the 'q' request argument. \n
+    \n
+    \n Returns: \n
+    * It returns the lower case search with single spaces. \n
+    """
+    return " ".join(search_key.lower().split())
+
+
+def find_search_matches(key, projection):
+    """find_search_matches: \n
+    * This function runs the '$text' search for a normalized search,
+        most relevant first, then newest first. \n
+    \n
+    \n Args: \n
+    * key (str): The normalized search (see normalize_search). \n
+    * projection (dict): The fields to read. \n
+    \n
+    \n Returns: \n
+    * It returns the cursor of the matching recipes. \n
+    """
+    score = {"$meta": "textScore"}
+    return mongo.db.recipes.find(
+        {"$text": {"$search": key}}, dict(projection, score=score)).sort(
+            [("score", score), ("_id", DESCENDING)])
+
+
+def get_search_results(search_key):
+    """get_search_results: \n
+    * This function returns the ids of the recipes matching a search,
+        most relevant first, and the total number of matches from the
+        search cache. \n
+    * On a miss it runs the '$text' search once, reading only the ids
+        and text scores, and caches the result. Only the first
+        SEARCH_RESULTS_LIMIT ids are kept; if there are more the total
+        is counted. \n
+    * If nothing matches, recipes with similar names are found with
+        the fuzzy name index instead (see fuzzy_search_names). \n
+    * The least recently used search is dropped once the cache holds
+        SEARCH_CACHE_SIZE searches. Results read whilst a recipe was
+        being changed are not cached. \n
+    \n
+    \n Args: \n
+    * search_key (str): The search from the 'q' request argument. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the 'ids' list, the 'total' and 'fuzzy',
+        which is True if the ids are of similar names. \n
+    """
+    key = normalize_search(search_key)
+    now = time.monotonic()
+
+    with search_cache_lock:
+        version = search_cache_version["version"]
+        cached = search_cache.get(key)
+        if cached and cached["expires"] > now:
+            search_cache.move_to_end(key)
+            return cached["results"]
+
+    ids = [
+        recipe["_id"] for recipe in find_search_matches(
+            key, {"_id": 1}).limit(SEARCH_RESULTS_LIMIT + 1)]
+    if len(ids) > SEARCH_RESULTS_LIMIT:
+        ids = ids[:SEARCH_RESULTS_LIMIT]
+        total = mongo.db.recipes.count_documents(
+            {"$text": {"$search": key}})
+    else:
+        total = len(ids)
+    results = {"ids": ids, "total": total, "fuzzy": False}
+
+    # Falls back to recipes with similar names if nothing matched
+    if not ids:
+        ids = fuzzy_search_names(key)
+        results = {"ids": ids, "total": len(ids), "fuzzy": True}
+
+    with search_cache_lock:
+        if search_cache_version["version"] == version:
+            search_cache[key] = {
+                "results": results,
+                "expires": now + SEARCH_CACHE_TTL
+            }
+            search_cache.move_to_end(key)
+            while len(search_cache) > SEARCH_CACHE_SIZE:
+                search_cache.popitem(last=False)
+    return results
+
+
+def invalidate_search_cache():
+    """invalidate_search_cache: \n
+    * This function clears the search cache after a recipe is added,
+        edited or deleted, as any cached search could now be wrong. \n
+    """
+    with search_cache_lock:
+        search_cache_version["version"] += 1
+        search_cache.clear()
+
+
+def search_recipes(search_key, limit):
+    """search_recipes: \n
+    * This function gets a page of the recipes matching a search, using
+        the ids from the search cache so paging through the results does
+        not run the search again. \n
+    * Pages past the SEARCH_RESULTS_LIMIT cached ids are read by
+        running the search for just that page, skipping the recipes
+        before it. \n
+    * The page is read from the 'page' request argument. \n
+    \n
+    \n Args: \n
+    * search_key (str): The search from the 'q' request argument. \n
+    * limit (int): The number of recipes per page. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the page 'items', the 'next' and 'prev' query
+        strings (or None), the 'page' number, the 'total' number of
+        recipes found and 'fuzzy' if they are of similar names. \n
+    """
+    results = get_search_results(search_key)
+    page, last_page = get_page_number(results["total"], limit)
+    offset = (page - 1) * limit
+
+    cached = len(results["ids"])
+    if offset + limit <= cached or cached == results["total"]:
+        items = find_recipes_in_order(results["ids"][offset:offset + limit])
+    else:
+        items = list(find_search_matches(
+            normalize_search(search_key), RECIPE_LIST_FIELDS).skip(
+                offset).limit(limit))
+    next_url, prev_url = make_page_urls(page, last_page, {"q": search_key})
+
+    return {
+        "items": items,
+        "next": next_url,
+        "prev": prev_url,
+        "page": page,
+        "total": results["total"],
+        "fuzzy": results["fuzzy"]
+    }
+
+
+def get_page_number(total, limit):
+    """get_page_number: \n
+    * This function reads the 'page' request argument for results that
+        are paged by number. Defensive programming ensures the user
+        can't force a page out of range. \n
+    \n
+    \n Args: \n
+    * total (int): The number of results that can be paged through. \n
+    * limit (int): The number of results per page. \n
+    \n
+    \n Returns: \n
+    * It returns the page number and the last page number. \n
+    """
+    last_page = max(1, -(-total // limit))
+
+    try:
+        page = int(request.args.get("page", 1))
+    except ValueError:
+        page = 1
+
+    if page < 1:
+        page = 1
+    elif page > last_page:
+        page = last_page
+        flash("Page out of range", "error")
+    return page, last_page
+
+
+def make_page_urls(page, last_page, args):
+    """make_page_urls: \n
+    * This function creates the next and previous page query strings
+        for results that are paged by number. \n
+    \n
+    \n Args: \n
+    * page (int): The current page number. \n
+    * last_page (int): The last page number. \n
+    * args (dict): Other request arguments to keep in the urls. \n
+    \n
+    \n Returns: \n
+    * It returns the next and previous query strings, or None. \n
+    """
+    if page < last_page:
+        next_url = "?" + urlencode(dict(args, page=page + 1))
+    else:
+        next_url = None
+
+    if page > 1:
+        prev_url = "?" + urlencode(dict(args, page=page - 1))
+    else:
+        prev_url = None
+    return next_url, prev_url
 
 
-def login_required(f):
-    """login_required: \n
-    * This function creates a decorator to check if a user is logged in \n
-    * It performs 2 checks, if 'user' is in the session and secondly,
-        if the session user is registered in the database. \n
-    * It performs 2 checks to ensure the user is checked server side
-        and not simply rely on the session. \n
+def find_recipes_in_order(recipe_ids):
+    """find_recipes_in_order: \n
+    * This function reads the list fields of a page of recipes by id,
+        returning them in the order of the ids given. \n
+    \n
+    \n Args: \n
+    * recipe_ids (list): The ids of the recipes. \n
     \n
     \n Returns: \n
-    * If the user is logged in and recognised, it allows the user to
-        access the view \n
-    * If the user is not recognised or logged in, they are redirected
-        to the login page \n
+    * It returns a list of the recipes that still exist. \n
+    """
+    recipes = {
+        recipe["_id"]: recipe for recipe in mongo.db.recipes.find(
+            {"_id": {"$in": recipe_ids}}, RECIPE_LIST_FIELDS)}
+    return [
+        recipes[recipe_id] for recipe_id in recipe_ids
+        if recipe_id in recipes]
+
+
+def sample_documents(collection, size, projection=None):
+    """sample_documents: \n
+    * This function returns a random sample of documents from a
+        collection using the '$sample' aggregation stage, so MongoDB
+        picks the documents and only the sample is sent to the app. \n
+    * If the collection holds fewer documents than the size requested,
+        all of them are returned in a random order. \n
     \n
-    \n Reference: \n
-    * https://flask.palletsprojects.com/en/1.1.x/patterns/viewdecorators/
+    \n Args: \n
+    * collection (obj): The MongoDB collection to sample from. \n
+    * size (int): The maximum number of documents to return. \n
+    * projection (dict): Optional fields to return for each document. \n
+    \n
+    \n Returns: \n
+    * It returns a list of the sampled documents. \n
     """
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if session.get("user") is None:
-            user = None
-        else:
-            user = mongo.db.users.find_one(
-                {"username": session["user"].lower()})
-        if not user:
-            flash("User not recognised!", "error")
-            return redirect(url_for('login'))
-        elif "user" not in session:
-            flash("You must be logged in for this view", "error")
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
+    pipeline = [{"$sample": {"size": size}}]
+    if projection:
+        pipeline.append({"$project": projection})
+    return list(collection.aggregate(pipeline))
 
 
-def is_admin(f):
-    """is_admin: \n
-    * This function creates a decorator to check if a user is logged in and
-        also if the user is a registered admin. \n
-    * It performs a number of checks, if 'user' is in the session,
-        if the session user is registered in the database. If these are true,
-        it moves on to check if the user is an admin and then if admin
-        is in the session variables. \n
-    * It checks server side by accessing the database instead of relying
-        solely on the session variables. \n
+def parse_ingredient(text):
+    """parse_ingredient: \n
+    * This function splits an ingridient entered on the recipe form,
+        such as 'beef - 500g', into its name and quantity. \n
+    * If there is no quantity, the quantity is left blank. \n
+    \n
+    \n Args: \n
+    * text (str): The ingridient as entered on the form. \n
     \n
     \n Returns: \n
-    * If the user is logged in, recognised and an admin, it allows
-        the user to access the view they were trying to access. \n
-    * If the user is not recognised or logged in, they are redirected
-        to the home page with a toast appearing. \n
-    * If the user is recognised but they aren't a recognised admin it
-        also redirects them to the home page with a toast. \n
+    * It returns a dict of the ingridient 'name' and 'quantity'. \n
+    """
+    name, separator, quantity = text.rpartition(INGREDIENT_SEPARATOR)
+    if not separator:
+        return {"name": text.strip(), "quantity": ""}
+    return {"name": name.strip(), "quantity": quantity.strip()}
+
+
+def format_ingredient(ingredient):
+    """format_ingredient: \n
+    * This function is the 'ingredient' template filter, joining an
+        ingridient's name and quantity back to how it was entered on
+        the recipe form. \n
     \n
-    \n Reference: \n
-    * https://flask.palletsprojects.com/en/1.1.x/patterns/viewdecorators/
+    \n Args: \n
+    * ingredient (dict): The ingridient 'name' and 'quantity'. \n
+    \n
+    \n Returns: \n
+    * It returns the ingridient as a string. \n
     """
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if session.get("user") is None:
-            user = None
-        else:
-            user = mongo.db.users.find_one(
-                {"username": session["user"].lower()})
-        if not user:
-            flash("User not recognised!", "error")
-            return redirect(url_for('index'))
-        elif user["admin"].lower() == "false":
-            flash("This page is for admin only!", "error")
-            return redirect(url_for('index'))
-        elif "admin" not in session:
-            flash("This page is for admin only!", "error")
-            return redirect(url_for('index'))
-        return f(*args, **kwargs)
-    return decorated_function
+    if ingredient.get("quantity"):
+        return ingredient["name"] + INGREDIENT_SEPARATOR + \
+            ingredient["quantity"]
+    return ingredient["name"]
 
 
-def anonymous_required(f):
-    """is_admin: \n
-    * This function creates a decorator to check if the visitor is
-        not logged in. Such as accessing the login view once logged in. \n
-    * It performs the opposite of the logged in function, checking to
-        see if 'User' is in the session variables. \n
+app.add_template_filter(format_ingredient, "ingredient")
+
+
+def get_form_list(prefix):
+    """get_form_list: \n
+    * As the recipe form allows a dynamic amount of ingridients and
+        steps, this function collects the values of every form input
+        whose name starts with the prefix, in the order they were
+        entered. Blank inputs are skipped. \n
+    \n
+    \n Args: \n
+    * prefix (str): Either 'ingridients' or 'steps'. \n
     \n
     \n Returns: \n
-    * If the user is not logged in it allows them access to the view
-        they were trying to access. \n
-    * If the user is in the session, they are redirected to the home
-        page with a toast appearing. \n
+    * It returns a list of the lower case input values. \n
+    """
+    values = []
+    for key, val in request.form.items():
+        if key.startswith(prefix) and val.strip():
+            values.append(val.strip().lower())
+    return values
+
+
+def get_recipe_lists(recipe):
+    """get_recipe_lists: \n
+    * This function returns a recipe's ingridients and steps lists. \n
+    * Recipes not yet converted by 'flask migrate-recipes' still hold
+        strings joined by ' ~ ', which are split here. \n
     \n
-    \n Reference: \n
-    * https://flask.palletsprojects.com/en/1.1.x/patterns/viewdecorators/
+    \n Args: \n
+    * recipe (dict): The recipe from the database. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the 'ingridients' and 'steps' lists. \n
     """
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if "user" in session:
-            flash("That page is only for unauthenticated users."
-                  " Please logout if you wish to access this.", "error")
-            return redirect(url_for('index'))
-        return f(*args, **kwargs)
-    return decorated_function
+    ingridients = recipe.get("ingridients", [])
+    steps = recipe.get("steps", [])
+    if isinstance(ingridients, str):
+        ingridients = [
+            parse_ingredient(text)
+            for text in ingridients.split(LEGACY_SEPARATOR) if text]
+    if isinstance(steps, str):
+        steps = [text for text in steps.split(LEGACY_SEPARATOR) if text]
+    return {"ingridients": ingridients, "steps": steps}
+
+
+def format_step(step):
+    """format_step: \n
+    * This function capitalizes the first letter of each sentence in a
+        recipe step and makes sure each sentence ends in a full stop. \n
+    \n
+    \n Args: \n
+    * step (str): The lower case step as entered on the form. \n
+    \n
+    \n Returns: \n
+    * It returns the display ready step. \n
+    """
+    sentences = []
+    for sentence in step.split(". "):
+        if not sentence:
+            continue
+        sentence = sentence[0].upper() + sentence[1:] + "."
+        if sentence[-2:] == "..":
+            sentence = sentence[:-1]
+        sentences.append(sentence)
+    return " ".join(sentences)
+
+
+def format_recipe_lists(recipe_lists):
+    """format_recipe_lists: \n
+    * This function creates the display ready ingridients and steps
+        shown on the recipe page. It is run when a recipe is saved so
+        the recipe page does not format them on every view. \n
+    \n
+    \n Args: \n
+    * recipe_lists (dict): The 'ingridients' and 'steps' lists. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the 'formatted_ingridients' and
+        'formatted_steps' lists. \n
+    """
+    return {
+        "formatted_ingridients": [
+            format_ingredient(ingredient)
+            for ingredient in recipe_lists["ingridients"]],
+        "formatted_steps": [
+            format_step(step) for step in recipe_lists["steps"]]
+    }
+
+
+@app.before_request
+def start_request_timing():
+    """start_request_timing: \n
+    * This function starts timing each request and recording the
+        MongoDB commands it runs (see CommandTimer). \n
+    """
+    g.request_started = time.perf_counter()
+    g.db_commands = []
+    g.db_pending = {}
+
+
+@app.after_request
+def report_request_timing(response):
+    """report_request_timing: \n
+    * This function adds the request's MongoDB command count and time,
+        and its total time, to the Server-Timing header, and logs them
+        as a JSON line with the commands run. \n
+    * A request over DB_QUERY_BUDGET commands or DB_TIME_BUDGET_MS in
+        MongoDB is logged as a warning, naming the budgets it broke. \n
+    \n
+    \n Args: \n
+    * response (obj): The response to the request. \n
+    \n
+    \n Returns: \n
+    * It returns the response. \n
+    """
+    if "request_started" not in g:
+        return response
+
+    total_ms = (time.perf_counter() - g.request_started) * 1000
+    commands = g.db_commands
+    db_ms = sum(command["ms"] for command in commands)
+
+    if SERVER_TIMING:
+        response.headers.add(
+            "Server-Timing", 'db;dur={:.1f};desc="{} {}"'.format(
+                db_ms, len(commands),
+                "query" if len(commands) == 1 else "queries"))
+        response.headers.add(
+            "Server-Timing", "total;dur={:.1f}".format(total_ms))
+
+    over_budget = []
+    if len(commands) > DB_QUERY_BUDGET:
+        over_budget.append("queries")
+    if db_ms > DB_TIME_BUDGET_MS:
+        over_budget.append("db_time")
+
+    line = json.dumps({
+        "method": request.method,
+        "path": request.full_path.rstrip("?"),
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "ms": round(total_ms, 1),
+        "db_ms": round(db_ms, 1),
+        "queries": len(commands),
+        "documents": sum(command["documents"] for command in commands),
+        "commands": [
+            "{}.{} {:.1f}ms {} docs{}".format(
+                command["collection"], command["command"], command["ms"],
+                command["documents"], " failed" if command["failed"] else "")
+            for command in commands],
+        "over_budget": over_budget
+    })
+    if over_budget:
+        request_log.warning(line)
+    else:
+        request_log.info(line)
+    return response
 
 
 @app.route("/")
+@cache_page("quotes", "recipes", "products")
 def index():
     """index: \n
     * This function renders the sites home page (index.html). \n
-    * It accesses MongoDB to get a random choice of a single quote to display
+    * It asks MongoDB for a random sample of a single quote to display
         on page load and passes this to the template as 'quote'. \n
-    * It accesses MongoDB to get a list of recipes in the database. \n
-    * It checks the length of the recipe list to ensure it is more than seven;
-        if it is less than seven it sets a the length as the sample. If over
-        six it defaults to six to be sampled for the home page. \n
-    * It passes the sample of six or less recipes to the template
-        as 'recipes' \n
-    * It accesses MongoDB to get a list of products in the database. \n
-    * It checks the length of the product list to ensure it is more than seven;
-        if it is less than seven it sets a the length as the sample. If over
-        six it defaults to six to be sampled for the home page. \n
-    * It passes the sample of six or less product to the template
-        as 'products' \n
+    * It asks MongoDB for a random sample of up to six recipes, which
+        are passed to the template as 'recipes'. \n
+    * It asks MongoDB for a random sample of up to six products, which
+        are passed to the template as 'products'. \n
+    * The sampling is done server side with '$sample' so the full
+        collections are never loaded into the app; only the fields
+        the home page cards use are returned. \n
     \n
     \n Returns: \n
     * It returns 'index.html' \n
@@ -159,25 +2383,17 @@ def index():
     * It returns a sample of products \n
     """
 
-    single_quote = random.choice(list(mongo.db.quotes.find()))
-
-    recipe_list = list(mongo.db.recipes.find())
-
-    product_list = list(mongo.db.products.find())
-
-    if len(recipe_list) < 7:
-        sample = len(recipe_list)
-    else:
-        sample = 6
-
-    if len(product_list) < 7:
-        sample_products = len(product_list)
+    quotes = sample_documents(mongo.db.quotes, 1, INDEX_QUOTE_FIELDS)
+    if quotes:
+        single_quote = quotes[0]
     else:
-        sample_products = 6
+        single_quote = None
 
-    recipes = random.sample(recipe_list, k=sample)
+    recipes = sample_documents(
+        mongo.db.recipes, INDEX_SAMPLE_SIZE, INDEX_RECIPE_FIELDS)
 
-    products = random.sample(product_list, k=sample_products)
+    products = sample_documents(
+        mongo.db.products, INDEX_SAMPLE_SIZE, INDEX_PRODUCT_FIELDS)
 
     context = {
         "quote": single_quote,
@@ -188,6 +2404,7 @@ def index():
 
 
 @app.route("/recipes")
+@cache_page("recipes", "categories")
 def recipes():
     """recipes: \n
     * This function renders the recipes page (recipes.html). \n
@@ -195,19 +2412,27 @@ def recipes():
     * It checks if either 'q' for a search query or 'category' for a category
         filter are in the request arguements to filter the queryset from
         MongoDB. \n
-    * If a search query or category are in the args, it
-        adjusts the filters sent to MongoDB prior to pagination. \n
-    * It gets the total length of the MongoDB queryset based on the
-        filters or if there aren't any filters. This part of the pagination
-        is a known bug as this produces two database queries (original query
-        & the filtered query). The total recipes returned are passed to the
-        template as 'total_recipes'. \n
-    * It gets the filtered queryset to be passed to the template as
-        'recipes'. \n
-    * From the current page, offset and any filters or search queries
-        it calulates strings for next and previous paginated pages. \n
-    * It accesses MongoDB to get all the recipe categories to be
-        used as filters. They are passed to the template as 'categories'. \n
+    * If a category is in the args, it adjusts the filters sent to
+        MongoDB prior to pagination. \n
+    * If a search query is in the args, the page of results is read
+        from the ids in the search cache, most relevant first (see
+        search_recipes). If nothing matches, recipes with similar
+        names are shown instead. \n
+    * If 'ingredients' is in the args instead, it ranks the recipes by
+        how many of the ingridients they use (see
+        rank_recipes_by_ingredients). \n
+    * It gets the page of recipes with a single query using the cursor
+        in the request args (see paginate). These are passed to the
+        template as 'recipes', along with the next and previous page
+        urls. \n
+    * It gets the number of recipes for the filter from the count cache
+        (or the search results) to be passed to the template
+        as 'results'. A category without recipes is redirected before
+        any recipes are read. \n
+    * It gets all the recipe categories from the category cache to be
+        used as filters, with the number of recipes in each. Categories
+        without recipes are left out. They are passed to the template as
+        'categories'. \n
     \n
     \n Returns: \n
     * It returns 'recipes.html' \n
@@ -216,13 +2441,15 @@ def recipes():
     * It returns an integer of the total length of the recipe list \n
     * It returns the filter or query if there was one \n
     * It returns the pagination info of next_url, prev_url and page.
-    \n
-    \n Reference: \n
-    * Pagination code - https://www.youtube.com/watch?v=Lnt6JqtzM7I
     """
     # Number of items to be displayed per page
     limit = 9
 
+    # Answers a browser that already has this page before reading it
+    etag = make_etag(("recipes", "categories"))
+    if is_not_modified(etag):
+        return etag_response("", etag, 304)
+
     # Checks if 'category' in request arguements, if not sets a default
     if 'category' in request.args:
         category = request.args.get('category')
@@ -235,114 +2462,118 @@ def recipes():
     else:
         search_key = None
 
-    # Gets the filtered lists or by default all recipes. It then checks
-    # if the len is == 0 to avoid server errors if their are none.
+    # Checks if 'ingredients' in request arguements, if not sets a default
+    if 'ingredients' in request.args:
+        ingredients = request.args.get('ingredients')
+    else:
+        ingredients = None
+
+    # Sets the filter for the queryset and the args kept when paging.
+    # A category is used over a search, and a search over ingridients.
     if category:
-        all_recipes = list(mongo.db.recipes.find(
-            {"category": category}).sort("_id", -1))
-        if len(all_recipes) == 0:
+        query = {"category": category}
+        args = {"category": category}
+        search_key = None
+        ingredients = None
+    else:
+        query = {}
+        args = {}
+        if search_key:
+            ingredients = None
+
+    # Gets the number of recipes in each category for the filters,
+    # checking the category asked for has recipes before reading them
+    category_counts = get_category_counts("recipes", category)
+    if category and not category_counts["categories"].get(category):
+        flash("No '{}' category exists!".format(
+            category.capitalize()), "error")
+        return redirect(url_for("recipes"))
+    if category_counts["provisional"]:
+        etag = skip_page_caching()
+
+    # Gets the page of search results or recipes ranked by the
+    # ingridients they use, or the page of the filtered queryset
+    if search_key:
+        pagination = search_recipes(search_key, limit)
+    elif ingredients:
+        pagination = rank_recipes_by_ingredients(ingredients, limit)
+    else:
+        pagination = paginate(
+            mongo.db.recipes, query, limit, args, RECIPE_LIST_FIELDS)
+
+    # Checks if the first page is empty to let the user know there
+    # are no recipes for their filter or search
+    if not pagination["items"] and pagination["page"] == 1:
+        if category:
             flash("No '{}' category exists!".format(
                 category.capitalize()), "error")
             return redirect(url_for("recipes"))
-    elif search_key:
-        all_recipes = list(mongo.db.recipes.find(
-            {"$text": {"$search": search_key}}).sort("_id", -1))
-        if len(all_recipes) == 0:
+        elif search_key:
             flash("No match for '{}'".format(
                 search_key.capitalize()), "error")
             return redirect(url_for("recipes"))
-    else:
-        all_recipes = list(mongo.db.recipes.find().sort("_id", -1))
-
-    # Gets the length of the list being sent to the template
-    total_recipes = len(all_recipes)
-
-    # Setting the offset of the queryset dependent on current page
-    # from request args. Defensive programming to ensure the user
-    # can't force a page out of the queryset range causing a server
-    # error.
-    if 'page' in request.args:
-        if int(request.args['page']) <= 1:
-            page = 1
-            offset = 0
-            redirect(url_for("recipes"))
-        elif ((int(request.args['page']) * limit) - limit) > total_recipes:
-            page = math.ceil((total_recipes/limit))
-            offset = limit * (page - 1)
-            flash("Page out of range", "error")
-        else:
-            page = int(request.args['page'])
-            offset = limit * (page - 1)
-    else:
-        page = 1
-        offset = 0
-
-    # Getting the last id to with the offset being passed in
-    last_id = all_recipes[offset]["_id"]
-
-    # Getting the filtered queryset including the offset using 'lte'
-    # It then uses the set page limit (9) to get the page recipes.
-    if category:
-        query = {"$and": [{"category": category}, {'_id': {'$lte': last_id}}]}
-        display_recipes = list(
-            mongo.db.recipes.find(query).sort("_id", -1).limit(limit))
-    elif search_key:
-        query = {"$and": [
-            {"$text": {"$search": search_key}}, {'_id': {'$lte': last_id}}]}
-        display_recipes = list(
-            mongo.db.recipes.find(query).sort("_id", -1).limit(limit))
-    else:
-        display_recipes = list(
-            mongo.db.recipes.find(
-                {'_id': {'$lte': last_id}}).sort("_id", -1).limit(limit))
+        elif ingredients:
+            flash("No recipes use '{}'".format(
+                ingredients.capitalize()), "error")
+            return redirect(url_for("recipes"))
 
-    # Getting the next & prev url dependent on which parameters are in
-    # the request arguements.
-    if search_key:
-        if offset + limit >= total_recipes:
-            next_url = None
-        else:
-            next_url = "?page=" + str(page + 1) + "&q=" + str(search_key)
-        if offset == 0:
-            prev_url = None
-        else:
-            prev_url = "?page=" + str(page - 1) + "&q=" + str(search_key)
+    # Gets the number of recipes matching the filter
+    if search_key or ingredients:
+        total_recipes = pagination["total"]
     elif category:
-        if offset + limit >= total_recipes:
-            next_url = None
-        else:
-            next_url = "?page=" + str(page + 1) + "&category=" + str(category)
-        if offset == 0:
-            prev_url = None
-        else:
-            prev_url = "?page=" + str(page - 1) + "&category=" + str(category)
+        total_recipes = category_counts["categories"][category]
     else:
-        if offset + limit >= total_recipes:
-            next_url = None
-        else:
-            next_url = "?page=" + str(page + 1)
-        if offset == 0:
-            prev_url = None
-        else:
-            prev_url = "?page=" + str(page - 1)
+        total_recipes = category_counts["total"]
 
-    # Getting categories to be used for filters
-    categories = list(mongo.db.categories.find().sort("category", 1))
+    # Getting the categories with recipes to be used for filters
+    categories = []
+    for obj in get_categories("categories"):
+        count = category_counts["categories"].get(obj["category"])
+        if count:
+            categories.append(dict(obj, count=count))
 
     context = {
-        "recipes": display_recipes,
+        "recipes": pagination["items"],
         "categories": categories,
         "results": total_recipes,
         "filter": category,
         "query": search_key,
-        "next": next_url,
-        "prev": prev_url,
-        "page": page
+        "ingredients": ingredients,
+        "fuzzy": pagination.get("fuzzy"),
+        "next": pagination["next"],
+        "prev": pagination["prev"],
+        "page": pagination["page"]
     }
-    return render_template("recipes.html", **context)
+    return etag_response(render_template("recipes.html", **context), etag)
+
+
+@app.route("/api/suggest")
+def api_suggest():
+    """api_suggest: \n
+    * This function returns the JSON suggestions for the recipe search
+        box, for the letters typed in the 'q' request argument (see
+        suggest). \n
+    * Each suggestion has its 'text', its 'type' (category, recipe or
+        ingredient) and the 'url' of the recipes page filtered by it. \n
+    \n
+    \n Returns: \n
+    * It returns a JSON object with the list of 'suggestions'. \n
+    """
+    filters = {"category": "category", "recipe": "q",
+               "ingredient": "ingredients"}
+    suggestions = [
+        {
+            "text": label,
+            "type": kind,
+            "url": url_for("recipes", **{filters[kind]: label})
+        }
+        for kind, label in suggest(request.args.get("q", ""))
+    ]
+    return jsonify(suggestions=suggestions)
 
 
 @app.route("/products")
+@cache_page("products", "product_categories")
 def products():
     """products: \n
     * This function renders the products page (products.html). \n
@@ -351,17 +2582,17 @@ def products():
         request arguements to filter the queryset from MongoDB. \n
     * If category is in the args, it adjusts the filters sent to
         MongoDB prior to pagination. \n
-    * It gets the total length of the MongoDB queryset based on the
-        filters or if there aren't any filters. This part of the pagination
-        is a known bug as this produces two database queries (original query
-        & the filtered query). The total products returned are passed to the
-        template as 'total_products'. \n
-    * It gets the filtered queryset to be passed to the template as
-        'products'. \n
-    * From the current page, offset and any filters it calulates strings
-        for next and previous paginated pages. \n
-    * It accesses MongoDB to get all the products categories to be
-        used as filters. They are passed to the template as 'categories'. \n
+    * It gets the page of products with a single query using the cursor
+        in the request args (see paginate). These are passed to the
+        template as 'products', along with the next and previous page
+        urls. \n
+    * It gets the number of products for the filter from the count
+        cache to be passed to the template as 'results'. A category
+        without products is redirected before any products are read. \n
+    * It gets all the products categories from the category cache to be
+        used as filters, with the number of products in each. Categories
+        without products are left out. They are passed to the template
+        as 'categories'. \n
     \n
     \n Returns: \n
     * It returns 'products.html' \n
@@ -370,103 +2601,67 @@ def products():
     * It returns an integer of the total length of the product list \n
     * It returns the filter or query if there was one \n
     * It returns the pagination info of next_url, prev_url and page.
-    \n
-    \n Reference: \n
-    * Pagination code - https://www.youtube.com/watch?v=Lnt6JqtzM7I
     """
     # Number of items per page
     limit = 6
 
+    # Answers a browser that already has this page before reading it
+    etag = make_etag(("products", "product_categories"))
+    if is_not_modified(etag):
+        return etag_response("", etag, 304)
+
     # Checks if 'category' in request arguements, if not sets a default
     if 'category' in request.args:
         category = request.args.get('category')
     else:
         category = None
 
-    # Gets the filtered lists or by default all products. It then checks
-    # if the len is == 0 to avoid server errors if their are none.
-    if category:
-        all_products = list(mongo.db.products.find(
-            {"category": category}).sort("_id", -1))
-        if len(all_products) == 0:
-            flash("No '{}' category exists!".format(
-                category.capitalize()), "error")
-            return redirect(url_for("products"))
-    else:
-        all_products = list(mongo.db.products.find().sort("_id", -1))
-
-    # Gets the length of the list being sent to the template
-    total_products = len(all_products)
-
-    # Setting the offset of the queryset dependent on current page
-    # from request args. Defensive programming to ensure the user
-    # can't force a page out of the queryset range causing a server
-    # error.
-    if 'page' in request.args:
-        if int(request.args['page']) <= 1:
-            page = 1
-            offset = 0
-            redirect(url_for("products"))
-        elif ((int(request.args['page']) * limit) - limit) > total_products:
-            page = math.ceil((total_products/limit))
-            offset = limit * (page - 1)
-            flash("Page out of range", "error")
-        else:
-            page = int(request.args['page'])
-            offset = limit * (page - 1)
-    else:
-        page = 1
-        offset = 0
-
-    # Getting the last id to with the offset being passed in
-    last_id = all_products[offset]["_id"]
-
-    # Getting the filtered queryset including the offset using 'lte'
-    # It then uses the set page limit (6) to get the page recipes.
+    # Sets the filter for the queryset and the args kept when paging
     if category:
-        query = {"$and": [{"category": category}, {'_id': {'$lte': last_id}}]}
-        products_qs = list(
-            mongo.db.products.find(query).sort("_id", -1).limit(limit))
+        query = {"category": category}
+        args = {"category": category}
     else:
-        products_qs = list(
-            mongo.db.products.find(
-                {'_id': {'$lte': last_id}}).sort("_id", -1).limit(limit))
-
-    # Getting the next & prev url dependent on which parameters are in
-    # the request arguements.
+        query = {}
+        args = {}
+
+    # Gets the number of products in each category for the filters,
+    # checking the category asked for has products before reading them
+    category_counts = get_category_counts("products", category)
+    if category and not category_counts["categories"].get(category):
+        flash("No '{}' category exists!".format(
+            category.capitalize()), "error")
+        return redirect(url_for("products"))
+    if category_counts["provisional"]:
+        etag = skip_page_caching()
+
+    pagination = paginate(
+        mongo.db.products, query, limit, args, PRODUCT_FIELDS)
+
+    # Gets the number of products matching the filter
     if category:
-        if offset + limit >= total_products:
-            next_url = None
-        else:
-            next_url = "?page=" + str(page + 1) + "&category=" + str(category)
-        if offset == 0:
-            prev_url = None
-        else:
-            prev_url = "?page=" + str(page - 1) + "&category=" + str(category)
+        total_products = category_counts["categories"][category]
     else:
-        if offset + limit >= total_products:
-            next_url = None
-        else:
-            next_url = "?page=" + str(page + 1)
-        if offset == 0:
-            prev_url = None
-        else:
-            prev_url = "?page=" + str(page - 1)
+        total_products = category_counts["total"]
 
-    # Getting categories to be used for filters
-    categories = list(mongo.db.product_categories.find().sort("category", 1))
+    # Getting the categories with products to be used for filters
+    categories = []
+    for obj in get_categories("product_categories"):
+        count = category_counts["categories"].get(obj["category"])
+        if count:
+            categories.append(dict(obj, count=count))
 
     context = {
-        "products": products_qs,
+        "products": pagination["items"],
         "categories": categories,
         "results": total_products,
         "filter": category,
-        "next": next_url,
-        "prev": prev_url,
-        "page": page
+        "next": pagination["next"],
+        "prev": pagination["prev"],
+        "page": pagination["page"]
     }
 
-    return render_template("products.html", **context)
+    return etag_response(
+        render_template("products.html", **context), etag)
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -494,7 +2689,8 @@ def login():
     if request.method == "POST":
         # Check if username is in db
         user = mongo.db.users.find_one(
-            {"username": request.form.get("username").lower()})
+            {"username": request.form.get("username").lower()},
+            USER_LOGIN_FIELDS)
         if user:
             # Check if user is admin
             if user["admin"].lower() == "true":
@@ -575,7 +2771,7 @@ def register():
     if request.method == "POST":
         # Check if user is in db
         existing_user = mongo.db.users.find_one(
-            {"username": request.form.get("username").lower()})
+            {"username": request.form.get("username").lower()}, {"_id": 1})
 
         if existing_user:
             flash("Username already exists!", "error")
@@ -583,7 +2779,7 @@ def register():
 
         # Check if email is in db
         existing_email = mongo.db.users.find_one(
-            {"email": request.form.get("email").lower()})
+            {"email": request.form.get("email").lower()}, {"_id": 1})
 
         if existing_email:
             flash("Email already exists!", "error")
@@ -622,14 +2818,16 @@ def profile(username):
     """profile: \n
     * This function renders the users profile page (profile.html). \n
     * It firstly uses the session 'user' variable to find the specific
-        user in MongoDB
-    * As this varibale will be passed back to the template, a for loop
-        is performed to pop the password variable out of the dict; whilst
-        also setting the database username variable to its own variable. \n
+        user, reusing the user loaded by the login_required decorator. \n
+    * As this varibale will be passed back to the template, only the
+        profile fields are read from the database so the password hash
+        is never loaded. \n
+    * The function checks for a request method of post and, if the
+        email is not used by another user, updates the session users
+        database entry, dropping them from the user cache,
+        before reloading the profile page. \n
     * The function then follows the same logic as the products & recipes
         page to paginate the queryset to be displayed on the profile page.
-    * The function checks for a request method of post and updates the
-        session users database entry before reloading the profile page. \n
     * Whilst also have a login required decorator, the function also double
         checks if 'user is in the session and if not redirects to the login. \n
     \n
@@ -639,96 +2837,57 @@ def profile(username):
     \n Returns: \n
     * It returns the profile.html. \n
     * It returns a list of the users recipes. \n
-    * It returns the total of the users recipes. \n
     * It returns the 3 pagination variables. \n
-    \n
-    \n Reference: \n
-    * Pagination code - https://www.youtube.com/watch?v=Lnt6JqtzM7I
     """
 
-    # grab the session user's username from db
-    user = mongo.db.users.find_one({"username": session["user"]})
-
-    # A for loop to delete the password key from the user dict and
-    # get the username value
-    password_key = "password"
-    for key, values in user.items():
-        if key == password_key:
-            del user[key]
-            break
-        if key == "username":
-            username = values
-
-    # Number of items per page
-    limit = 6
-
-    # get the users recipes
-    user_recipes = list(mongo.db.recipes.find(
-        {"created_by": username}).sort("_id", -1))
-
-    # Getting the length of the all the recipes to display total
-    total_recipes = len(user_recipes)
-
-    # Getting the offset (page number)
-    if 'page' in request.args:
-        if int(request.args['page']) <= 1:
-            page = 1
-            offset = 0
-            redirect(url_for("profile", username=user["username"]))
-        elif ((int(request.args['page']) * limit) - limit) > total_recipes:
-            page = math.ceil((total_recipes/limit))
-            offset = limit * (page - 1)
-            flash("Page out of range", "error")
-        else:
-            page = int(request.args['page'])
-            offset = limit * (page - 1)
-    else:
-        page = 1
-        offset = 0
-
-    recipes = ()
-
-    if total_recipes > 0:
-        # Getting the last id to with the offset used
-        last_id = user_recipes[offset]["_id"]
+    # grab the session user, already loaded by the login_required
+    # decorator and without the password hash
+    user = get_session_user()
+    username = user["username"]
 
-        # Getting the page recipes using the last ID to offset and
-        # limit to get set amount of results
-        query = {"$and": [
-            {"created_by": username}, {'_id': {'$lte': last_id}}]}
-        recipes = list(
-            mongo.db.recipes.find(query).sort("_id", -1).limit(limit))
+    # Function for updating the user profile
+    if request.method == "POST":
+        email = request.form.get("email").lower()
 
-    # Getting the next & prev url
-    if offset + limit >= total_recipes:
-        next_url = None
-    else:
-        next_url = "?page=" + str(page + 1)
+        # Check if the email belongs to another user, as emails are
+        # unique
+        existing_email = mongo.db.users.find_one(
+            {"email": email, "username": {"$ne": session["user"]}},
+            {"_id": 1})
 
-    if offset == 0:
-        prev_url = None
-    else:
-        prev_url = "?page=" + str(page - 1)
+        if existing_email:
+            flash("Email already exists!", "error")
+            return redirect(url_for('profile', username=session["user"]))
 
-    # Function for updating the user profile
-    if request.method == "POST":
         submit = {'$set': {
             "first_name": request.form.get("firstname"),
             "last_name": request.form.get("lastname"),
-            "email": request.form.get("email"),
+            "email": email,
         }}
 
-        mongo.db.users.update_one({"username": session["user"]}, submit)
+        try:
+            mongo.db.users.update_one({"username": session["user"]}, submit)
+        except DuplicateKeyError:
+            flash("Email already exists!", "error")
+            return redirect(url_for('profile', username=session["user"]))
+        invalidate_user(session["user"])
         flash("Profile Updated", "success")
         return redirect(url_for('profile', username=session["user"]))
 
+    # Number of items per page
+    limit = 6
+
+    # Getting the page of the users recipes
+    pagination = paginate(
+        mongo.db.recipes, {"created_by": username}, limit,
+        projection=RECIPE_LIST_FIELDS)
+
     context = {
         "user": user,
-        "recipes": recipes,
-        "results": total_recipes,
-        "next": next_url,
-        "prev": prev_url,
-        "page": page
+        "recipes": pagination["items"],
+        "next": pagination["next"],
+        "prev": pagination["prev"],
+        "page": pagination["page"]
     }
 
     if session["user"]:
@@ -743,12 +2902,12 @@ def admin(username):
     """admin: \n
     * This function renders the users admin page (admin.html). \n
     * It firstly uses the session 'user' variable to find the specific
-        user in MongoDB. \n
+        user, reusing the user loaded by the is_admin decorator. \n
     * It then checks if the user is designated as admin in the database. \n
-    * If they are, it gets all the products from the database before
+    * If they are, it gets a page of the products from the database,
         paginating in the same way as previous functions. \n
-    * It queries the database for two lists, product categories and recipe
-        categories to be passed to the template. \n
+    * It gets two lists from the category cache, product categories and
+        recipe categories to be passed to the template. \n
     * Whilst also have a is admin decorator, the function also double
         checks if 'user is in the session and if 'admin' is in the session;
         if not redirects to the login. \n
@@ -758,16 +2917,13 @@ def admin(username):
     \n
     \n Returns: \n
     * It returns the admin.html. \n
-    * It returns a list of all the products. \n
+    * It returns a page of the products. \n
     * It returns a list of both recipe and product categories. \n
     * It returns the 3 pagination variables. \n
-    \n
-    \n Reference: \n
-    * Pagination code - https://www.youtube.com/watch?v=Lnt6JqtzM7I
     """
 
-    # grab the session user's username from db
-    user = mongo.db.users.find_one({"username": session["user"]})
+    # grab the session user, already loaded by the is_admin decorator
+    user = get_session_user()
 
     # Check the user is an admin user
     if user["admin"].lower() == "false":
@@ -777,73 +2933,119 @@ def admin(username):
     # Number of items per page
     limit = 6
 
-    # get all the products
-    all_products = list(mongo.db.products.find().sort("_id", -1))
-
-    # Getting the length of the all the products to display total
-    total_products = len(all_products)
-
-    # Getting the offset (page number)
-    if 'page' in request.args:
-        if int(request.args['page']) <= 1:
-            page = 1
-            offset = 0
-            redirect(url_for("products"))
-        elif ((int(request.args['page']) * limit) - limit) > total_products:
-            page = math.ceil((total_products/limit))
-            offset = limit * (page - 1)
-            flash("Page out of range", "error")
-        else:
-            page = int(request.args['page'])
-            offset = limit * (page - 1)
-    else:
-        page = 1
-        offset = 0
-
-    if total_products > 0:
-        # Getting the last id to with the offset used
-        last_id = all_products[offset]["_id"]
-
-        # Getting the page products using the last ID to offset and
-        # limit to get set amount of results
-        products = list(
-            mongo.db.products.find({'_id': {'$lte': last_id}}).sort("_id", -1)
-        )
-    else:
-        products = []
-
-    # Getting the next & prev url
-    if offset + limit >= total_products:
-        next_url = None
-    else:
-        next_url = "?page=" + str(page + 1)
-
-    if offset == 0:
-        prev_url = None
-    else:
-        prev_url = "?page=" + str(page - 1)
+    # Getting the page of products
+    pagination = paginate(
+        mongo.db.products, {}, limit, projection=ADMIN_PRODUCT_FIELDS)
 
-    product_categories = list(
-        mongo.db.product_categories.find().sort("category", 1)
-    )
+    product_categories = get_categories("product_categories")
 
-    recipe_categories = list(mongo.db.categories.find().sort("category", 1))
+    recipe_categories = get_categories("categories")
 
     context = {
         "user": user,
-        "products": products,
-        "results": total_products,
-        "next": next_url,
-        "prev": prev_url,
-        "page": page,
+        "products": pagination["items"],
+        "next": pagination["next"],
+        "prev": pagination["prev"],
+        "page": pagination["page"],
         "product_categories": product_categories,
         "recipe_categories": recipe_categories
     }
 
-    if session["user"] and session["admin"]:
-        return render_template("admin.html", **context)
+    if session["user"] and session["admin"]:
+        return render_template("admin.html", **context)
+
+    return redirect(url_for("index"))
+
+
+@app.route("/admin/metrics")
+@is_admin
+def admin_metrics():
+    """admin_metrics: \n
+    * This function returns the app's metrics as JSON for admin users:
+        the page cache hit ratio and the MongoDB connection pool's
+        checkout wait, saturation and connection churn. The numbers are
+        for the app process that answers the request. \n
+    \n
+    \n Returns: \n
+    * It returns a JSON object of the metrics. \n
+    """
+    return jsonify(
+        page_cache=get_page_cache_stats(), mongo_pool=get_pool_metrics())
+
+
+@app.route("/admin/export/<collection_name>")
+@is_admin
+def admin_export(collection_name):
+    """admin_export: \n
+    * This function downloads every recipe, product or category as
+        NDJSON or CSV (see export_documents), chosen by the 'format'
+        request argument (NDJSON by default). \n
+    * The file is sent as it is read from MongoDB, a batch at a
+        time. \n
+    \n
+    \n Args: \n
+    * collection_name (str): One of BULK_COLLECTIONS. \n
+    \n
+    \n Returns: \n
+    * It returns the file, or a 404 for an unknown collection or
+        format. \n
+    """
+    file_format = request.args.get("format", "ndjson")
+    if collection_name not in BULK_COLLECTIONS or \
+            file_format not in BULK_FORMATS:
+        return "", 404
+
+    response = app.response_class(
+        stream_with_context(export_documents(collection_name, file_format)),
+        mimetype=BULK_FORMATS[file_format])
+    response.headers["Content-Disposition"] = (
+        "attachment; filename={}.{}".format(collection_name, file_format))
+    return response
+
+
+@app.route("/admin/import/<collection_name>", methods=["POST"])
+@is_admin
+def admin_import(collection_name):
+    """admin_import: \n
+    * This function saves recipes, products or categories from an
+        NDJSON or CSV file (see import_documents), read as it is
+        received. \n
+    * The file is either uploaded as 'file', its format given by its
+        extension, or sent as the request body with a Content-Type of
+        application/x-ndjson or text/csv. The 'format' request argument
+        overrides either. \n
+    * Recipes without a 'created_by' are added by the admin user. \n
+    \n
+    \n Args: \n
+    * collection_name (str): One of BULK_COLLECTIONS. \n
+    \n
+    \n Returns: \n
+    * It returns a JSON object of the number of documents inserted and
+        updated, and the rows that failed. \n
+    * It returns a 404 for an unknown collection, or a 400 if the
+        format is not known. \n
+    """
+    if collection_name not in BULK_COLLECTIONS:
+        return "", 404
+
+    upload = request.files.get("file")
+    if upload is not None:
+        stream = upload.stream
+        file_format = upload.filename.rpartition(".")[2].lower()
+    else:
+        stream = request.stream
+        file_format = {
+            mimetype: name for name, mimetype in BULK_FORMATS.items()
+        }.get(request.mimetype)
+    file_format = request.args.get("format", file_format)
+    if file_format not in BULK_FORMATS:
+        return jsonify(
+            error="Send an NDJSON or CSV file, or set 'format'"), 400
 
-    return redirect(url_for("index"))
+    result = import_documents(
+        collection_name, read_import_rows(stream, file_format),
+        author=session["user"])
+    return jsonify(result)
 
 
 @app.route("/edit-category/<category_id>", methods=["GET", "POST"])
@@ -872,10 +3074,13 @@ def edit_category_recipe(category_id):
         }}
 
         mongo.db.categories.update_one({"_id": ObjectId(category_id)}, submit)
+        invalidate_categories("categories")
+        record_change("categories")
         flash("Category Updated Successfully", "success")
         return redirect(url_for('admin', username=session["user"]))
 
-    category = mongo.db.categories.find_one({"_id": ObjectId(category_id)})
+    category = mongo.db.categories.find_one(
+        {"_id": ObjectId(category_id)}, {"category": 1})
 
     context = {
         "category": category,
@@ -905,6 +3110,8 @@ def add_category_recipe():
         }
 
         mongo.db.categories.insert_one(submit)
+        invalidate_categories("categories")
+        record_change("categories")
         flash("Category Successfully Added", "success")
         return redirect(url_for('admin', username=session["user"]))
 
@@ -938,11 +3145,13 @@ def edit_category_product(category_id):
 
         mongo.db.product_categories.update_one(
             {"_id": ObjectId(category_id)}, submit)
+        invalidate_categories("product_categories")
+        record_change("product_categories")
         flash("Category Updated Successfully", "success")
         return redirect(url_for('admin', username=session["user"]))
 
     category = mongo.db.product_categories.find_one(
-        {"_id": ObjectId(category_id)})
+        {"_id": ObjectId(category_id)}, {"category": 1})
 
     context = {
         "category": category,
@@ -972,6 +3181,8 @@ def add_category_product():
         }
 
         mongo.db.product_categories.insert_one(submit)
+        invalidate_categories("product_categories")
+        record_change("product_categories")
         flash("Category Successfully Added", "success")
         return redirect(url_for('admin', username=session["user"]))
 
@@ -984,14 +3195,16 @@ def add_recipe():
     """add_recipe: \n
     * This function renders the add-recipe.html template. \n
     * The function checks if the request method is 'POST'. \n
-    * In order to create one variable 'ingridients' and one
-        variable 'steps' a for loop is used to join all inputs
-        with the required startswith text into a string seperated
-        by ' ~ '.\n
-    * It then enters the input information into the database. \n
+    * The dynamic ingridient and step inputs are collected into two
+        lists, 'ingridients' (of names and quantities) and 'steps'. \n
+    * The display ready ingridients and steps for the recipe page are
+        created once here and saved with the recipe. \n
+    * It then enters the input information into the database and adds
+        the recipe to the cached recipe counts and recipe indexes,
+        clearing the search cache. \n
     * If successful it redirects the user to the profile page, whilst
         also showing a toast. \n
-    * It gets all recipe categories from the database, to be passed
+    * It gets all recipe categories from the category cache, to be passed
         to the template to create a strict input for recipe category. \n
     \n
     \n Returns: \n
@@ -1000,40 +3213,15 @@ def add_recipe():
         method is 'POST' and the recipe has been added. \n
     """
     if request.method == "POST":
-        """
-        As the recipe form allows a dynamic amount of
-        ingridients and steps, the below loops through
-        the ingridients/steps creating a string split
-        by the character " ~ ". This is done so there is
-        only one ingridient and one steps field in the
-        database.
-        """
-        # Sets blank strings
-        ingridients = ""
-        steps = ""
-
-        # Sets the for loop indexes
-        for_loop_idx_ing = 0
-        for_loop_idx_steps = 0
-
-        # for loops of keys and values, checking if the
-        # keys start with either 'ingridients' or 'steps'.
-        # If they do it creates a string seperated by ' ~ '.
-        for key, val in request.form.items():
-            if key.startswith("ingridients"):
-                if for_loop_idx_ing > 0:
-                    ingridients += " ~ " + val.lower()
-                    for_loop_idx_ing += 1
-                else:
-                    ingridients += val.lower()
-                    for_loop_idx_ing += 1
-            if key.startswith("steps"):
-                if for_loop_idx_steps > 0:
-                    steps += " ~ " + val.lower()
-                    for_loop_idx_steps += 1
-                else:
-                    steps += val.lower()
-                    for_loop_idx_steps += 1
+        # Gets the dynamic ingridient and step inputs as lists, with
+        # each ingridient split into its name and quantity
+        ingridients = [
+            parse_ingredient(text) for text in get_form_list("ingridients")]
+        steps = get_form_list("steps")
+
+        # Creates the display ready lists for the recipe page
+        formatted = format_recipe_lists(
+            {"ingridients": ingridients, "steps": steps})
 
         # Creates a variable of all the information to be
         # added to the database. Including adding the user
@@ -1047,15 +3235,22 @@ def add_recipe():
             "image_url": request.form.get("imageurl").lower(),
             "ingridients": ingridients,
             "steps": steps,
+            "formatted_ingridients": formatted["formatted_ingridients"],
+            "formatted_steps": formatted["formatted_steps"],
             "created": str(date.today().strftime("%x")),
-            "created_by": session["user"]
+            "created_by": session["user"],
+            "version": 1
         }
 
         mongo.db.recipes.insert_one(recipe)
+        record_change("recipes")
+        adjust_count("recipes", recipe["category"], 1)
+        index_recipe(recipe["_id"], recipe)
+        invalidate_search_cache()
         flash("Recipe Successfully Added", "success")
         return redirect(url_for('profile', username=session["user"]))
 
-    categories = mongo.db.categories.find().sort("category", 1)
+    categories = get_categories("categories")
 
     context = {
         "categories": categories,
@@ -1073,12 +3268,13 @@ def edit_recipe(recipe_id):
         the args. \n
     * Gets the recipe categories to be used in select functions
         on the edit form.\n
-    * Creates two lists by splitting the two joined strings down
-        to the original inputs. \n
     * The function checks if the request method is 'POST'. \n
-    * It recreates the one string needed for both ingridients
-        and steps from the dynamic inputs.\n
+    * It collects the ingridients and steps lists from the dynamic
+        inputs and creates their display ready versions.\n
     * It then updates the databse with the new values.\n
+    * If the category has changed, the cached recipe counts are
+        updated. The recipe is re-indexed and the search
+        cache is cleared.\n
     \n
     \n Args: \n
     * recipe_id (str): A id of the obj to be edited from the
@@ -1086,58 +3282,36 @@ def edit_recipe(recipe_id):
     \n
     \n Returns: \n
     * It renders the eidt-recipe.html \n
-    * It passes the recipe variable and categories varible to the
-        template to be used for form values. \n
+    * It passes the recipe variable, categories varible and the
+        ingridients and steps lists to the template to be used for
+        form values. \n
     * It redirects the user back to the profile page if request
         method is 'POST' and the recipe has been edited. \n
     """
     # Gets the recipe to be passed to the template for the form values
-    recipe = mongo.db.recipes.find_one({"_id": ObjectId(recipe_id)})
+    recipe = mongo.db.recipes.find_one(
+        {"_id": ObjectId(recipe_id)}, RECIPE_FORM_FIELDS)
 
-    # Splits the two joined string values back into a list of all
-    # individual steps and ingridients
-    recipe_ings = recipe["ingridients"].split(" ~ ")
-    recipe_steps = recipe["steps"].split(" ~ ")
-
-    categories = mongo.db.categories.find().sort("category", 1)
+    categories = get_categories("categories")
 
     if request.method == "POST":
-        """
-        As the recipe form for add recipe allows for a
-        dynamic amount of ingridients and steps, the below
-        loops through the ingridients/steps creating a string
-        split by the character " ~ " once edited.
-        """
-        # Empty strings
-        ingridients = ""
-        steps = ""
-
-        # For loop indexes
-        for_loop_idx_ing = 0
-        for_loop_idx_steps = 0
-
-        # Loops the keys and values of all request form items
-        # looking for the inputs starting with the specific values.
-        # It then combines these into a string seperated by ' ~ ',
-        for key, val in request.form.items():
-            if key.startswith("ingridients"):
-                if for_loop_idx_ing > 0:
-                    ingridients += " ~ " + val.lower()
-                    for_loop_idx_ing += 1
-                else:
-                    ingridients += val.lower()
-                    for_loop_idx_ing += 1
-            if key.startswith("steps"):
-                if for_loop_idx_steps > 0:
-                    steps += " ~ " + val.lower()
-                    for_loop_idx_steps += 1
-                else:
-                    steps += val.lower()
-                    for_loop_idx_steps += 1
+        # Keeps the current category to update the cached counts
+        old_category = recipe["category"]
+
+        # Gets the dynamic ingridient and step inputs as lists, with
+        # each ingridient split into its name and quantity
+        ingridients = [
+            parse_ingredient(text) for text in get_form_list("ingridients")]
+        steps = get_form_list("steps")
+
+        # Creates the display ready lists for the recipe page
+        formatted = format_recipe_lists(
+            {"ingridients": ingridients, "steps": steps})
 
         # Creates the variables to be updated, it uses $set to only
         # update these variables and not delete created_by and created.
-        recipe = {'$set': {
+        # The recipe's version is bumped for its page's ETag.
+        recipe = {'$inc': {"version": 1}, '$set': {
             "name": request.form.get("recipename").lower(),
             "category": request.form.get("category").lower(),
             "description": request.form.get("recipedesc").lower(),
@@ -1145,18 +3319,32 @@ def edit_recipe(recipe_id):
             "prep_time": request.form.get("preptime"),
             "image_url": request.form.get("imageurl").lower(),
             "ingridients": ingridients,
-            "steps": steps
+            "steps": steps,
+            "formatted_ingridients": formatted["formatted_ingridients"],
+            "formatted_steps": formatted["formatted_steps"]
         }}
 
         mongo.db.recipes.update_one({"_id": ObjectId(recipe_id)}, recipe)
+        record_change("recipes", recipe_id)
+        index_recipe(ObjectId(recipe_id), recipe["$set"])
+        invalidate_search_cache()
+
+        # Moves the recipe between the cached category counts
+        new_category = recipe["$set"]["category"]
+        if new_category != old_category:
+            adjust_count("recipes", old_category, -1)
+            adjust_count("recipes", new_category, 1)
+
         flash("Recipe Updated Successfully", "success")
         return redirect(url_for('profile', username=session["user"]))
 
+    recipe_lists = get_recipe_lists(recipe)
+
     context = {
         "categories": categories,
         "recipe": recipe,
-        "recipe_steps": recipe_steps,
-        "recipe_ings": recipe_ings
+        "recipe_steps": recipe_lists["steps"],
+        "recipe_ings": recipe_lists["ingridients"]
     }
 
     return render_template("edit-recipe.html", **context)
@@ -1168,10 +3356,11 @@ def add_product():
     """add_product: \n
     * This function renders the add-product.html template. \n
     * The function checks if the request method is 'POST'. \n
-    * It then enters the input information into MongoDB. \n
+    * It then enters the input information into MongoDB and adds the
+        product to the cached product counts. \n
     * If successful it redirects the user to the admin page, whilst
         also showing a toast. \n
-    * It gets all product categories from the database, to be passed
+    * It gets all product categories from the category cache, to be passed
         to the template to create a strict input for product category. \n
     \n
     \n Returns: \n
@@ -1190,10 +3379,12 @@ def add_product():
         }
 
         mongo.db.products.insert_one(product)
+        record_change("products")
+        adjust_count("products", product["category"], 1)
         flash("Product Successfully Added", "success")
         return redirect(url_for('admin', username=session["user"]))
 
-    categories = mongo.db.product_categories.find().sort("category", 1)
+    categories = get_categories("product_categories")
 
     context = {
         "categories": categories,
@@ -1213,6 +3404,8 @@ def edit_product(product_id):
         on the edit form.\n
     * The function checks if the request method is 'POST'. \n
     * It then updates the databse with the new values.\n
+    * If the category has changed, the cached product counts are
+        updated.\n
     \n
     \n Args: \n
     * product_id (str): A id of the obj to be edited from the
@@ -1225,11 +3418,15 @@ def edit_product(product_id):
     * It redirects the user back to the admin page if request
         method is 'POST' and the product has been edited. \n
     """
-    product = mongo.db.products.find_one({"_id": ObjectId(product_id)})
+    product = mongo.db.products.find_one(
+        {"_id": ObjectId(product_id)}, PRODUCT_FIELDS)
 
-    categories = mongo.db.product_categories.find().sort("category", 1)
+    categories = get_categories("product_categories")
 
     if request.method == "POST":
+        # Keeps the current category to update the cached counts
+        old_category = product["category"]
+
         product = {'$set': {
             "name": request.form.get("productname").lower(),
             "category": request.form.get("category").lower(),
@@ -1239,6 +3436,14 @@ def edit_product(product_id):
         }}
 
         mongo.db.products.update_one({"_id": ObjectId(product_id)}, product)
+        record_change("products")
+
+        # Moves the product between the cached category counts
+        new_category = product["$set"]["category"]
+        if new_category != old_category:
+            adjust_count("products", old_category, -1)
+            adjust_count("products", new_category, 1)
+
         flash("Product Updated Successfully", "success")
         return redirect(url_for('admin', username=session["user"]))
 
@@ -1251,17 +3456,18 @@ def edit_product(product_id):
 
 
 @app.route("/recipe/<recipe_id>")
+@cache_page("recipes:{recipe_id}")
 def view_recipe(recipe_id):
     """view_recipe: \n
     * This function renders the view-recipe.html template. \n
     * Gets the recipe from the database using the recipe_id from
         the args. \n
-    * As the steps and ingridients are both combined strings split
-        by ' ~ '. The strings are split down again to form lists
-        of individual ingridients and steps.
-    * To capitalize the start of each sentence in steps, further
-        for loops are used to capitalize and then re join the
-        individual sentences together.
+    * If the browser already has the page, it is asked for only the
+        recipe's version, and if that is unchanged a 304 is returned. \n
+    * The display ready ingridients and steps are saved with the
+        recipe when it is added or edited, so they are passed straight
+        to the template. Recipes saved before this are formatted on
+        view until they are backfilled.
     \n
     \n Args: \n
     * recipe_id (str): A id of the obj to be edited from the
@@ -1269,32 +3475,78 @@ def view_recipe(recipe_id):
     \n
     \n Returns: \n
     * It renders the view-recipe.html \n
-    * It passes the recipe variable and two split lists to the
-        template. \n
+    * It passes the recipe variable and the two display ready lists
+        to the template. \n
     """
-
-    recipe = mongo.db.recipes.find_one({"_id": ObjectId(recipe_id)})
-    recipe_ings = recipe["ingridients"].split(" ~ ")
-    recipe_steps = recipe["steps"].split(" ~ ")
-
-    # The below is used to capitalize the first letter of each sentence
-    recipe_steps_formatted = []
-    for step in recipe_steps:
-        split = step.split(". ")
-        string = []
-        for step in split:
-            sentence = str(step[0].upper() + step[1:] + ".")
-            if sentence[-2:] == ('..'):
-                sentence = sentence[:-1]
-            string.append(sentence)
-        recipe_steps_formatted.append(str(" ".join(string)))
+    # Answers a browser that already has this version of the recipe
+    if request.if_none_match:
+        stamp = mongo.db.recipes.find_one(
+            {"_id": ObjectId(recipe_id)}, {"version": 1})
+        if stamp:
+            etag = make_etag((), recipe_id, stamp.get("version", 0))
+            if is_not_modified(etag):
+                return etag_response("", etag, 304)
+
+    recipe = mongo.db.recipes.find_one(
+        {"_id": ObjectId(recipe_id)}, RECIPE_DETAIL_FIELDS)
+
+    # Recipes not yet backfilled by 'flask migrate-recipes' are
+    # formatted here
+    if "formatted_steps" not in recipe:
+        source = mongo.db.recipes.find_one(
+            {"_id": recipe["_id"]}, {"ingridients": 1, "steps": 1})
+        recipe.update(format_recipe_lists(get_recipe_lists(source)))
 
     context = {
         "recipe": recipe,
-        "recipe_steps": recipe_steps_formatted,
-        "recipe_ings": recipe_ings
+        "recipe_steps": recipe["formatted_steps"],
+        "recipe_ings": recipe["formatted_ingridients"]
     }
-    return render_template("view-recipe.html", **context)
+    etag = make_etag((), recipe_id, recipe.get("version", 0))
+    return etag_response(
+        render_template("view-recipe.html", **context), etag)
+
+
+@app.route("/img/<document_id>/<int:width>")
+def thumbnail(document_id, width):
+    """thumbnail: \n
+    * This function sends the thumbnail of a recipe or product image
+        (see get_thumbnail), to be cached by the browser for good. \n
+    * If the image can not be fetched, or is not fetched in time, it
+        redirects to the default recipe or product image instead. \n
+    \n
+    \n Args: \n
+    * document_id (str): The id of the recipe or product. \n
+    * width (int): One of THUMBNAIL_WIDTHS. \n
+    \n
+    \n Returns: \n
+    * It returns the thumbnail, a redirect to the default image or a
+        404 if there is no such recipe or product. \n
+    """
+    if width not in THUMBNAIL_WIDTHS or not ObjectId.is_valid(document_id):
+        return "", 404
+
+    default = "media/images/default.jpg"
+    document = mongo.db.recipes.find_one(
+        {"_id": ObjectId(document_id)}, {"image_url": 1})
+    if document is None:
+        default = "media/images/default_product.jpg"
+        document = mongo.db.products.find_one(
+            {"_id": ObjectId(document_id)}, {"image_url": 1})
+    if document is None:
+        return "", 404
+
+    data = None
+    if Image is not None and document.get("image_url"):
+        data = get_thumbnail(document["image_url"], width)
+    if data is None:
+        return redirect(sized_image_url(default, width))
+
+    response = send_file(
+        io.BytesIO(data), mimetype="image/jpeg", conditional=True)
+    response.headers["Cache-Control"] = (
+        "public, max-age={}, immutable".format(STATIC_MAX_AGE))
+    return response
 
 
 @app.route("/delete-category/<category_id>")
@@ -1312,6 +3564,8 @@ def delete_category(category_id):
     * It shows a toast to indicate the category has been deleted \n
     """
     mongo.db.categories.remove({"_id": ObjectId(category_id)})
+    invalidate_categories("categories")
+    record_change("categories")
     flash("Category Successfully Deleted", "success")
     return redirect(url_for("admin", username=session['user']))
 
@@ -1331,6 +3585,8 @@ def delete_product_category(category_id):
     * It shows a toast to indicate the product category has been deleted \n
     """
     mongo.db.product_categories.remove({"_id": ObjectId(category_id)})
+    invalidate_categories("product_categories")
+    record_change("product_categories")
     flash("Category Successfully Deleted", "success")
     return redirect(url_for("admin", username=session['user']))
 
@@ -1339,7 +3595,8 @@ def delete_product_category(category_id):
 @is_admin
 def delete_product(product_id):
     """delete_product: \n
-    * This function deletes a selected product. \n
+    * This function deletes a selected product and removes it from
+        the cached product counts. \n
     \n
     \n Args: \n
     * product_id (str): A id of the obj to be deleted from the
@@ -1349,7 +3606,11 @@ def delete_product(product_id):
     * It redirects the user back to the admin page \n
     * It shows a toast to indicate the product has been deleted \n
     """
-    mongo.db.products.remove({"_id": ObjectId(product_id)})
+    product = mongo.db.products.find_one_and_delete(
+        {"_id": ObjectId(product_id)}, projection={"category": 1})
+    if product:
+        adjust_count("products", product.get("category"), -1)
+        record_change("products")
     flash("Product Successfully Deleted", "success")
     return redirect(url_for("admin", username=session['user']))
 
@@ -1358,7 +3619,9 @@ def delete_product(product_id):
 @login_required
 def delete_recipe(recipe_id):
     """delete_recipe: \n
-    * This function deletes a selected recipe. \n
+    * This function deletes a selected recipe and removes it from
+        the cached recipe counts and recipe indexes, clearing the
+        search cache. \n
     \n
     \n Args: \n
     * recipe_id (str): A id of the obj to be deleted from the
@@ -1368,7 +3631,13 @@ def delete_recipe(recipe_id):
     * It redirects the user back to the profile page \n
     * It shows a toast to indicate the recipe has been deleted \n
     """
-    mongo.db.recipes.remove({"_id": ObjectId(recipe_id)})
+    recipe = mongo.db.recipes.find_one_and_delete(
+        {"_id": ObjectId(recipe_id)}, projection={"category": 1})
+    if recipe:
+        adjust_count("recipes", recipe.get("category"), -1)
+        record_change("recipes", recipe_id)
+        index_recipe(recipe["_id"])
+        invalidate_search_cache()
     flash("Recipe Successfully Deleted", "success")
     return redirect(url_for("profile", username=session['user']))
 
@@ -1399,6 +3668,1575 @@ def context_processor():
     }
 
 
+def load_static_manifest():
+    """load_static_manifest: \n
+    * This function reads the manifest written by 'flask build-static'
+        into static_build, along with a hash of it. Without a manifest
+        the static files are linked to and served as they are. \n
+    """
+    path = os.path.join(
+        app.static_folder, STATIC_BUILD_DIR, "manifest.json")
+    try:
+        with open(path, "rb") as manifest_file:
+            data = manifest_file.read()
+        static_build["manifest"] = json.loads(data.decode())
+        static_build["version"] = hashlib.md5(data).hexdigest()
+    except (OSError, ValueError):
+        static_build["manifest"] = {}
+        static_build["version"] = ""
+    static_build["files"] = set(static_build["manifest"].values())
+
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    """fingerprint_static_url: \n
+    * This function is called by url_for, swapping the filename of a
+        static file for its hashed copy if there is one in the
+        manifest. \n
+    \n
+    \n Args: \n
+    * endpoint (str): The endpoint the url is for. \n
+    * values (dict): The url's arguments, changed in place. \n
+    """
+    if endpoint == "static":
+        hashed = static_build["manifest"].get(values.get("filename"))
+        if hashed:
+            values["filename"] = hashed
+
+
+def send_static(filename):
+    """send_static: \n
+    * This function replaces Flask's view for the static folder. \n
+    * The hashed copies in the manifest written by 'flask build-static'
+        never change, so they are sent with long lived, immutable
+        caching headers. The brotli or gzip version is sent instead if
+        the browser accepts it. \n
+    * Any other static file, including the manifest itself and copies
+        left from an earlier build, is sent by Flask as before. \n
+    \n
+    \n Args: \n
+    * filename (str): The path of the file in the static folder. \n
+    \n
+    \n Returns: \n
+    * It returns the file response. \n
+    """
+    if filename not in static_build["files"]:
+        return app.send_static_file(filename)
+
+    mimetype = mimetypes.guess_type(filename)[0]
+    response = None
+    for encoding, suffix in STATIC_ENCODINGS:
+        path = os.path.join(app.static_folder, filename + suffix)
+        if request.accept_encodings[encoding] and os.path.isfile(path):
+            response = send_from_directory(
+                app.static_folder, filename + suffix, mimetype=mimetype)
+            response.headers["Content-Encoding"] = encoding
+            break
+
+    if response is None:
+        response = app.send_static_file(filename)
+
+    response.headers["Cache-Control"] = (
+        "public, max-age={}, immutable".format(STATIC_MAX_AGE))
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+app.view_functions["static"] = send_static
+
+
+def build_static():
+    """build_static: \n
+    * This function writes a copy of every stylesheet and script in the
+        static folder to STATIC_BUILD_DIR, named with a hash of its
+        contents, e.g. 'dist/css/style.1a2b3c4d5e.css'. \n
+    * A gzip version of each copy is written next to it, and a brotli
+        version if the 'brotli' package is installed, whenever they are
+        smaller. \n
+    * Any previous build is removed first, then the manifest of
+        original to hashed names is written. \n
+    \n
+    \n Returns: \n
+    * It returns the manifest dict. \n
+    """
+    build_dir = os.path.join(app.static_folder, STATIC_BUILD_DIR)
+    shutil.rmtree(build_dir, ignore_errors=True)
+
+    manifest = {}
+    for folder, folders, names in os.walk(app.static_folder):
+        if folder == app.static_folder and STATIC_BUILD_DIR in folders:
+            folders.remove(STATIC_BUILD_DIR)
+        for name in sorted(names):
+            base, extension = os.path.splitext(name)
+            if extension not in STATIC_BUILD_EXTENSIONS:
+                continue
+
+            with open(os.path.join(folder, name), "rb") as static_file:
+                data = static_file.read()
+            digest = hashlib.md5(data).hexdigest()[:10]
+
+            filename = os.path.relpath(
+                os.path.join(folder, name), app.static_folder)
+            filename = filename.replace(os.sep, "/")
+            hashed = "{}/{}.{}{}".format(
+                STATIC_BUILD_DIR,
+                os.path.splitext(filename)[0], digest, extension)
+
+            path = os.path.join(app.static_folder, hashed)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            variants = {"": data, ".gz": gzip.compress(data, 9)}
+            if brotli is not None:
+                variants[".br"] = brotli.compress(data)
+            for suffix, variant in variants.items():
+                if suffix and len(variant) >= len(data):
+                    continue
+                with open(path + suffix, "wb") as build_file:
+                    build_file.write(variant)
+
+            manifest[filename] = hashed
+
+    path = os.path.join(build_dir, "manifest.json")
+    os.makedirs(build_dir, exist_ok=True)
+    with open(path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_image_manifest():
+    """load_image_manifest: \n
+    * This function reads the manifest written by 'flask build-images'
+        into image_build, along with a hash of it. Without a manifest
+        the images are used as they are. \n
+    """
+    path = os.path.join(app.static_folder, IMAGE_BUILD_DIR, "manifest.json")
+    try:
+        with open(path, "rb") as manifest_file:
+            data = manifest_file.read()
+        image_build["manifest"] = json.loads(data.decode())
+        image_build["version"] = hashlib.md5(data).hexdigest()
+    except (OSError, ValueError):
+        image_build["manifest"] = {}
+        image_build["version"] = ""
+
+
+def sized_image_name(filename, width, extension):
+    """sized_image_name: \n
+    * This function returns the static filename of a resized copy of an
+        image, e.g. 'media/images/sized/recipes-960.webp'. \n
+    \n
+    \n Args: \n
+    * filename (str): The image's static filename. \n
+    * width (int): The width of the copy. \n
+    * extension (str): Either 'jpg' or 'webp'. \n
+    \n
+    \n Returns: \n
+    * It returns the filename. \n
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return "{}/{}-{}.{}".format(IMAGE_BUILD_DIR, name, width, extension)
+
+
+def image_srcset(filename, extension="jpg"):
+    """image_srcset: \n
+    * This template helper returns the 'srcset' of an image's resized
+        copies, for the browser to pick the smallest that fills the
+        space given by 'sizes'. \n
+    \n
+    \n Args: \n
+    * filename (str): The image's static filename. \n
+    * extension (str): Either 'jpg' or 'webp'. \n
+    \n
+    \n Returns: \n
+    * It returns the srcset, or '' if the image has no copies. \n
+    """
+    return ", ".join(
+        "{} {}w".format(url_for(
+            "static", filename=sized_image_name(filename, width, extension)),
+            width)
+        for width in image_build["manifest"].get(filename, ()))
+
+
+def sized_image_url(filename, width):
+    """sized_image_url: \n
+    * This template helper returns the url of the narrowest JPEG copy of
+        an image at least as wide as asked for, or the widest copy. It is
+        used where a srcset can not be, such as the fallback image for a
+        card whose own image does not load. \n
+    \n
+    \n Args: \n
+    * filename (str): The image's static filename. \n
+    * width (int): The width the image is shown at. \n
+    \n
+    \n Returns: \n
+    * It returns the url, or the original image's url if it has no
+        copies. \n
+    """
+    size = sized_image_width(filename, width)
+    if size is None:
+        return url_for("static", filename=filename)
+    return url_for(
+        "static", filename=sized_image_name(filename, size, "jpg"))
+
+
+def sized_image_width(filename, width):
+    """sized_image_width: \n
+    * This function returns the width of the narrowest copy of an image
+        at least as wide as asked for, or the widest copy. \n
+    \n
+    \n Args: \n
+    * filename (str): The image's static filename. \n
+    * width (int): The width the image is shown at. \n
+    \n
+    \n Returns: \n
+    * It returns the width, or None if the image has no copies. \n
+    """
+    widths = image_build["manifest"].get(filename)
+    if not widths:
+        return None
+
+    wide_enough = [size for size in widths if size >= width]
+    return min(wide_enough) if wide_enough else max(widths)
+
+
+def image_set(filename, width):
+    """image_set: \n
+    * This template helper returns a CSS 'image-set()' of the WebP and
+        JPEG copies of an image picked as by sized_image_url, for a
+        background image. \n
+    \n
+    \n Args: \n
+    * filename (str): The image's static filename. \n
+    * width (int): The width the image is shown at. \n
+    \n
+    \n Returns: \n
+    * It returns the image-set, or '' if the image has no copies. \n
+    """
+    size = sized_image_width(filename, width)
+    if size is None:
+        return ""
+    return ('image-set(url("{}") type("image/webp"), '
+            'url("{}") type("image/jpeg"))').format(
+        url_for("static", filename=sized_image_name(filename, size, "webp")),
+        url_for("static", filename=sized_image_name(filename, size, "jpg")))
+
+
+app.add_template_global(image_srcset)
+app.add_template_global(sized_image_url)
+app.add_template_global(image_set)
+
+
+def thumbnail_url(document, width):
+    """thumbnail_url: \n
+    * This template helper returns the url of a recipe or product
+        image's thumbnail. A hash of the image url is added so the
+        thumbnail can be cached for good, as a new image gets a new
+        url. \n
+    \n
+    \n Args: \n
+    * document (dict): The recipe or product, with its '_id' and
+        'image_url'. \n
+    * width (int): One of THUMBNAIL_WIDTHS. \n
+    \n
+    \n Returns: \n
+    * It returns the url. \n
+    """
+    image_url = document.get("image_url") or ""
+    return url_for(
+        "thumbnail", document_id=str(document["_id"]), width=width,
+        v=hashlib.md5(image_url.encode()).hexdigest()[:8])
+
+
+def thumbnail_srcset(document):
+    """thumbnail_srcset: \n
+    * This template helper returns the 'srcset' of a recipe or product
+        image's thumbnails. \n
+    \n
+    \n Args: \n
+    * document (dict): The recipe or product. \n
+    \n
+    \n Returns: \n
+    * It returns the srcset. \n
+    """
+    return ", ".join(
+        "{} {}w".format(thumbnail_url(document, width), width)
+        for width in THUMBNAIL_WIDTHS)
+
+
+app.add_template_global(thumbnail_url)
+app.add_template_global(thumbnail_srcset)
+
+
+class PinnedHTTPConnection(HTTPConnection):
+    """An HTTP connection to an address already checked by
+    resolve_public_url, rather than to whatever the host name resolves
+    to when connecting. The Host header is still the host name."""
+
+    def __init__(self, host, address, port=None, timeout=None):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection(
+            (self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(HTTPSConnection):
+    """An HTTPS connection to an address already checked by
+    resolve_public_url. The certificate is still verified against the
+    host name."""
+
+    def __init__(self, host, address, port=None, timeout=None):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+        self.pinned_context = ssl.create_default_context()
+
+    def connect(self):
+        sock = socket.create_connection(
+            (self.address, self.port), self.timeout)
+        self.sock = self.pinned_context.wrap_socket(
+            sock, server_hostname=self.host)
+
+
+def resolve_public_url(url):
+    """resolve_public_url: \n
+    * This function checks an image url is http(s) and that its host
+        is not on a private network, so users can not have the app
+        fetch from the servers around it. \n
+    * The image is then fetched from the address checked here, so a
+        host name that resolves to a different address the second time
+        (DNS rebinding) can not get past the check. \n
+    \n
+    \n Args: \n
+    * url (str): The image url. \n
+    \n
+    \n Returns: \n
+    * It returns the address to fetch the url from, or None if the url
+        may not be fetched. \n
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return None
+
+    try:
+        addresses = socket.getaddrinfo(
+            parts.hostname, parts.port or None, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError, ValueError):
+        return None
+    addresses = [address[4][0].split("%")[0] for address in addresses]
+    if not addresses:
+        return None
+    if not THUMBNAIL_ALLOW_PRIVATE and not all(
+            ipaddress.ip_address(address).is_global
+            for address in addresses):
+        return None
+    return addresses[0]
+
+
+def fetch_image(url):
+    """fetch_image: \n
+    * This function fetches a remote image, following up to
+        THUMBNAIL_MAX_REDIRECTS redirects to public urls, giving up after
+        THUMBNAIL_FETCH_TIMEOUT seconds or once more than
+        THUMBNAIL_MAX_SOURCE_BYTES have been read. \n
+    * Each url is fetched from the address checked by
+        resolve_public_url. \n
+    \n
+    \n Args: \n
+    * url (str): The image url. \n
+    \n
+    \n Returns: \n
+    * It returns the image's bytes, or None if it could not be
+        fetched. \n
+    """
+    for hop in range(THUMBNAIL_MAX_REDIRECTS + 1):
+        address = resolve_public_url(url)
+        if address is None:
+            return None
+
+        parts = urlsplit(url)
+        if parts.scheme == "https":
+            connection_class = PinnedHTTPSConnection
+        else:
+            connection_class = PinnedHTTPConnection
+        connection = connection_class(
+            parts.hostname, address, parts.port,
+            timeout=THUMBNAIL_FETCH_TIMEOUT)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        try:
+            connection.request(
+                "GET", path, headers={"User-Agent": "thumbnailer"})
+            response = connection.getresponse()
+            location = response.getheader("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            if response.status != 200:
+                return None
+            data = response.read(THUMBNAIL_MAX_SOURCE_BYTES + 1)
+        except (HTTPException, OSError, ValueError):
+            return None
+        finally:
+            connection.close()
+
+        if len(data) > THUMBNAIL_MAX_SOURCE_BYTES:
+            return None
+        return data
+    return None
+
+
+def resize_image(data):
+    """resize_image: \n
+    * This function resizes a fetched image to each of THUMBNAIL_WIDTHS
+        narrower than it (or its own width if it is narrower than all of
+        them), as progressive JPEGs. \n
+    \n
+    \n Args: \n
+    * data (bytes): The fetched image. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of width to JPEG bytes, or None if the data is
+        not an image. \n
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # Lets JPEGs be decoded at a smaller scale when large
+            image.draft("RGB", (max(THUMBNAIL_WIDTHS),) * 2)
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            thumbnails = {}
+            for width in THUMBNAIL_WIDTHS:
+                size = min(width, image.width)
+                height = max(round(image.height * size / image.width), 1)
+                resized = image.resize((size, height), Image.LANCZOS)
+                output = io.BytesIO()
+                resized.save(
+                    output, "JPEG", quality=IMAGE_QUALITY, optimize=True,
+                    progressive=True)
+                thumbnails[width] = output.getvalue()
+            return thumbnails
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def thumbnail_name(image_url, width):
+    """thumbnail_name: \n
+    * This function returns the file name of a thumbnail, from a hash of
+        the image url so a changed image gets a new thumbnail. \n
+    \n
+    \n Args: \n
+    * image_url (str): The image url. \n
+    * width (int): The thumbnail width. \n
+    \n
+    \n Returns: \n
+    * It returns the file name. \n
+    """
+    digest = hashlib.sha1(image_url.encode()).hexdigest()
+    return "{}-{}.jpg".format(digest, width)
+
+
+def load_thumbnail_cache():
+    """load_thumbnail_cache: \n
+    * This function fills the thumbnail cache's index from the files in
+        THUMBNAIL_CACHE_DIR, least recently used first, the first time
+        it is needed. Must be called whilst holding thumbnail_lock. \n
+    """
+    if thumbnail_cache_state["loaded"]:
+        return
+    thumbnail_cache_state["loaded"] = True
+
+    try:
+        entries = list(os.scandir(THUMBNAIL_CACHE_DIR))
+    except OSError:
+        return
+
+    files = []
+    for entry in entries:
+        if entry.name.endswith(".jpg"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+
+    for mtime, name, size in sorted(files):
+        thumbnail_cache[name] = size
+        thumbnail_cache_state["bytes"] += size
+
+
+def get_cached_thumbnail(name):
+    """get_cached_thumbnail: \n
+    * This function reads a cached thumbnail, marking it as the most
+        recently used. \n
+    * The file is opened whilst holding thumbnail_lock, so it can not
+        be removed by store_thumbnails before it has been read. \n
+    \n
+    \n Args: \n
+    * name (str): The thumbnail's file name. \n
+    \n
+    \n Returns: \n
+    * It returns the thumbnail's bytes, or None if it is not cached. \n
+    """
+    path = os.path.join(THUMBNAIL_CACHE_DIR, name)
+    with thumbnail_lock:
+        load_thumbnail_cache()
+        if name not in thumbnail_cache:
+            return None
+        try:
+            thumbnail_file = open(path, "rb")
+        except OSError:
+            size = thumbnail_cache.pop(name)
+            thumbnail_cache_state["bytes"] -= size
+            return None
+        thumbnail_cache.move_to_end(name)
+
+    with thumbnail_file:
+        data = thumbnail_file.read()
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def store_thumbnails(image_url, thumbnails):
+    """store_thumbnails: \n
+    * This function writes an image's thumbnails to the cache, then
+        removes the least recently used thumbnails until the cache fits
+        in THUMBNAIL_CACHE_MAX_BYTES. \n
+    \n
+    \n Args: \n
+    * image_url (str): The image url. \n
+    * thumbnails (dict): Width to JPEG bytes (see resize_image). \n
+    """
+    os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+    for width, data in thumbnails.items():
+        name = thumbnail_name(image_url, width)
+        path = os.path.join(THUMBNAIL_CACHE_DIR, name)
+        temp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(temp_path, "wb") as thumbnail_file:
+            thumbnail_file.write(data)
+        os.replace(temp_path, path)
+
+        with thumbnail_lock:
+            load_thumbnail_cache()
+            thumbnail_cache_state["bytes"] += (
+                len(data) - thumbnail_cache.pop(name, 0))
+            thumbnail_cache[name] = len(data)
+
+    with thumbnail_lock:
+        while (thumbnail_cache_state["bytes"] > THUMBNAIL_CACHE_MAX_BYTES
+               and len(thumbnail_cache) > len(thumbnails)):
+            name, size = thumbnail_cache.popitem(last=False)
+            thumbnail_cache_state["bytes"] -= size
+            try:
+                os.remove(os.path.join(THUMBNAIL_CACHE_DIR, name))
+            except OSError:
+                pass
+
+
+def fetch_thumbnails(image_url, fetch):
+    """fetch_thumbnails: \n
+    * This function fetches and resizes an image in the background and
+        caches its thumbnails. An image that could not be fetched is not
+        tried again for THUMBNAIL_FAILURE_TTL seconds. \n
+    * Once done, it frees the fetch slot taken for it (see
+        get_thumbnail) and sets the fetch's event. \n
+    \n
+    \n Args: \n
+    * image_url (str): The image url. \n
+    * fetch (Event): Set once the image's thumbnails are cached or it
+        has failed. \n
+    """
+    try:
+        data = fetch_image(image_url)
+        thumbnails = resize_image(data) if data is not None else None
+        if thumbnails:
+            store_thumbnails(image_url, thumbnails)
+        else:
+            with thumbnail_lock:
+                thumbnail_failures[image_url] = (
+                    time.monotonic() + THUMBNAIL_FAILURE_TTL)
+    except OSError as error:
+        app.logger.warning("Unable to cache thumbnail: %s", error)
+    finally:
+        thumbnail_fetch_slots.release()
+        with thumbnail_lock:
+            del thumbnail_fetches[image_url]
+        fetch.set()
+
+
+def get_thumbnail(image_url, width):
+    """get_thumbnail: \n
+    * This function returns an image's thumbnail, fetching and resizing
+        the image in the background if it is not cached (see
+        fetch_thumbnails). \n
+    * Only one fetch of an image runs at a time; any other requests for
+        it wait for that fetch. At most THUMBNAIL_FETCH_CONCURRENCY
+        images are fetched at once, and an image is not fetched at all
+        while they are all busy, rather than queueing. Requests wait at
+        most THUMBNAIL_WAIT seconds, leaving a slower fetch to finish
+        for the next request. \n
+    \n
+    \n Args: \n
+    * image_url (str): The image url. \n
+    * width (int): One of THUMBNAIL_WIDTHS. \n
+    \n
+    \n Returns: \n
+    * It returns the thumbnail's bytes, or None if the image could not
+        be fetched, is not an image, is still being fetched or the
+        fetches are all busy. \n
+    """
+    name = thumbnail_name(image_url, width)
+    data = get_cached_thumbnail(name)
+    if data is not None:
+        return data
+
+    with thumbnail_lock:
+        if thumbnail_failures.get(image_url, 0) > time.monotonic():
+            return None
+        fetch = thumbnail_fetches.get(image_url)
+        is_fetching = fetch is None
+        if is_fetching:
+            if not thumbnail_fetch_slots.acquire(blocking=False):
+                return None
+            fetch = thumbnail_fetches[image_url] = threading.Event()
+
+    if is_fetching:
+        threading.Thread(
+            target=fetch_thumbnails, args=(image_url, fetch),
+            name="thumbnail-fetch", daemon=True).start()
+
+    if not fetch.wait(THUMBNAIL_WAIT):
+        return None
+    return get_cached_thumbnail(name)
+
+
+def build_images():
+    """build_images: \n
+    * This function writes the resized copies of every JPEG image in
+        IMAGE_FOLDER to IMAGE_BUILD_DIR, as JPEG and WebP, for each of
+        IMAGE_WIDTHS narrower than the image. An image narrower than all
+        of them gets a single copy at its own width. \n
+    * Images are turned upright from their EXIF orientation, the copies
+        are saved with IMAGE_QUALITY, the JPEG copies as progressive
+        JPEGs, and the manifest of widths is written. \n
+    \n
+    \n Returns: \n
+    * It returns the manifest dict. \n
+    """
+    image_folder = os.path.join(app.static_folder, IMAGE_FOLDER)
+    build_dir = os.path.join(app.static_folder, IMAGE_BUILD_DIR)
+    os.makedirs(build_dir, exist_ok=True)
+
+    manifest = {}
+    for name in sorted(os.listdir(image_folder)):
+        if os.path.splitext(name)[1].lower() not in (".jpg", ".jpeg"):
+            continue
+
+        filename = "{}/{}".format(IMAGE_FOLDER, name)
+        with Image.open(os.path.join(image_folder, name)) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            widths = [
+                width for width in IMAGE_WIDTHS if width < image.width]
+            if not widths:
+                widths = [image.width]
+
+            for width in widths:
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), Image.LANCZOS)
+                for extension, image_format in IMAGE_FORMATS:
+                    path = os.path.join(
+                        app.static_folder,
+                        sized_image_name(filename, width, extension))
+                    resized.save(
+                        path, image_format, quality=IMAGE_QUALITY,
+                        optimize=True, progressive=True)
+
+        manifest[filename] = widths
+
+    path = os.path.join(build_dir, "manifest.json")
+    with open(path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_video_manifest():
+    """load_video_manifest: \n
+    * This function reads the manifest written by 'flask build-video'
+        into video_build, along with a hash of it and the posters and
+        copies it lists, the only files the video route sends. Without
+        a manifest the videos are used as they are. \n
+    """
+    path = os.path.join(app.static_folder, VIDEO_BUILD_DIR, "manifest.json")
+    try:
+        with open(path, "rb") as manifest_file:
+            data = manifest_file.read()
+        manifest = json.loads(data.decode())
+        files = set()
+        for built in manifest.values():
+            files.add(built["poster"])
+            files.update(variant["file"] for variant in built["variants"])
+    except (OSError, ValueError, KeyError, TypeError):
+        manifest = {}
+        files = set()
+        data = b""
+    video_build["manifest"] = manifest
+    video_build["version"] = hashlib.md5(data).hexdigest() if data else ""
+    video_build["files"] = files
+
+
+def hero_video(filename):
+    """hero_video: \n
+    * This template helper returns the poster and copies of a video
+        written by 'flask build-video', for the page to show the poster
+        first and pick a copy once it has loaded. \n
+    \n
+    \n Args: \n
+    * filename (str): The video's static filename. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the 'poster' url and the 'variants', each
+        with its 'src', 'height' and 'bitrate', smallest first, or None
+        if the video has not been built. \n
+    """
+    built = video_build["manifest"].get(filename)
+    if not built:
+        return None
+
+    return {
+        "poster": url_for("video", filename=built["poster"]),
+        "variants": [
+            dict(variant, src=url_for("video", filename=variant["file"]))
+            for variant in built["variants"]
+        ]
+    }
+
+
+app.add_template_global(hero_video)
+
+
+@app.route("/video/<path:filename>")
+def video(filename):
+    """video: \n
+    * This function sends a poster or video copy written by 'flask
+        build-video'. Their names include a hash of their contents, so
+        they are cached for good. Only the files listed in the manifest
+        are sent. \n
+    * Range requests are answered with just the bytes asked for, so
+        browsers can start playing, and seek, before the whole video has
+        downloaded. \n
+    \n
+    \n Args: \n
+    * filename (str): The file's name in VIDEO_BUILD_DIR. \n
+    \n
+    \n Returns: \n
+    * It returns the file, or the part of it asked for, or a 404 if the
+        file is not a poster or copy in the manifest. \n
+    """
+    if filename not in video_build["files"]:
+        return "", 404
+
+    response = send_from_directory(
+        os.path.join(app.static_folder, VIDEO_BUILD_DIR), filename,
+        conditional=True)
+    response.headers["Accept-Ranges"] = "bytes"
+    response.headers["Cache-Control"] = (
+        "public, max-age={}, immutable".format(STATIC_MAX_AGE))
+    return response
+
+
+def run_ffmpeg(*args):
+    """run_ffmpeg: \n
+    * This function runs ffmpeg, or ffprobe, with the arguments given,
+        raising a click exception with its errors if it fails. \n
+    \n
+    \n Args: \n
+    * args (str): The program and its arguments. \n
+    \n
+    \n Returns: \n
+    * It returns what the program printed. \n
+    """
+    result = subprocess.run(
+        args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    if result.returncode:
+        raise click.ClickException(
+            "{} failed: {}".format(args[0], result.stderr.strip()))
+    return result.stdout
+
+
+def hash_build_file(path):
+    """hash_build_file: \n
+    * This function renames a file written by 'flask build-video' to
+        include a hash of its contents, e.g. 'smoke-720.1a2b3c4d5e.mp4'. \n
+    \n
+    \n Args: \n
+    * path (str): The path of the file. \n
+    \n
+    \n Returns: \n
+    * It returns the new file name. \n
+    """
+    digest = hashlib.md5()
+    with open(path, "rb") as build_file:
+        for chunk in iter(lambda: build_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+
+    base, extension = os.path.splitext(path)
+    hashed = "{}.{}{}".format(base, digest.hexdigest()[:10], extension)
+    os.replace(path, hashed)
+    return os.path.basename(hashed)
+
+
+def build_video():
+    """build_video: \n
+    * This function writes, for each MP4 video in VIDEO_FOLDER, a JPEG
+        poster of its first frame and a silent, H.264 copy at each of
+        VIDEO_VARIANTS no taller than the video (or one at its own
+        height if it is shorter than all of them). The copies are
+        written for fast start, so they play before fully loading. \n
+    * Any previous build is removed first, then the manifest is
+        written. \n
+    \n
+    \n Returns: \n
+    * It returns the manifest dict. \n
+    """
+    video_folder = os.path.join(app.static_folder, VIDEO_FOLDER)
+    build_dir = os.path.join(app.static_folder, VIDEO_BUILD_DIR)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    manifest = {}
+    for name in sorted(os.listdir(video_folder)):
+        base, extension = os.path.splitext(name)
+        if extension.lower() != ".mp4":
+            continue
+        source = os.path.join(video_folder, name)
+
+        poster = os.path.join(build_dir, base + "-poster.jpg")
+        run_ffmpeg(
+            "ffmpeg", "-y", "-loglevel", "error", "-i", source,
+            "-frames:v", "1", "-q:v", "4", poster)
+
+        height = int(run_ffmpeg(
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=height", "-of", "csv=p=0",
+            source).strip())
+        variants = [
+            variant for variant in VIDEO_VARIANTS if variant[0] <= height]
+        if not variants:
+            variants = [(height, VIDEO_VARIANTS[0][1])]
+
+        built = []
+        for variant_height, bitrate in variants:
+            path = os.path.join(
+                build_dir, "{}-{}.mp4".format(base, variant_height))
+            run_ffmpeg(
+                "ffmpeg", "-y", "-loglevel", "error", "-i", source, "-an",
+                "-vf", "scale=-2:{}".format(variant_height),
+                "-c:v", "libx264", "-preset", "slow", "-profile:v", "main",
+                "-pix_fmt", "yuv420p", "-b:v", bitrate, "-maxrate", bitrate,
+                "-bufsize", bitrate, "-movflags", "+faststart", path)
+            built.append({
+                "file": hash_build_file(path),
+                "height": variant_height,
+                "bitrate": int(bitrate.rstrip("k")) * 1000
+            })
+
+        manifest["{}/{}".format(VIDEO_FOLDER, name)] = {
+            "poster": hash_build_file(poster),
+            "variants": built
+        }
+
+    path = os.path.join(build_dir, "manifest.json")
+    with open(path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return manifest
+
+
+@app.before_first_request
+def count_categories():
+    """count_categories: \n
+    * This function starts counting the recipe and product categories
+        in the background when the first request arrives (see
+        get_category_counts). \n
+    """
+    with count_cache_lock:
+        start_category_count("recipes")
+        start_category_count("products")
+
+
+@app.before_first_request
+def build_recipe_index():
+    """build_recipe_index: \n
+    * This function starts building the recipe indexes in the
+        background when the first request arrives, so no request is
+        held up reading every recipe. Search box suggestions are empty
+        until the build has finished. \n
+    """
+    with recipe_index_lock:
+        start_recipe_index_build()
+
+
+def find_text_index(collection_name):
+    """find_text_index: \n
+    * This function finds the text index of a collection, if it has
+        one. \n
+    \n
+    \n Args: \n
+    * collection_name (str): The name of the collection. \n
+    \n
+    \n Returns: \n
+    * It returns the name of the text index, or None. \n
+    """
+    indexes = mongo.db[collection_name].index_information()
+    for name, index in indexes.items():
+        if any(key_type == TEXT for field, key_type in index["key"]):
+            return name
+    return None
+
+
+def ensure_indexes():
+    """ensure_indexes: \n
+    * This function creates every index in INDEXES. Creating an index
+        that already exists does nothing, so it is safe to run on
+        every deploy. \n
+    * A collection can only have one text index, so a text index is
+        skipped if the collection already has one, whatever its name
+        or fields. \n
+    * An index that cannot be created (such as a unique index on a
+        field with duplicates) is reported and the others are still
+        created. \n
+    \n
+    \n Returns: \n
+    * It returns a list of (collection name, index name, error)
+        tuples, where error is None if the index was created. \n
+    """
+    results = []
+    for collection_name, keys, options in INDEXES:
+        try:
+            if any(key_type == TEXT for field, key_type in keys):
+                name = find_text_index(collection_name)
+                if name is not None:
+                    results.append((collection_name, name, None))
+                    continue
+            name = mongo.db[collection_name].create_index(keys, **options)
+            results.append((collection_name, name, None))
+        except OperationFailure as error:
+            name = "_".join("{}_{}".format(*key) for key in keys)
+            results.append((collection_name, name, str(error)))
+    return results
+
+
+def find_collection_scans(plan):
+    """find_collection_scans: \n
+    * This function walks an 'explain' query plan and checks if any
+        of its stages read the whole collection. \n
+    \n
+    \n Args: \n
+    * plan (dict): The winning plan from 'explain'. \n
+    \n
+    \n Returns: \n
+    * It returns True if the plan has a 'COLLSCAN' stage. \n
+    """
+    if plan.get("stage") == "COLLSCAN":
+        return True
+    stages = list(plan.get("inputStages", []))
+    if "inputStage" in plan:
+        stages.append(plan["inputStage"])
+    return any(find_collection_scans(stage) for stage in stages)
+
+
+def check_query_plans():
+    """check_query_plans: \n
+    * This function asks MongoDB to 'explain' each query in HOT_QUERIES
+        and logs a warning for any that would scan the whole collection
+        or that fail (such as a search without a text index). \n
+    \n
+    \n Returns: \n
+    * It returns a list of the labels of the queries warned about. \n
+    """
+    warnings = []
+    for label, collection_name, query, sort in HOT_QUERIES:
+        cursor = mongo.db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        except OperationFailure as error:
+            app.logger.warning(
+                "Query '%s' on '%s' failed to plan: %s",
+                label, collection_name, error)
+            warnings.append(label)
+            continue
+        if find_collection_scans(plan):
+            app.logger.warning(
+                "Query '%s' on '%s' runs as a collection scan; "
+                "run 'flask ensure-indexes'", label, collection_name)
+            warnings.append(label)
+    return warnings
+
+
+def migrate_recipes(batch_size=500):
+    """migrate_recipes: \n
+    * This function converts recipes that still store their ingridients
+        and steps as strings joined by ' ~ ' to lists, and backfills
+        the display ready lists of recipes saved without them. \n
+    * Recipes are read in '_id' order, batch_size at a time, and each
+        batch is written with one 'bulk_write'. Converted recipes no
+        longer match the query, so a migration that is stopped can be
+        run again and carries on where it left off. \n
+    * Each update only applies if the recipe has not been edited since
+        it was read. \n
+    \n
+    \n Args: \n
+    * batch_size (int): The number of recipes converted per batch. \n
+    \n
+    \n Returns: \n
+    * It returns the number of recipes converted. \n
+    """
+    fields = {"ingridients": 1, "steps": 1}
+    last_id = None
+    converted = 0
+
+    while True:
+        if last_id is None:
+            query = LEGACY_RECIPE_QUERY
+        else:
+            query = {"$and": [LEGACY_RECIPE_QUERY, {"_id": {"$gt": last_id}}]}
+
+        batch = list(mongo.db.recipes.find(query, fields).sort(
+            "_id", ASCENDING).limit(batch_size))
+        if not batch:
+            return converted
+
+        updates = []
+        for recipe in batch:
+            unchanged = {
+                "_id": recipe["_id"],
+                "ingridients": recipe.get("ingridients"),
+                "steps": recipe.get("steps")
+            }
+            recipe_lists = get_recipe_lists(recipe)
+            recipe_lists.update(format_recipe_lists(recipe_lists))
+            updates.append(UpdateOne(unchanged, {"$set": recipe_lists}))
+
+        result = mongo.db.recipes.bulk_write(updates, ordered=False)
+        converted += result.modified_count
+        last_id = batch[-1]["_id"]
+
+
+def make_csv_row(document, fields):
+    """make_csv_row: \n
+    * This function returns a document's fields as a CSV row. Recipe
+        ingridients and steps are joined by LEGACY_SEPARATOR, as they
+        are entered on the recipe form. \n
+    \n
+    \n Args: \n
+    * document (dict): The document from the database. \n
+    * fields (tuple): The fields to write, in order. \n
+    \n
+    \n Returns: \n
+    * It returns a list of the field values as strings. \n
+    """
+    if "ingridients" in fields:
+        recipe_lists = get_recipe_lists(document)
+        document = dict(
+            document,
+            ingridients=LEGACY_SEPARATOR.join(
+                format_ingredient(ingredient)
+                for ingredient in recipe_lists["ingridients"]),
+            steps=LEGACY_SEPARATOR.join(recipe_lists["steps"]))
+    return [str(document.get(field, "")) for field in fields]
+
+
+def export_documents(collection_name, file_format,
+                     batch_size=EXPORT_BATCH_SIZE):
+    """export_documents: \n
+    * This function writes every document in a collection as NDJSON (one
+        JSON document per line, with ids as {"$oid": ...}) or CSV (with
+        a header row of the field names). \n
+    * The documents are read from one cursor in '_id' order,
+        batch_size at a time, and written out a batch at a time, so an
+        export of any size uses the same memory. \n
+    \n
+    \n Args: \n
+    * collection_name (str): One of BULK_COLLECTIONS. \n
+    * file_format (str): Either 'ndjson' or 'csv'. \n
+    * batch_size (int): The number of documents read and written at a
+        time. \n
+    \n
+    \n Returns: \n
+    * It yields the export as strings of a batch of lines. \n
+    """
+    fields = BULK_COLLECTIONS[collection_name]["fields"]
+    documents = mongo.db[collection_name].find(
+        {}, dict.fromkeys(fields, 1)).sort("_id", ASCENDING).batch_size(
+            batch_size)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == "csv":
+        writer.writerow(fields)
+
+    for count, document in enumerate(documents, 1):
+        if file_format == "csv":
+            writer.writerow(make_csv_row(document, fields))
+        else:
+            buffer.write(json_util.dumps(document) + "\n")
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def read_import_rows(stream, file_format):
+    """read_import_rows: \n
+    * This function reads the rows of an NDJSON or CSV file a line at a
+        time, so a file of any size can be imported. \n
+    \n
+    \n Args: \n
+    * stream (file): The file, opened in binary mode and UTF-8
+        encoded. \n
+    * file_format (str): Either 'ndjson' or 'csv'. \n
+    \n
+    \n Returns: \n
+    * It yields (line number, row) tuples, where row is a dict of a CSV
+        row or the text of an NDJSON line. Blank lines are skipped. \n
+    """
+    lines = codecs.iterdecode(stream, "utf-8-sig")
+    if file_format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if line.strip():
+            yield line_number, line
+
+
+def make_import_list(values, parse=None):
+    """make_import_list: \n
+    * This function checks an imported recipe's ingridients or steps.
+        A string is split on LEGACY_SEPARATOR, as it is on the recipe
+        form, and text is lower cased as the form does. \n
+    \n
+    \n Args: \n
+    * values (str or list): The ingridients or steps imported. \n
+    * parse (function): Turns each string into the stored value, e.g.
+        parse_ingredient. \n
+    \n
+    \n Returns: \n
+    * It returns the list to store. \n
+    """
+    if isinstance(values, str):
+        values = [text for text in values.split(LEGACY_SEPARATOR) if text]
+    if not isinstance(values, list):
+        raise ValueError("must be text or a list")
+
+    items = []
+    for value in values:
+        if isinstance(value, dict) and parse is not None:
+            if not isinstance(value.get("name"), str) or \
+                    not isinstance(value.get("quantity", ""), str):
+                raise ValueError("must each have a text 'name' and "
+                                 "'quantity'")
+            value = format_ingredient(value)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError("must be a list of text")
+        value = value.strip().lower()
+        items.append(parse(value) if parse is not None else value)
+    return items
+
+
+def make_import_operation(collection_name, row, categories, author=None):
+    """make_import_operation: \n
+    * This function checks an imported row and returns the write that
+        saves it, the same as the add and edit forms would. \n
+    * A row with an '_id' replaces the fields of that document, or adds
+        it if there is no such document. A recipe's version is bumped
+        so browsers fetch its page again. A row without one is added.
+        Categories are matched by name so none are added twice. \n
+    * Recipes have their display ready ingridients and steps created.
+        A recipe added without a 'created' date or 'created_by' is
+        given today's date and the author; a recipe replaced keeps its
+        own. Without an author, a recipe row with an '_id' but no
+        'created_by' can only replace a recipe that exists. \n
+    \n
+    \n Args: \n
+    * collection_name (str): One of BULK_COLLECTIONS. \n
+    * row (str or dict): An NDJSON line or a CSV row. \n
+    * categories (set): The categories a row may be in, if the
+        collection has categories. \n
+    * author (str): The username to add recipes by. \n
+    \n
+    \n Returns: \n
+    * It returns a tuple of the InsertOne or UpdateOne, the id of the
+        document it replaces (or None) and whether that document must
+        already exist. \n
+    * It raises ValueError if the row is not valid. \n
+    """
+    if isinstance(row, str):
+        row = json_util.loads(row)
+        if not isinstance(row, dict):
+            raise ValueError("each line must be a JSON object")
+
+    settings = BULK_COLLECTIONS[collection_name]
+    document = {
+        field: row[field] for field in settings["fields"]
+        if row.get(field) not in (None, "")}
+    for field in settings["required"]:
+        if field not in document:
+            raise ValueError("'{}' is missing".format(field))
+
+    document_id = document.pop("_id", None)
+    if document_id is not None and not isinstance(document_id, ObjectId):
+        if not ObjectId.is_valid(document_id):
+            raise ValueError("'_id' is not a valid id")
+        document_id = ObjectId(document_id)
+
+    for field, value in document.items():
+        if field in ("ingridients", "steps"):
+            parse = parse_ingredient if field == "ingridients" else None
+            try:
+                document[field] = make_import_list(value, parse)
+            except ValueError as error:
+                raise ValueError("'{}' {}".format(field, error))
+        elif not isinstance(value, str):
+            raise ValueError("'{}' must be text".format(field))
+        elif field in settings["lower"]:
+            document[field] = value.strip().lower()
+
+    if settings["categories"] and document["category"] not in categories:
+        raise ValueError("there is no '{}' category".format(
+            document["category"]))
+
+    if collection_name in ("categories", "product_categories"):
+        return (
+            UpdateOne(document, {"$set": document}, upsert=True), None,
+            False)
+
+    if collection_name == "recipes":
+        document.update(format_recipe_lists(document))
+        defaults = {"created": str(date.today().strftime("%x"))}
+        if author is not None:
+            defaults["created_by"] = author
+        defaults = {
+            field: value for field, value in defaults.items()
+            if field not in document}
+        must_exist = "created_by" not in document and author is None
+
+        if document_id is None:
+            if must_exist:
+                raise ValueError("'created_by' is missing")
+            insert = InsertOne(dict(document, version=1, **defaults))
+            return insert, None, False
+        update = {"$set": document, "$inc": {"version": 1}}
+        if defaults:
+            update["$setOnInsert"] = defaults
+        return (
+            UpdateOne({"_id": document_id}, update, upsert=not must_exist),
+            document_id, must_exist)
+
+    if document_id is None:
+        return InsertOne(document), None, False
+    return (
+        UpdateOne({"_id": document_id}, {"$set": document}, upsert=True),
+        document_id, False)
+
+
+def import_documents(collection_name, rows, author=None,
+                     batch_size=IMPORT_BATCH_SIZE):
+    """import_documents: \n
+    * This function saves the rows read by read_import_rows (see
+        make_import_operation), batch_size rows at a time with one
+        unordered 'bulk_write', so an import of any size uses the same
+        memory. \n
+    * Invalid rows are skipped and reported by line number, up to
+        IMPORT_MAX_ERRORS of them. A file that can not be read stops
+        the import, keeping the rows already saved. \n
+    * Once saved, the cached counts, categories, pages and (for recipes)
+        the recipe indexes and search cache are dropped, as any of them
+        could now be wrong. \n
+    \n
+    \n Args: \n
+    * collection_name (str): One of BULK_COLLECTIONS. \n
+    * rows (iterable): The (line number, row) tuples. \n
+    * author (str): The username to add recipes by. \n
+    * batch_size (int): The number of rows per bulk write. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the number of documents 'inserted' and
+        'updated', the number of rows 'failed' and the 'errors'. \n
+    """
+    settings = BULK_COLLECTIONS[collection_name]
+    categories = set()
+    if settings["categories"]:
+        categories = {
+            category["category"]
+            for category in get_categories(settings["categories"])}
+
+    result = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+    operations = []
+    line_numbers = []
+    replaced = []
+    must_exist = {}
+
+    def fail(line_number, message):
+        result["failed"] += 1
+        if len(result["errors"]) < IMPORT_MAX_ERRORS:
+            result["errors"].append({"line": line_number, "error": message})
+
+    def write():
+        # Rows that can only replace a document fail if it is missing
+        if must_exist:
+            existing = {
+                document["_id"] for document in mongo.db[
+                    collection_name].find(
+                        {"_id": {"$in": list(must_exist.values())}},
+                        {"_id": 1})}
+            for index in sorted(must_exist, reverse=True):
+                if must_exist[index] not in existing:
+                    fail(line_numbers[index], "'created_by' is missing "
+                         "and there is no recipe with this '_id'")
+                    del operations[index]
+                    del line_numbers[index]
+            must_exist.clear()
+        if not operations:
+            replaced.clear()
+            return
+
+        try:
+            written = mongo.db[collection_name].bulk_write(
+                operations, ordered=False).bulk_api_result
+        except BulkWriteError as error:
+            written = error.details
+            for write_error in written["writeErrors"]:
+                fail(line_numbers[write_error["index"]],
+                     write_error["errmsg"])
+        result["inserted"] += written["nInserted"] + written["nUpserted"]
+        result["updated"] += written["nMatched"]
+
+        # Drops the cached pages of the documents replaced
+        invalidate_pages(*[
+            "{}:{}".format(collection_name, document_id)
+            for document_id in replaced])
+        operations.clear()
+        line_numbers.clear()
+        replaced.clear()
+
+    line_number = 0
+    try:
+        for line_number, row in rows:
+            try:
+                operation, document_id, existing = make_import_operation(
+                    collection_name, row, categories, author)
+            except (ValueError, TypeError, BSONError) as error:
+                fail(line_number, str(error))
+                continue
+            if existing:
+                must_exist[len(operations)] = document_id
+            operations.append(operation)
+            line_numbers.append(line_number)
+            if document_id is not None:
+                replaced.append(document_id)
+            if len(operations) == batch_size:
+                write()
+    except (ValueError, csv.Error) as error:
+        fail(line_number + 1, "the file could not be read: {}".format(error))
+    if operations:
+        write()
+
+    if result["inserted"] or result["updated"]:
+        record_change(collection_name)
+        if settings["categories"]:
+            invalidate_counts(collection_name)
+        else:
+            invalidate_categories(collection_name)
+        if collection_name == "recipes":
+            invalidate_recipe_index()
+            invalidate_search_cache()
+    return result
+
+
+@app.cli.command("migrate-recipes")
+@click.option("--batch-size", default=500, show_default=True,
+              help="Number of recipes converted per bulk write.")
+def migrate_recipes_command(batch_size):
+    """Convert recipe ingridients and steps to lists and format them."""
+    converted = migrate_recipes(batch_size)
+    click.echo("Converted {} recipes".format(converted))
+    remaining = mongo.db.recipes.count_documents(LEGACY_RECIPE_QUERY)
+    if remaining:
+        click.echo("{} recipes changed during the migration; run it "
+                   "again to convert them".format(remaining), err=True)
+        raise SystemExit(1)
+
+
+@app.cli.command("generate-data")
+@click.option("--users", default=1000, show_default=True,
+              help="Number of users.")
+@click.option("--recipes", default=100000, show_default=True,
+              help="Number of recipes.")
+@click.option("--products", default=1000, show_default=True,
+              help="Number of products.")
+@click.option("--quotes", default=100, show_default=True,
+              help="Number of quotes.")
+@click.option("--batch-size", default=1000, show_default=True,
+              help="Number of documents per insert_many.")
+@click.option("--seed", "random_seed", default=1, show_default=True,
+              help="Random seed; the same seed gives the same data.")
+@click.option("--legacy", is_flag=True,
+              help="Store recipe ingridients and steps as strings joined "
+                   "by ' ~ ', as before 'flask migrate-recipes'.")
+def generate_data_command(users, recipes, products, quotes, batch_size,
+                          random_seed, legacy):
+    """Fill an empty database with generated data for scale testing."""
+    # Imported here as the generator imports this module
+    from benchmarks.seed import (
+        BENCHMARK_PASSWORD, BENCHMARK_USER, seed_database)
+
+    filled = [
+        collection_name for collection_name in (
+            "users", "categories", "product_categories", "recipes",
+            "products", "quotes")
+        if mongo.db[collection_name].estimated_document_count()]
+    if filled:
+        click.echo("The database already has {}; generate data into an "
+                   "empty database".format(", ".join(filled)), err=True)
+        raise SystemExit(1)
+
+    start = time.monotonic()
+    counts = seed_database(
+        mongo.db, users=users, recipes=recipes, products=products,
+        quotes=quotes, batch_size=batch_size, random_seed=random_seed,
+        legacy=legacy)
+    for collection_name in (
+            "categories", "product_categories", "recipes", "products"):
+        record_change(collection_name)
+
+    for collection_name, count in counts.items():
+        click.echo("{}: {}".format(collection_name, count))
+    click.echo("Generated in {:.1f}s. Log in as '{}' with the password "
+               "'{}', and run 'flask ensure-indexes'".format(
+                   time.monotonic() - start, BENCHMARK_USER,
+                   BENCHMARK_PASSWORD))
+
+
+@app.cli.command("export-data")
+@click.argument("collection_name", type=click.Choice(BULK_COLLECTIONS))
+@click.option("--format", "file_format", type=click.Choice(BULK_FORMATS),
+              default="ndjson", show_default=True)
+@click.option("--output", type=click.File("w"), default="-",
+              help="File to write to (default: standard output).")
+@click.option("--batch-size", default=EXPORT_BATCH_SIZE, show_default=True,
+              help="Number of documents read and written at a time.")
+def export_data_command(collection_name, file_format, output, batch_size):
+    """Export recipes, products or categories as NDJSON or CSV."""
+    for chunk in export_documents(collection_name, file_format, batch_size):
+        output.write(chunk)
+
+
+@app.cli.command("import-data")
+@click.argument("collection_name", type=click.Choice(BULK_COLLECTIONS))
+@click.argument("file", type=click.File("rb"))
+@click.option("--format", "file_format", type=click.Choice(BULK_FORMATS),
+              help="The file's format (default: from its extension).")
+@click.option("--author",
+              help="Username to add recipes without a 'created_by' by.")
+@click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True,
+              help="Number of rows saved per bulk write.")
+def import_data_command(collection_name, file, file_format, author,
+                        batch_size):
+    """Import recipes, products or categories from NDJSON or CSV."""
+    if file_format is None:
+        file_format = file.name.rpartition(".")[2].lower()
+        if file_format not in BULK_FORMATS:
+            click.echo("Set --format for a file without an .ndjson or "
+                       ".csv extension", err=True)
+            raise SystemExit(1)
+
+    result = import_documents(
+        collection_name, read_import_rows(file, file_format), author,
+        batch_size)
+    for error in result["errors"]:
+        click.echo("Line {line}: {error}".format(**error), err=True)
+    click.echo("Inserted {inserted}, updated {updated}, "
+               "failed {failed}".format(**result))
+    if result["failed"]:
+        raise SystemExit(1)
+
+
+@app.cli.command("build-static")
+def build_static_command():
+    """Write hashed, compressed copies of the stylesheets and scripts."""
+    if brotli is None:
+        click.echo("The 'brotli' package is not installed, only gzip "
+                   "versions will be written", err=True)
+    for filename, hashed in sorted(build_static().items()):
+        click.echo("{} -> {}".format(filename, hashed))
+
+
+@app.cli.command("build-images")
+def build_images_command():
+    """Write resized JPEG and WebP copies of the site's images."""
+    if Image is None:
+        click.echo("The 'Pillow' package is needed to resize images: "
+                   "pip3 install Pillow", err=True)
+        raise SystemExit(1)
+    for filename, widths in sorted(build_images().items()):
+        click.echo("{}: {}".format(
+            filename, ", ".join(str(width) for width in widths)))
+
+
+@app.cli.command("build-video")
+def build_video_command():
+    """Write a poster and smaller copies of the site's videos."""
+    for program in ("ffmpeg", "ffprobe"):
+        if shutil.which(program) is None:
+            click.echo("'{}' is needed to build the videos, see "
+                       "https://ffmpeg.org/download.html".format(program),
+                       err=True)
+            raise SystemExit(1)
+    for filename, built in sorted(build_video().items()):
+        click.echo("{}: poster {}, {}".format(
+            filename, built["poster"], ", ".join(
+                variant["file"] for variant in built["variants"])))
+
+
+@app.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create the MongoDB indexes the app relies on."""
+    failed = False
+    for collection_name, name, error in ensure_indexes():
+        if error:
+            failed = True
+            click.echo("{}: {} failed - {}".format(
+                collection_name, name, error), err=True)
+        else:
+            click.echo("{}: {}".format(collection_name, name))
+
+    if check_query_plans():
+        failed = True
+
+    if failed:
+        raise SystemExit(1)
+
+
+load_static_manifest()
+load_image_manifest()
+load_video_manifest()
+
+if os.environ.get("CHECK_QUERY_PLANS", "false").lower() == "true":
+    try:
+        check_query_plans()
+    except PyMongoError as error:
+        app.logger.warning("Unable to check query plans: %s", error)
+
+
 if __name__ == "__main__":
     app.run(host=os.environ.get("IP"),
             port=int(os.environ.get("PORT")),
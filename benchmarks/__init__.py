@@ -0,0 +1,7 @@
+"""benchmarks: \n
+* A load test for every page of the app. It seeds a database with
+    generated data, sends each route requests from concurrent clients
+    and reports the throughput and p50/p95/p99 latency of each as
+    JSON, so runs can be compared between commits. \n
+* Run it with 'python3 -m benchmarks --help'. \n
+"""
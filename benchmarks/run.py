@@ -0,0 +1,724 @@
+"""run: \n
+* Seeds a database, then sends each route 'requests' requests from
+    'concurrency' clients and prints the results as JSON. \n
+* Requests are sent to the app in this process with Flask's test
+    client, one per thread, so the numbers are the app's and
+    MongoDB's time without a web server or network in front. \n
+* Given more than one number of recipes, each is seeded and run in
+    its own process, so the results show how each route scales. \n
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from html import unescape
+
+import bson
+from pymongo import monitoring
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Requests per route sent one at a time after the timed requests, to
+# measure the bytes and memory each uses
+MEASURE_REQUESTS = 5
+
+# The p95 latency in milliseconds each route must stay within with
+# TARGET_RECIPES recipes (or fewer), checked by --check-targets
+TARGET_RECIPES = 100000
+TARGETS_P95_MS = {
+    "recipes_fuzzy": 100,
+    "ingredient_ranking": 50,
+}
+
+
+class ReplySizes(monitoring.CommandListener):
+    """Adds up the size of the MongoDB replies to the commands sent by
+    one thread, so the bytes a request reads from MongoDB can be
+    measured without counting the app's background threads."""
+
+    def __init__(self):
+        self.thread = None
+        self.bytes = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if threading.get_ident() == self.thread:
+            self.bytes += len(bson.encode(event.reply))
+
+    def failed(self, event):
+        pass
+
+
+def get_routes(appmod, db):
+    """get_routes: \n
+    * This function lists the routes to benchmark, reading the ids,
+        categories and next page link they need from the seeded
+        database. \n
+    * Each route has a 'name', 'method', 'paths' (sent in turn),
+        'status' (the status that counts as a success) and 'login'
+        (None, or True to be logged in as the admin user). \n
+    * Routes with 'text_search' need MongoDB's '$text' search. \n
+    * Routes with a 'call' time the function of each path (see
+        open_route) rather than sending requests. They time the in
+        process recipe indexes alone, which the memory backend can do
+        with any number of recipes. \n
+    \n
+    \n Args: \n
+    * appmod (module): The app module. \n
+    * db (Database): The seeded database. \n
+    \n
+    \n Returns: \n
+    * It returns a list of route dicts. \n
+    """
+    from benchmarks.seed import BENCHMARK_PASSWORD, BENCHMARK_USER
+
+    recipe_ids = [
+        str(recipe["_id"]) for recipe in db.recipes.find(
+            {}, {"_id": 1}).limit(100)]
+    recipe_counts = appmod.make_category_counts("recipes")
+    category = max(recipe_counts, key=recipe_counts.get)
+    product_counts = appmod.make_category_counts("products")
+    product_category = max(product_counts, key=product_counts.get)
+    cut = db.recipes.find_one({}, {"ingridients": 1})["ingridients"][0]
+    names = [
+        recipe["name"] for recipe in db.recipes.find(
+            {}, {"name": 1}).limit(20)]
+    # Legacy recipes store their ingridients as a string, so only
+    # recipes with a list are used
+    ingredient_lists = [
+        ", ".join(
+            ingredient["name"] for ingredient in recipe["ingridients"][:3])
+        for recipe in db.recipes.find({}, {"ingridients": 1}).limit(40)
+        if isinstance(recipe["ingridients"], list)][:20]
+
+    # Follows the next page link, as pages after the first are read
+    # with a cursor
+    with appmod.app.test_client() as client:
+        page = client.get("/recipes").get_data(as_text=True)
+    next_page = re.search(r'href="(/recipes\?cursor=[^"]+)"', page)
+    next_page = unescape(next_page.group(1)) if next_page else "/recipes"
+
+    def route(name, *paths, method="GET", status=200, login=None,
+              data=None, text_search=False, call=None):
+        return {
+            "name": name, "method": method, "paths": list(paths),
+            "status": status, "login": login, "data": data,
+            "text_search": text_search, "call": call
+        }
+
+    return [
+        route("index", "/"),
+        route("recipes", "/recipes"),
+        route("recipes_next_page", next_page),
+        route("recipes_category", "/recipes?category=" + category),
+        route("recipes_search", "/recipes?q=" + cut["name"],
+              text_search=True),
+        route("recipes_search_typo", *[
+            "/recipes?q=" + misspell(name) for name in names],
+            text_search=True),
+        route("recipes_fuzzy", *[misspell(name) for name in names],
+              call=appmod.fuzzy_search_names),
+        route("recipes_ingredients", *[
+            "/recipes?ingredients=" + text for text in ingredient_lists]),
+        route("ingredient_ranking", *ingredient_lists,
+              call=lambda text: appmod.rank_ingredient_matches(text, 9)),
+        route("suggest", "/api/suggest?q=" + cut["name"][:3]),
+        route("products", "/products"),
+        route("products_category", "/products?category=" + product_category),
+        route("view_recipe", *[
+            "/recipe/" + recipe_id for recipe_id in recipe_ids]),
+        route("login_page", "/login"),
+        route("login", "/login", method="POST", status=302, data={
+            "username": BENCHMARK_USER, "password": BENCHMARK_PASSWORD}),
+        route("profile", "/profile/" + BENCHMARK_USER, login=True),
+        route("admin", "/admin/" + BENCHMARK_USER, login=True)
+    ]
+
+
+def misspell(name):
+    """misspell: \n
+    * This function swaps the second and third letters of each word of
+        a recipe name, so the '$text' search finds nothing and the
+        search falls back to similar names. \n
+    \n
+    \n Args: \n
+    * name (str): The recipe name, e.g. 'texas brisket'. \n
+    \n
+    \n Returns: \n
+    * It returns the misspelt name, e.g. 'txeas birsket'. \n
+    """
+    return " ".join(
+        word[0] + word[2] + word[1] + word[3:] if len(word) > 3 else word
+        for word in name.split())
+
+
+def make_client(app, login):
+    """make_client: \n
+    * This function makes a test client, logged in as the admin user
+        if login is True. \n
+    \n
+    \n Args: \n
+    * app (Flask): The app. \n
+    * login (bool): Whether the client is logged in. \n
+    \n
+    \n Returns: \n
+    * It returns the test client. \n
+    """
+    from benchmarks.seed import BENCHMARK_USER
+
+    client = app.test_client()
+    if login:
+        with client.session_transaction() as session:
+            session["user"] = BENCHMARK_USER
+            session["admin"] = "true"
+    return client
+
+
+def open_route(app, client, route, path):
+    """open_route: \n
+    * This function sends a request for the route to one of its paths,
+        or for a route with a 'call', calls it with the path within a
+        request context. \n
+    \n
+    \n Args: \n
+    * app (Flask): The app. \n
+    * client (FlaskClient): The test client. \n
+    * route (dict): The route. \n
+    * path (str): The path, or the call's argument. \n
+    \n
+    \n Returns: \n
+    * It returns a tuple of the status code and the size of the
+        response, or None for a call. \n
+    """
+    if route["call"]:
+        with app.test_request_context():
+            route["call"](path)
+        return route["status"], None
+
+    response = client.open(path, method=route["method"], data=route["data"])
+    return response.status_code, len(response.get_data())
+
+
+def send(app, client, route, number):
+    """send: \n
+    * This function sends one request for the route and times it.
+        Requests with form data (logging in) are sent from a new
+        client, as a logged in client would be turned away. \n
+    \n
+    \n Args: \n
+    * app (Flask): The app. \n
+    * client (FlaskClient): The thread's test client. \n
+    * route (dict): The route. \n
+    * number (int): The request number, picking the path. \n
+    \n
+    \n Returns: \n
+    * It returns a tuple of the status code and the seconds taken. \n
+    """
+    path = route["paths"][number % len(route["paths"])]
+    if route["data"]:
+        client = make_client(app, route["login"])
+    start = time.perf_counter()
+    status = open_route(app, client, route, path)[0]
+    return status, time.perf_counter() - start
+
+
+def measure(app, route, replies):
+    """measure: \n
+    * This function sends the route MEASURE_REQUESTS requests one at a
+        time, measuring the size of each response, the bytes read from
+        MongoDB (see ReplySizes) and the most memory the request
+        allocated, traced with tracemalloc. \n
+    * The requests are not timed, as tracing slows them down. With
+        the memory backend the memory traced includes the stand-in's
+        own work, which MongoDB does in its own process. \n
+    \n
+    \n Args: \n
+    * app (Flask): The app. \n
+    * route (dict): The route. \n
+    * replies (ReplySizes): The listener registered with pymongo, or
+        None for the memory backend. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the mean 'response_bytes' (None for a
+        call) and 'db_reply_bytes', and the 'peak_memory_kb'. \n
+    """
+    client = make_client(app, route["login"])
+    response_bytes = []
+    reply_bytes = []
+    peaks = []
+    for number in range(MEASURE_REQUESTS):
+        path = route["paths"][number % len(route["paths"])]
+        if route["data"]:
+            client = make_client(app, route["login"])
+        if replies is not None:
+            replies.thread = threading.get_ident()
+            replies.bytes = 0
+        tracemalloc.start()
+        status, size = open_route(app, client, route, path)
+        if size is not None:
+            response_bytes.append(size)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        if replies is not None:
+            replies.thread = None
+            reply_bytes.append(replies.bytes)
+
+    return {
+        "response_bytes": round(sum(response_bytes) / len(response_bytes))
+        if response_bytes else None,
+        "db_reply_bytes": round(sum(reply_bytes) / len(reply_bytes))
+        if reply_bytes else None,
+        "peak_memory_kb": round(max(peaks) / 1024, 1)
+    }
+
+
+def percentile(latencies, fraction):
+    """percentile: \n
+    * This function returns the latency that the given fraction of the
+        sorted latencies are at or below. \n
+    \n
+    \n Args: \n
+    * latencies (list): The sorted latencies. \n
+    * fraction (float): The fraction, e.g. 0.95 for p95. \n
+    \n
+    \n Returns: \n
+    * It returns the latency in milliseconds. \n
+    """
+    index = min(len(latencies) - 1, int(len(latencies) * fraction))
+    return round(latencies[index] * 1000, 3)
+
+
+def run_route(app, route, requests, concurrency, warmup):
+    """run_route: \n
+    * This function sends a route 'warmup' requests one at a time, so
+        the caches are filled, then 'requests' requests shared between
+        'concurrency' threads. \n
+    \n
+    \n Args: \n
+    * app (Flask): The app. \n
+    * route (dict): The route. \n
+    * requests (int): The number of timed requests. \n
+    * concurrency (int): The number of clients sending at once. \n
+    * warmup (int): The number of untimed requests sent first. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the route's results. \n
+    """
+    client = make_client(app, route["login"])
+    for number in range(warmup):
+        send(app, client, route, number)
+
+    numbers = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    errors = Counter()
+
+    def worker():
+        client = make_client(app, route["login"])
+        while True:
+            with lock:
+                number = next(numbers)
+            if number >= requests:
+                return
+            status, seconds = send(app, client, route, number)
+            with lock:
+                latencies.append(seconds)
+                if status != route["status"]:
+                    errors[str(status)] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "paths": len(route["paths"]),
+        "requests": len(latencies),
+        "errors": dict(errors),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": round(latencies[-1] * 1000, 3)
+    }
+
+
+def check_target(name, result, recipes):
+    """check_target: \n
+    * This function adds the route's target from TARGETS_P95_MS to its
+        results, and whether its p95 met it. Targets apply up to
+        TARGET_RECIPES recipes. \n
+    \n
+    \n Args: \n
+    * name (str): The route's name. \n
+    * result (dict): The route's results. \n
+    * recipes (int): The number of recipes seeded. \n
+    """
+    target = TARGETS_P95_MS.get(name)
+    if target is None or recipes > TARGET_RECIPES:
+        return
+    result["target_p95_ms"] = target
+    result["meets_target"] = result["p95_ms"] <= target
+
+
+def get_commit():
+    """get_commit: \n
+    * This function returns the git commit being benchmarked, with
+        '-dirty' added if there are uncommitted changes. \n
+    \n
+    \n Returns: \n
+    * It returns the commit hash, or None outside a git checkout. \n
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "describe", "--always", "--dirty", "--abbrev=40"],
+            cwd=ROOT, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.stdout.strip()
+
+
+def compare(baseline, results):
+    """compare: \n
+    * This function prints how each route's p50, p95, throughput,
+        response size, bytes read from MongoDB and peak memory changed
+        from an earlier run, for each number of recipes both runs
+        have. \n
+    \n
+    \n Args: \n
+    * baseline (dict): The results of the earlier run. \n
+    * results (dict): The results of this run. \n
+    """
+    def change(before, after):
+        if not before or after is None:
+            return "n/a"
+        return "{:+.1f}%".format((after - before) / before * 100)
+
+    baseline_runs = {
+        run["documents"]["recipes"]: run for run in baseline.get("runs", ())}
+    print("compared with {}".format(baseline.get("commit")), file=sys.stderr)
+    for run in results["runs"]:
+        recipes = run["documents"]["recipes"]
+        if recipes not in baseline_runs:
+            continue
+        print("{} recipes".format(recipes), file=sys.stderr)
+        for name, after in run["routes"].items():
+            before = baseline_runs[recipes]["routes"].get(name)
+            if not before or "skipped" in before or "skipped" in after:
+                continue
+            print("  {:<22} p50 {:>8}  p95 {:>8}  throughput {:>8}  "
+                  "response {:>8}  db {:>8}  memory {:>8}".format(
+                      name,
+                      change(before["p50_ms"], after["p50_ms"]),
+                      change(before["p95_ms"], after["p95_ms"]),
+                      change(before["throughput"], after["throughput"]),
+                      change(before.get("response_bytes"),
+                             after["response_bytes"]),
+                      change(before.get("db_reply_bytes"),
+                             after["db_reply_bytes"]),
+                      change(before.get("peak_memory_kb"),
+                             after["peak_memory_kb"])),
+                  file=sys.stderr)
+
+
+def print_scaling(runs, backend):
+    """print_scaling: \n
+    * This function prints each route's p50 and peak memory at each
+        number of recipes, to show which routes slow down or use more
+        memory as the collections grow. \n
+    * With the memory backend it warns that the numbers include the
+        stand-in's own work, so they do not show how a page scales with
+        MongoDB. \n
+    \n
+    \n Args: \n
+    * runs (list): The results at each number of recipes. \n
+    * backend (str): Either 'mongodb' or 'memory'. \n
+    """
+    print("p50 / peak memory at {} recipes".format(
+        ", ".join(str(run["documents"]["recipes"]) for run in runs)),
+        file=sys.stderr)
+    for name in runs[0]["routes"]:
+        cells = []
+        for run in runs:
+            result = run["routes"].get(name, {})
+            if "p50_ms" in result:
+                cells.append("{:.3f}ms / {:.0f}KB".format(
+                    result["p50_ms"], result["peak_memory_kb"]))
+            else:
+                cells.append("-")
+        print("  {:<22} {}".format(name, "  ".join(
+            "{:>20}".format(cell) for cell in cells)), file=sys.stderr)
+    if backend == "memory":
+        print("Measured on the in memory stand-in, which runs every query "
+              "(such as the home page's $sample) in this process; use "
+              "MongoDB to see how the pages scale", file=sys.stderr)
+
+
+def parse_sizes(value):
+    """parse_sizes: \n
+    * This function reads a comma separated list of numbers of
+        recipes. \n
+    \n
+    \n Args: \n
+    * value (str): The list, e.g. '1000,10000,100000'. \n
+    \n
+    \n Returns: \n
+    * It returns the numbers in ascending order. \n
+    """
+    try:
+        sizes = sorted({int(size) for size in value.split(",")})
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "expected numbers separated by commas, e.g. 1000,10000")
+    if not sizes or sizes[0] < 1:
+        raise argparse.ArgumentTypeError("expected numbers above 0")
+    return sizes
+
+
+def run_sizes(args):
+    """run_sizes: \n
+    * This function benchmarks each number of recipes in its own
+        process, so no cache or memory carries over from one to the
+        next. The database is dropped before each is seeded. \n
+    \n
+    \n Args: \n
+    * args (Namespace): The command line options. \n
+    \n
+    \n Returns: \n
+    * It returns a list of the results of each run. \n
+    """
+    runs = []
+    for number, recipes in enumerate(args.recipes):
+        command = [
+            sys.executable, "-m", "benchmarks",
+            "--backend", args.backend, "--mongo-uri", args.mongo_uri,
+            "--database", args.database, "--users", str(args.users),
+            "--recipes", str(recipes), "--products", str(args.products),
+            "--quotes", str(args.quotes), "--seed", str(args.seed),
+            "--requests", str(args.requests),
+            "--concurrency", str(args.concurrency),
+            "--warmup", str(args.warmup), "--page-cache", args.page_cache]
+        if args.drop or number:
+            command.append("--drop")
+        for name in args.route or ():
+            command.extend(("--route", name))
+        print("Running {} recipes".format(recipes), file=sys.stderr)
+        child = subprocess.run(
+            command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+        if child.returncode:
+            sys.exit(child.returncode)
+        runs.extend(json.loads(child.stdout)["runs"])
+    return runs
+
+
+def parse_args(argv):
+    """parse_args: \n
+    * This function reads the command line options. \n
+    \n
+    \n Args: \n
+    * argv (list): The command line arguments. \n
+    \n
+    \n Returns: \n
+    * It returns the options. \n
+    """
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks",
+        description="Seed a database and benchmark every route.")
+    parser.add_argument(
+        "--backend", choices=("mongodb", "memory"), default="mongodb",
+        help="Seed a MongoDB database, or an in memory stand-in "
+             "(needs mongomock, skips the text search and is too slow "
+             "for large numbers of recipes).")
+    parser.add_argument(
+        "--mongo-uri", default=os.environ.get(
+            "MONGO_URI", "mongodb://localhost:27017/"),
+        help="The MongoDB server (default: MONGO_URI or localhost).")
+    parser.add_argument(
+        "--database", default="bbq_benchmark",
+        help="The database to seed (default: %(default)s).")
+    parser.add_argument(
+        "--drop", action="store_true",
+        help="Drop the database first if it is not empty.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--recipes", type=parse_sizes, default="1000,10000,100000",
+        help="The numbers of recipes to benchmark, separated by commas; "
+             "each is run in turn (default: %(default)s).")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--quotes", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1,
+                        help="The random seed for the data.")
+    parser.add_argument("--requests", type=int, default=500,
+                        help="Timed requests per route.")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Clients sending requests at once.")
+    parser.add_argument("--warmup", type=int, default=20,
+                        help="Untimed requests per route sent first.")
+    parser.add_argument(
+        "--page-cache", choices=("off", "memory", "disk"), default="off",
+        help="The PAGE_CACHE_BACKEND; the default, 'off', times the work "
+             "behind every page rather than the page cache.")
+    parser.add_argument("--route", action="append",
+                        help="Only benchmark this route (repeatable).")
+    parser.add_argument(
+        "--check-targets", action="store_true",
+        help="Exit with an error if a route misses its p95 target.")
+    parser.add_argument("--output", help="Write the JSON to this file.")
+    parser.add_argument("--compare",
+                        help="A JSON file from an earlier run to compare to.")
+    return parser.parse_args(argv)
+
+
+def run_benchmarks(args):
+    """run_benchmarks: \n
+    * This function seeds the database with one number of recipes and
+        benchmarks every route. The app is only imported once the
+        environment it reads on import is set. \n
+    \n
+    \n Args: \n
+    * args (Namespace): The command line options. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the documents seeded and each route's
+        results. \n
+    """
+    if args.backend == "memory":
+        if args.concurrency > 1:
+            print("mongomock is not thread safe, so some requests may "
+                  "fail with more than one client", file=sys.stderr)
+        print("mongomock has no $text search, so recipes_search is "
+              "skipped; use MongoDB to benchmark it", file=sys.stderr)
+
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["PAGE_CACHE_BACKEND"] = args.page_cache
+    sys.path.insert(0, ROOT)
+
+    # Registered before the app makes its MongoDB client
+    replies = None
+    if args.backend == "mongodb":
+        replies = ReplySizes()
+        monitoring.register(replies)
+
+    import app as appmod
+    from benchmarks.seed import seed_database
+
+    # One JSON line per request would flood the output
+    appmod.request_log.setLevel(logging.WARNING)
+
+    if args.backend == "memory":
+        db = mongomock.MongoClient()[args.database]
+    else:
+        db = appmod.mongo.cx[args.database]
+        if db.list_collection_names():
+            if not args.drop:
+                sys.exit("The '{}' database is not empty; use --drop to "
+                         "replace it".format(args.database))
+            appmod.mongo.cx.drop_database(args.database)
+    appmod.mongo.db = db
+
+    start = time.perf_counter()
+    counts = seed_database(
+        db, users=args.users, recipes=args.recipes[0],
+        products=args.products,
+        quotes=args.quotes, random_seed=args.seed)
+    if args.backend == "mongodb":
+        for collection_name, name, error in appmod.ensure_indexes():
+            if error:
+                print("{}: {} failed - {}".format(
+                    collection_name, name, error), file=sys.stderr)
+    print("Seeded {} in {:.1f}s".format(
+        counts, time.perf_counter() - start), file=sys.stderr)
+
+    results = {"documents": counts, "routes": {}}
+
+    for route in get_routes(appmod, db):
+        if args.route and route["name"] not in args.route:
+            continue
+        if route["text_search"] and args.backend == "memory":
+            results["routes"][route["name"]] = {
+                "skipped": "mongomock has no $text search"}
+            continue
+        result = run_route(
+            appmod.app, route, args.requests, args.concurrency, args.warmup)
+        result.update(measure(appmod.app, route, replies))
+        check_target(route["name"], result, counts["recipes"])
+        results["routes"][route["name"]] = result
+        print("{name:<22} {throughput:>8.1f}/s  p50 {p50_ms:.3f}ms  "
+              "p95 {p95_ms:.3f}ms  p99 {p99_ms:.3f}ms  "
+              "{response_bytes}B  {peak_memory_kb}KB{target}".format(
+                  name=route["name"], target=" - missed its {}ms "
+                  "target".format(result["target_p95_ms"])
+                  if result.get("meets_target") is False else "",
+                  **result), file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    """main: \n
+    * This function runs the benchmarks from the command line, at each
+        number of recipes given. \n
+    \n
+    \n Args: \n
+    * argv (list): The command line arguments (default: sys.argv). \n
+    """
+    args = parse_args(argv)
+    if args.backend == "memory" and mongomock is None:
+        sys.exit("The memory backend needs mongomock: "
+                 "pip3 install -r benchmarks/requirements.txt")
+
+    results = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "backend": args.backend,
+        "page_cache": args.page_cache,
+        "seed": args.seed,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup
+    }
+    if len(args.recipes) > 1:
+        results["runs"] = run_sizes(args)
+        print_scaling(results["runs"], args.backend)
+    else:
+        results["runs"] = [run_benchmarks(args)]
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
+
+    missed = [
+        name for run in results["runs"]
+        for name, result in run["routes"].items()
+        if result.get("meets_target") is False]
+    if args.check_targets and missed:
+        sys.exit("Missed the p95 target: {}".format(", ".join(missed)))
@@ -0,0 +1,221 @@
+"""seed: \n
+* Fills a database with generated users, categories, recipes, products
+    and quotes for the benchmarks and 'flask generate-data'. The same
+    random seed always gives the same data. \n
+"""
+import random
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import LEGACY_SEPARATOR, format_ingredient, format_recipe_lists
+
+# The admin user the benchmarks log in as
+BENCHMARK_USER = "benchmark"
+BENCHMARK_PASSWORD = "benchmark"
+
+RECIPE_CATEGORIES = [
+    "beef", "pork", "chicken", "lamb", "fish", "sausages", "vegetables",
+    "sauces", "rubs", "sides"]
+PRODUCT_CATEGORIES = [
+    "smokers", "grills", "charcoal", "wood", "rubs", "sauces", "tools",
+    "thermometers"]
+CUTS = [
+    "brisket", "pulled pork", "ribs", "chicken wings", "pork belly",
+    "lamb shoulder", "tri tip", "salmon", "burnt ends", "sausages",
+    "chicken thighs", "short ribs", "pork loin", "turkey breast"]
+STYLES = [
+    "texas", "carolina", "kansas city", "memphis", "smoked", "sticky",
+    "hickory", "cherry wood", "spicy", "honey glazed", "garlic", "classic"]
+INGREDIENTS = [
+    "salt", "black pepper", "paprika", "smoked paprika", "garlic powder",
+    "onion powder", "brown sugar", "cayenne pepper", "cumin", "mustard",
+    "apple cider vinegar", "ketchup", "honey", "butter", "chilli flakes",
+    "worcestershire sauce", "olive oil", "thyme", "rosemary", "lemon"]
+QUANTITIES = [
+    "1 tsp", "2 tsp", "1 tbsp", "2 tbsp", "1/2 cup", "1 cup", "100g",
+    "250g", "500g", "1kg", "a pinch", ""]
+STEPS = [
+    "trim the excess fat from the {cut}",
+    "mix the rub and season the {cut} all over. leave it overnight",
+    "heat the smoker to 110c with {wood} wood",
+    "smoke the {cut} until the bark has set",
+    "wrap the {cut} in butcher paper and cook until probe tender",
+    "rest the {cut} for an hour before slicing",
+    "mop the {cut} with the sauce every 30 minutes",
+    "slice against the grain and serve"]
+WOODS = ["hickory", "oak", "cherry", "apple", "mesquite"]
+
+
+def pick_skewed(rand, choices):
+    """pick_skewed: \n
+    * This function picks one of the choices, favouring the first ones
+        so some categories are far more popular than others, as they
+        are on the live site. \n
+    \n
+    \n Args: \n
+    * rand (random.Random): The random number generator. \n
+    * choices (list): The choices, most popular first. \n
+    \n
+    \n Returns: \n
+    * It returns one of the choices. \n
+    """
+    weights = [1 / (rank + 1) for rank in range(len(choices))]
+    return rand.choices(choices, weights)[0]
+
+
+def make_username(number):
+    """make_username: \n
+    * This function returns the username of the numbered user; the
+        first user is BENCHMARK_USER. \n
+    \n
+    \n Args: \n
+    * number (int): The user's number, from 0. \n
+    \n
+    \n Returns: \n
+    * It returns the username. \n
+    """
+    if number == 0:
+        return BENCHMARK_USER
+    return "user{}".format(number)
+
+
+def make_recipe(rand, users, categories, legacy=False):
+    """make_recipe: \n
+    * This function makes a recipe in the same format as add_recipe,
+        including its display ready ingridients and steps. \n
+    * Legacy recipes store their ingridients and steps as strings
+        joined by ' ~ ', as recipes did before 'flask migrate-recipes'. \n
+    \n
+    \n Args: \n
+    * rand (random.Random): The random number generator. \n
+    * users (int): The number of users to pick the author from. \n
+    * categories (list): The recipe categories, most popular first. \n
+    * legacy (bool): Whether to make a legacy recipe. \n
+    \n
+    \n Returns: \n
+    * It returns the recipe dict. \n
+    """
+    cut = rand.choice(CUTS)
+    ingridients = [
+        {"name": name, "quantity": rand.choice(QUANTITIES)}
+        for name in rand.sample(INGREDIENTS, rand.randint(3, 10))]
+    ingridients.insert(0, {"name": cut, "quantity": rand.choice(QUANTITIES)})
+    steps = [
+        step.format(cut=cut, wood=rand.choice(WOODS))
+        for step in rand.sample(STEPS, rand.randint(3, len(STEPS)))]
+    recipe = {
+        "name": "{} {}".format(rand.choice(STYLES), cut),
+        "category": pick_skewed(rand, categories),
+        "description": "a {} {} cooked low and slow".format(
+            rand.choice(STYLES), cut),
+        "cook_time": "{} hours".format(rand.randint(1, 14)),
+        "prep_time": "{} minutes".format(rand.choice((10, 20, 30, 60))),
+        "image_url": "https://images.example.com/{}.jpg".format(
+            rand.randint(1, 500)),
+        "ingridients": ingridients,
+        "steps": steps,
+        "created": (date.today() - timedelta(
+            days=rand.randint(0, 1000))).strftime("%x"),
+        "created_by": make_username(rand.randrange(users))
+    }
+    if legacy:
+        recipe["ingridients"] = LEGACY_SEPARATOR.join(
+            format_ingredient(ingredient) for ingredient in ingridients)
+        recipe["steps"] = LEGACY_SEPARATOR.join(steps)
+        return recipe
+
+    recipe.update(format_recipe_lists(recipe))
+    recipe["version"] = 1
+    return recipe
+
+
+def insert_batches(collection, documents, batch_size):
+    """insert_batches: \n
+    * This function inserts documents batch_size at a time, so seeding
+        a large database does not hold every document in memory. \n
+    \n
+    \n Args: \n
+    * collection (Collection): The collection to insert into. \n
+    * documents (iterable): The documents to insert. \n
+    * batch_size (int): The number of documents per insert_many. \n
+    \n
+    \n Returns: \n
+    * It returns the number of documents inserted. \n
+    """
+    inserted = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def seed_database(db, users=50, recipes=2000, products=200, quotes=20,
+                  batch_size=1000, random_seed=1, legacy=False):
+    """seed_database: \n
+    * This function fills an empty database with generated data. The
+        first user is the BENCHMARK_USER admin; every user shares
+        BENCHMARK_PASSWORD, hashed once as hashing is slow on
+        purpose. \n
+    * Documents are made as they are inserted, so memory use does not
+        grow with the number of documents. \n
+    \n
+    \n Args: \n
+    * db (Database): The database to fill. \n
+    * users (int): The number of users. \n
+    * recipes (int): The number of recipes. \n
+    * products (int): The number of products. \n
+    * quotes (int): The number of quotes. \n
+    * batch_size (int): The number of documents per insert_many. \n
+    * random_seed (int): The seed for the random data. \n
+    * legacy (bool): Whether to store recipes in the legacy format. \n
+    \n
+    \n Returns: \n
+    * It returns a dict of the number of documents in each
+        collection. \n
+    """
+    rand = random.Random(random_seed)
+    password = generate_password_hash(BENCHMARK_PASSWORD)
+
+    counts = {
+        "users": insert_batches(db.users, ({
+            "username": make_username(number),
+            "first_name": make_username(number),
+            "last_name": "smoker",
+            "email": "{}@example.com".format(make_username(number)),
+            "password": password,
+            "admin": "true" if number == 0 else "false"
+        } for number in range(users)), batch_size),
+        "categories": insert_batches(db.categories, (
+            {"category": category} for category in RECIPE_CATEGORIES),
+            batch_size),
+        "product_categories": insert_batches(db.product_categories, (
+            {"category": category} for category in PRODUCT_CATEGORIES),
+            batch_size),
+        "recipes": insert_batches(db.recipes, (
+            make_recipe(rand, users, RECIPE_CATEGORIES, legacy)
+            for number in range(recipes)), batch_size),
+        "products": insert_batches(db.products, ({
+            "name": "{} {}".format(rand.choice(STYLES), category),
+            "category": category,
+            "description": "everything you need for {}".format(
+                rand.choice(CUTS)),
+            "image_url": "https://images.example.com/p{}.jpg".format(
+                rand.randint(1, 100)),
+            "purchase": "https://shop.example.com/{}".format(number)
+        } for number, category in (
+            (number, pick_skewed(rand, PRODUCT_CATEGORIES))
+            for number in range(products))), batch_size),
+        "quotes": insert_batches(db.quotes, ({
+            "quote": "low and slow, number {}".format(number),
+            "author": make_username(rand.randrange(users))
+        } for number in range(quotes)), batch_size)
+    }
+    return counts
@@ -56,3 +56,43 @@ AOS.init({
     // Sets the duration of the animations
     duration: 1000,
 });
+
+// Loads the hero video after the page has loaded, so its poster is shown first.
+// Visitors saving data, on slow connections or preferring reduced motion keep the poster.
+$(window).on('load', function () {
+    var video = document.getElementById('hero-video');
+    if (!video) {
+        return;
+    }
+
+    var connection = navigator.connection || {};
+    var reduceMotion = window.matchMedia && window.matchMedia('(prefers-reduced-motion: reduce)').matches;
+    if (connection.saveData || /(^|-)2g$/.test(connection.effectiveType || '') || reduceMotion) {
+        return;
+    }
+
+    // Picks the smallest copy at least as tall as the video is shown, smallest on 3g
+    var variants = JSON.parse(video.getAttribute('data-variants'));
+    var height = video.clientHeight * (window.devicePixelRatio || 1);
+    var variant = variants[variants.length - 1];
+    if (connection.effectiveType === '3g') {
+        variant = variants[0];
+    } else {
+        for (var i = 0; i < variants.length; i++) {
+            if (variants[i].height >= height) {
+                variant = variants[i];
+                break;
+            }
+        }
+    }
+
+    // Playing can be refused (such as when autoplay is blocked), so the copy is unloaded to keep the poster
+    video.src = variant.src;
+    var playing = video.play();
+    if (playing && playing.catch) {
+        playing.catch(function () {
+            video.removeAttribute('src');
+            video.load();
+        });
+    }
+});
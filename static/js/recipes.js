@@ -0,0 +1,44 @@
+// Search box suggestions from /api/suggest, shown once the user stops typing
+$(document).ready(function () {
+    var timer;
+    var search = $('#q');
+    var menu = $('#suggestions');
+
+    search.on('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(suggest, 150);
+    });
+
+    search.on('blur', function () {
+        // Wait so a click on a suggestion is not lost
+        setTimeout(function () {
+            menu.removeClass('show');
+        }, 200);
+    });
+
+    function suggest() {
+        var typed = search.val().trim();
+
+        if (!typed) {
+            menu.removeClass('show').empty();
+            return;
+        }
+
+        $.getJSON(search.data('suggest-url'), { q: typed }, function (data) {
+            // Ignore replies for letters that have since changed
+            if (search.val().trim() !== typed) {
+                return;
+            }
+
+            menu.empty();
+            $.each(data.suggestions, function (i, suggestion) {
+                $('<a class="dropdown-item"></a>')
+                    .attr('href', suggestion.url)
+                    .text(suggestion.text)
+                    .append($('<small class="text-muted pl-2"></small>').text(suggestion.type))
+                    .appendTo(menu);
+            });
+            menu.toggleClass('show', data.suggestions.length > 0);
+        });
+    }
+});
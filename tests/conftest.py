@@ -0,0 +1,115 @@
+"""conftest: \n
+* Fixtures for the tests, which run the app against mongomock, an in
+    memory stand-in for MongoDB, so no server is needed. \n
+* Run them from the repository root with: \n
+    pip3 install -r tests/requirements.txt \n
+    python3 -m pytest \n
+"""
+import logging
+import os
+import sys
+import tempfile
+
+import mongomock
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def appmod():
+    """appmod: \n
+    * This fixture imports the app once the environment it reads on
+        import is set, with the page cache off and thumbnails cached in
+        a directory of their own. \n
+    \n
+    \n Returns: \n
+    * It returns the app module. \n
+    """
+    os.environ["MONGO_URI"] = "mongodb://localhost:27017/test"
+    os.environ.setdefault("SECRET_KEY", "test")
+    os.environ["PAGE_CACHE_BACKEND"] = "off"
+    os.environ["THUMBNAIL_CACHE_DIR"] = tempfile.mkdtemp(
+        prefix="thumbnails-")
+    os.environ.pop("THUMBNAIL_ALLOW_PRIVATE", None)
+
+    import app as appmod
+
+    # One JSON line per request would flood the output
+    appmod.request_log.setLevel(logging.WARNING)
+    appmod.app.testing = True
+    return appmod
+
+
+@pytest.fixture
+def db(appmod):
+    """db: \n
+    * This fixture gives each test an empty database, dropping anything
+        the app has cached from the databases of earlier tests. \n
+    \n
+    \n Returns: \n
+    * It returns the mongomock database the app uses. \n
+    """
+    database = mongomock.MongoClient().test
+    appmod.mongo.db = database
+
+    for cache in (
+            appmod.count_cache, appmod.category_cache, appmod.search_cache,
+            appmod.user_cache, appmod.page_cache, appmod.page_cache_tags,
+            appmod.thumbnail_failures):
+        cache.clear()
+    with appmod.recipe_index_lock:
+        appmod.recipe_index.update(
+            ingridients={}, names={}, positions={}, ids=[], recipes={},
+            suggestions=[], suggestion_counts={}, expires=0)
+        appmod.recipe_index_build["ready"] = False
+    return database
+
+
+@pytest.fixture
+def seed(appmod, db):
+    """seed: \n
+    * This fixture gives a function that fills the database with a few
+        pages of generated recipes and products (see benchmarks.seed),
+        then builds the recipe indexes from them now rather than in the
+        background as the app does. \n
+    \n
+    \n Returns: \n
+    * It returns the function, which takes 'legacy' (whether to store
+        recipes in the legacy format) and returns the database. \n
+    """
+    from benchmarks.seed import seed_database
+
+    def seed_and_index(legacy=False):
+        seed_database(
+            db, users=3, recipes=50, products=10, quotes=2, legacy=legacy)
+        index = appmod.make_recipe_index()
+        with appmod.recipe_index_lock:
+            appmod.recipe_index.update(index)
+            appmod.recipe_index_build["ready"] = True
+        return db
+
+    return seed_and_index
+
+
+@pytest.fixture
+def seeded(seed):
+    """seeded: \n
+    * This fixture fills the database (see seed). \n
+    \n
+    \n Returns: \n
+    * It returns the database. \n
+    """
+    return seed()
+
+
+@pytest.fixture
+def client(appmod):
+    """client: \n
+    * This fixture makes a test client that is not logged in. \n
+    \n
+    \n Returns: \n
+    * It returns the test client. \n
+    """
+    return appmod.app.test_client()
@@ -0,0 +1,119 @@
+"""test_import: \n
+* Tests that importing recipes and products skips and reports the rows
+    that are not valid (see import_documents). \n
+"""
+import io
+import json
+
+import pytest
+from bson.objectid import ObjectId
+
+RECIPE = {
+    "name": "Texas Brisket", "category": "beef",
+    "ingridients": ["1 brisket", "2 tbsp salt"],
+    "steps": ["trim the brisket", "smoke it"], "created_by": "admin"}
+
+
+@pytest.fixture
+def categories(db):
+    """categories: \n
+    * This fixture adds the recipe and product categories rows are
+        checked against. \n
+    \n
+    \n Returns: \n
+    * It returns the database. \n
+    """
+    db.categories.insert_many([{"category": "beef"}, {"category": "pork"}])
+    db.product_categories.insert_one({"category": "rubs"})
+    return db
+
+
+def import_lines(appmod, collection_name, lines, file_format="ndjson"):
+    """import_lines: \n
+    * This function imports the lines of a file. \n
+    \n
+    \n Args: \n
+    * appmod (module): The app module. \n
+    * collection_name (str): The collection to import to. \n
+    * lines (list): The lines of the file. \n
+    * file_format (str): Either 'ndjson' or 'csv'. \n
+    \n
+    \n Returns: \n
+    * It returns the import's result dict. \n
+    """
+    stream = io.BytesIO("\n".join(lines).encode())
+    with appmod.app.test_request_context():
+        return appmod.import_documents(
+            collection_name, appmod.read_import_rows(stream, file_format))
+
+
+@pytest.mark.parametrize("row, error", [
+    (dict(RECIPE, steps=None), "'steps' is missing"),
+    (dict(RECIPE, _id="not-an-id"), "'_id' is not a valid id"),
+    (dict(RECIPE, name=42), "'name' must be text"),
+    (dict(RECIPE, ingridients=[1, 2]), "'ingridients' must be a list"),
+    (dict(RECIPE, category="fish"), "there is no 'fish' category"),
+    (dict(RECIPE, created_by=None), "'created_by' is missing"),
+])
+def test_make_import_operation_rejects(appmod, row, error):
+    with pytest.raises(ValueError, match=error):
+        appmod.make_import_operation(
+            "recipes", json.dumps(row), {"beef", "pork"})
+
+
+@pytest.mark.parametrize("line", ["[1, 2]", '"brisket"', "{not json"])
+def test_make_import_operation_rejects_lines(appmod, line):
+    with pytest.raises(ValueError):
+        appmod.make_import_operation("recipes", line, {"beef"})
+
+
+def test_import_skips_malformed_rows(appmod, categories):
+    lines = [
+        json.dumps(RECIPE),
+        "{not json",
+        json.dumps(dict(RECIPE, category="fish")),
+        "",
+        json.dumps(dict(RECIPE, name="Pulled Pork", category="pork")),
+        json.dumps(dict(RECIPE, _id=str(ObjectId()), steps="")),
+    ]
+
+    result = import_lines(appmod, "recipes", lines)
+
+    assert result["inserted"] == 2
+    assert result["updated"] == 0
+    assert result["failed"] == 3
+    assert [error["line"] for error in result["errors"]] == [2, 3, 6]
+    assert "no 'fish' category" in result["errors"][1]["error"]
+    assert "'steps' is missing" in result["errors"][2]["error"]
+    assert sorted(
+        recipe["name"] for recipe in categories.recipes.find()) == [
+        "pulled pork", "texas brisket"]
+
+
+def test_import_updates_by_id(appmod, categories):
+    recipe_id = categories.recipes.insert_one(
+        dict(RECIPE, name="old name", version=1)).inserted_id
+
+    result = import_lines(appmod, "recipes", [
+        json.dumps(dict(RECIPE, _id=str(recipe_id), name="New Name"))])
+
+    assert (result["inserted"], result["updated"], result["failed"]) == (
+        0, 1, 0)
+    recipe = categories.recipes.find_one({"_id": recipe_id})
+    assert recipe["name"] == "new name"
+    assert recipe["version"] == 2
+
+
+def test_csv_import_skips_malformed_rows(appmod, categories):
+    lines = [
+        "name,category,description,image_url,purchase",
+        "Rub,rubs,a rub,,",
+        ",rubs,no name,,",
+        "Grill,grills,no such category,,",
+    ]
+
+    result = import_lines(appmod, "products", lines, "csv")
+
+    assert (result["inserted"], result["failed"]) == (1, 2)
+    assert [error["line"] for error in result["errors"]] == [3, 4]
+    assert categories.products.count_documents({}) == 1
@@ -0,0 +1,107 @@
+"""test_pagination: \n
+* Tests the signed cursors the recipe and product pages are paged
+    through with (see paginate). \n
+"""
+from urllib.parse import parse_qs
+
+import pytest
+from flask import get_flashed_messages
+
+LIMIT = 9
+
+
+def read_page(appmod, db, query, query_string=""):
+    """read_page: \n
+    * This function reads a page of recipes as the recipes view does. \n
+    \n
+    \n Args: \n
+    * appmod (module): The app module. \n
+    * db (Database): The database. \n
+    * query (dict): The filter, e.g. {'category': 'beef'}. \n
+    * query_string (str): The page's query string, e.g. a 'next' link. \n
+    \n
+    \n Returns: \n
+    * It returns the pagination dict, with the ids of its 'items'. \n
+    """
+    with appmod.app.test_request_context("/recipes" + query_string):
+        pagination = appmod.paginate(
+            db.recipes, query, LIMIT, dict(query),
+            appmod.RECIPE_LIST_FIELDS)
+        pagination["ids"] = [item["_id"] for item in pagination["items"]]
+        pagination["flashes"] = get_flashed_messages()
+    return pagination
+
+
+def get_cursor(query_string):
+    """get_cursor: \n
+    * This function reads the cursor from a 'next' or 'prev' link. \n
+    \n
+    \n Args: \n
+    * query_string (str): The link, beginning with '?'. \n
+    \n
+    \n Returns: \n
+    * It returns the cursor. \n
+    """
+    return parse_qs(query_string[1:])["cursor"][0]
+
+
+@pytest.mark.parametrize("query", [{}, {"category": "beef"}])
+def test_forward_and_back(appmod, seeded, query):
+    expected = [
+        recipe["_id"] for recipe in seeded.recipes.find(
+            query, {"_id": 1}).sort("_id", -1)]
+    assert len(expected) > LIMIT
+
+    pages = [read_page(appmod, seeded, query)]
+    while pages[-1]["next"]:
+        pages.append(read_page(appmod, seeded, query, pages[-1]["next"]))
+
+    assert [page["page"] for page in pages] == list(range(1, len(pages) + 1))
+    assert [item for page in pages for item in page["ids"]] == expected
+    assert pages[0]["prev"] is None
+
+    page = pages[-1]
+    for previous in reversed(pages[:-1]):
+        page = read_page(appmod, seeded, query, page["prev"])
+        assert page["ids"] == previous["ids"]
+        assert page["page"] == previous["page"]
+    assert page["prev"] is None
+
+
+def test_tampered_cursor_is_rejected(appmod, seeded):
+    cursor = get_cursor(read_page(appmod, seeded, {})["next"])
+    payload, signature = cursor.rsplit(".", 1)
+    tampered = payload + "." + signature[::-1]
+
+    page = read_page(appmod, seeded, {}, "?cursor=" + tampered)
+    assert page["page"] == 1
+    assert page["ids"] == read_page(appmod, seeded, {})["ids"]
+    assert page["flashes"] == ["Page out of range"]
+
+
+def test_cursor_signed_with_another_key_is_rejected(appmod, seeded):
+    from itsdangerous import URLSafeSerializer
+
+    boundary = seeded.recipes.find_one()["_id"]
+    cursor = URLSafeSerializer("not the key", salt="pagination-cursor").dumps(
+        {"d": "next", "id": str(boundary), "p": 4,
+         "f": appmod.query_fingerprint({})})
+
+    page = read_page(appmod, seeded, {}, "?cursor=" + cursor)
+    assert page["page"] == 1
+    assert page["flashes"] == ["Page out of range"]
+
+
+def test_cursor_for_another_filter_is_rejected(appmod, seeded):
+    beef = read_page(appmod, seeded, {"category": "beef"})
+
+    page = read_page(
+        appmod, seeded, {"category": "pork"},
+        "?cursor=" + get_cursor(beef["next"]))
+    assert page["page"] == 1
+    assert page["flashes"] == ["Page out of range"]
+
+
+def test_recipes_view_ignores_tampered_cursor(seeded, client):
+    response = client.get("/recipes?cursor=not-a-cursor")
+    assert response.status_code == 200
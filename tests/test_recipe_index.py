@@ -0,0 +1,113 @@
+"""test_recipe_index: \n
+* Tests that the in process recipe indexes find the same recipes as
+    reading every recipe from MongoDB would. \n
+"""
+import pytest
+
+SEARCHES = ["salt", "brisket, paprika", "Ribs, honey, cumin", "saffron"]
+
+
+def rank_from_database(appmod, db, text):
+    """rank_from_database: \n
+    * This function ranks recipes by the ingridients they use, as
+        rank_ingredient_matches does, by reading every recipe from the
+        database instead of using the indexes. \n
+    \n
+    \n Args: \n
+    * appmod (module): The app module. \n
+    * db (Database): The database. \n
+    * text (str): The ingridients entered, e.g. 'brisket, paprika'. \n
+    \n
+    \n Returns: \n
+    * It returns the list of (recipe id, number of matches) pairs, most
+        matches first, then newest first. \n
+    """
+    words = appmod.ingredient_words(text.split(","))
+    ranked = []
+    for recipe in db.recipes.find({}, {"ingridients": 1}):
+        ingridients = appmod.get_recipe_lists(recipe)["ingridients"]
+        matches = len(words & appmod.ingredient_words(ingridients))
+        if matches:
+            ranked.append((recipe["_id"], matches))
+    ranked.sort(key=lambda pair: (pair[1], pair[0]), reverse=True)
+    return ranked
+
+
+def rank_from_index(appmod, text, limit=1000, page=1):
+    """rank_from_index: \n
+    * This function ranks recipes by the ingridients they use with the
+        indexes (see rank_ingredient_matches). \n
+    \n
+    \n Args: \n
+    * appmod (module): The app module. \n
+    * text (str): The ingridients entered. \n
+    * limit (int): The number of recipes per page. \n
+    * page (int): The page to read. \n
+    \n
+    \n Returns: \n
+    * It returns the ranking dict. \n
+    """
+    with appmod.app.test_request_context("/recipes?page={}".format(page)):
+        return appmod.rank_ingredient_matches(text, limit)
+
+
+@pytest.mark.parametrize("legacy", [False, True])
+@pytest.mark.parametrize("text", SEARCHES)
+def test_ingredient_ranking_matches_database(appmod, seed, legacy, text):
+    db = seed(legacy=legacy)
+    expected = rank_from_database(appmod, db, text)
+
+    ranking = rank_from_index(appmod, text)
+    assert ranking["ranked"] == expected
+    assert ranking["total"] == len(expected)
+
+
+def test_ingredient_ranking_pages(appmod, seeded):
+    expected = rank_from_database(appmod, seeded, "salt, paprika")
+    assert len(expected) > 10
+
+    pages = [
+        rank_from_index(appmod, "salt, paprika", limit=4, page=page)
+        for page in range(1, 4)]
+    assert [page["page"] for page in pages] == [1, 2, 3]
+    assert [pair for page in pages for pair in page["ranked"]] == \
+        expected[:12]
+
+
+def test_index_follows_changed_recipes(appmod, seeded):
+    recipes = list(seeded.recipes.find().sort("_id", 1).limit(2))
+    changed, deleted = recipes
+    seeded.recipes.update_one({"_id": changed["_id"]}, {"$set": {
+        "ingridients": [{"name": "saffron", "quantity": "1 pinch"}]}})
+    seeded.recipes.delete_one({"_id": deleted["_id"]})
+    with appmod.recipe_index_lock:
+        appmod.update_recipe_index(
+            appmod.recipe_index, changed["_id"],
+            seeded.recipes.find_one({"_id": changed["_id"]}))
+        appmod.update_recipe_index(
+            appmod.recipe_index, deleted["_id"], None)
+
+    for text in SEARCHES:
+        assert rank_from_index(appmod, text)["ranked"] == \
+            rank_from_database(appmod, seeded, text)
+    assert rank_from_index(appmod, "saffron")["ranked"] == [
+        (changed["_id"], 1)]
+
+
+@pytest.mark.parametrize("search, finds", [
+    ("smoked brsiket", True), ("texas rbis", True),
+    ("honey glazed pork bely", True), ("zzz", False)])
+def test_fuzzy_search_matches_database(appmod, seeded, search, finds):
+    trigrams = appmod.name_trigrams(search)
+    similar = []
+    for recipe in seeded.recipes.find({}, {"name": 1}):
+        names = appmod.name_trigrams(recipe["name"])
+        similarity = 2.0 * len(trigrams & names) / (
+            len(trigrams) + len(names))
+        if similarity >= appmod.FUZZY_MIN_SIMILARITY:
+            similar.append((similarity, recipe["_id"]))
+    similar.sort(reverse=True)
+    assert bool(similar) == finds
+
+    assert appmod.fuzzy_search_names(search) == [
+        recipe_id for similarity, recipe_id in similar]
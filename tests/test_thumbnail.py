@@ -0,0 +1,90 @@
+"""test_thumbnail: \n
+* Tests that the thumbnail view never fetches images from the app's
+    own machine or network, redirecting to the default image instead
+    (see resolve_public_url). \n
+"""
+import pytest
+
+UNSAFE_URLS = [
+    "file:///etc/passwd",
+    "ftp://example.com/image.jpg",
+    "http://127.0.0.1/image.jpg",
+    "http://localhost:5000/image.jpg",
+    "http://[::1]/image.jpg",
+    "http://10.0.0.1/image.jpg",
+    "http://192.168.1.1/image.jpg",
+    "http://169.254.169.254/latest/meta-data/",
+    "https://0.0.0.0/image.jpg",
+]
+
+
+@pytest.fixture
+def connections(appmod, monkeypatch):
+    """connections: \n
+    * This fixture records the hosts the thumbnail fetches connect to,
+        without connecting. \n
+    \n
+    \n Returns: \n
+    * It returns the list of (host, address) tuples connected to. \n
+    """
+    connected = []
+
+    def connect(self):
+        connected.append((self.host, self.address))
+        raise OSError("not connecting in the tests")
+
+    monkeypatch.setattr(appmod.PinnedHTTPConnection, "connect", connect)
+    monkeypatch.setattr(appmod.PinnedHTTPSConnection, "connect", connect)
+    return connected
+
+
+@pytest.mark.parametrize("image_url", UNSAFE_URLS)
+def test_unsafe_recipe_image_redirects(
+        appmod, db, client, connections, image_url):
+    recipe_id = db.recipes.insert_one(
+        {"name": "brisket", "image_url": image_url}).inserted_id
+
+    response = client.get("/img/{}/480".format(recipe_id))
+
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith(
+        "/static/media/images/default.jpg")
+    assert connections == []
+
+
+@pytest.mark.parametrize("image_url", UNSAFE_URLS)
+def test_resolve_public_url_refuses(appmod, image_url):
+    assert appmod.resolve_public_url(image_url) is None
+
+
+def test_unsafe_product_image_redirects(appmod, db, client, connections):
+    product_id = db.products.insert_one(
+        {"name": "rub", "image_url": "http://127.0.0.1/rub.jpg"}).inserted_id
+
+    response = client.get("/img/{}/960".format(product_id))
+
+    assert response.status_code == 302
+    assert response.headers["Location"].endswith(
+        "/static/media/images/default_product.jpg")
+    assert connections == []
+
+
+def test_public_url_is_fetched(appmod, db, client, connections, monkeypatch):
+    address = (None, None, None, "", ("93.184.216.34", 80))
+    monkeypatch.setattr(
+        appmod.socket, "getaddrinfo", lambda *args, **kwargs: [address])
+    recipe_id = db.recipes.insert_one(
+        {"name": "brisket",
+         "image_url": "http://images.example.com/brisket.jpg"}).inserted_id
+
+    response = client.get("/img/{}/480".format(recipe_id))
+
+    assert response.status_code == 302
+    assert connections == [("images.example.com", "93.184.216.34")]
+
+
+@pytest.mark.parametrize("path", ["/img/{}/100", "/img/not-an-id/480"])
+def test_unknown_thumbnails_are_not_found(appmod, db, client, path):
+    recipe_id = db.recipes.insert_one({"name": "brisket"}).inserted_id
+
+    assert client.get(path.format(recipe_id)).status_code == 404